@@ -38,6 +38,8 @@ Global parameters
 .. autodata:: pymedtermino.REMOVE_SUPPRESSED_CONCEPTS 
 .. autodata:: pymedtermino.REMOVE_SUPPRESSED_TERMS 
 .. autodata:: pymedtermino.REMOVE_SUPPRESSED_RELATIONS 
+.. autodata:: pymedtermino.CACHE_SIZE
+.. autodata:: pymedtermino.CACHE_MEMORY
 
 
 General functions
@@ -62,17 +64,26 @@ classes that are used as base classes for the various terminologies.
 .. autoclass:: Mapping
    :members:
 
+See :mod:`pymedtermino.aio` for the asynchronous versions of the methods, for asyncio.
+
 
 Utility classes
 ---------------
 
 .. autoclass:: Concepts
    :members:
+
+.. autoclass:: ConceptCache
+   :members:
+
+.. autoclass:: SearchHit
+
+.. autofunction:: cache_stats
 """
 
-import sys, os, os.path, atexit, operator, weakref, sqlite3 as sql_module
+import sys, os, os.path, atexit, operator, math, weakref, threading, sqlite3 as sql_module
 from functools   import reduce
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 
 if sys.version[0] != "2": unicode = str
 
@@ -96,10 +107,14 @@ REMOVE_SUPPRESSED_CONCEPTS    = _get_bool_env("REMOVE_SUPPRESSED_CONCEPTS", True
 REMOVE_SUPPRESSED_TERMS       = _get_bool_env("REMOVE_SUPPRESSED_TERMS", True) #: if True, terms (=translations) tagged as suppressed or depreciated in terminologies are skipped.
 REMOVE_SUPPRESSED_RELATIONS   = _get_bool_env("REMOVE_SUPPRESSED_RELATIONS", True) #: if True, relations tagged as suppressed or depreciated in terminologies are skipped.
 READ_ONLY_DATABASE            = _get_bool_env("READ_ONLY_DATABASE", True)
+CACHE_SIZE                    = int(_get_env("CACHE_SIZE", 500)) #: the maximum number of concepts kept in each terminology's cache (0 for no limit). Default : 500.
+CACHE_MEMORY                  = int(_get_env("CACHE_MEMORY", 0)) #: the approximate maximum memory (in bytes) used by the concepts in each terminology's cache (0 for no limit). Default : 0.
+SQL_CHUNK_SIZE                = 500 # Maximum number of parameters in "IN (...)" queries; must stay below SQLite's limit (999 in older versions).
 
 TERMINOLOGIES                 = {}
 MISSING_CONCEPTS              = set()
 SHOW_MISSING_CONCEPTS_AT_EXIT = True
+_REGISTER_LOCK                = threading.Lock()
 
 def print_missing_concepts():
   if SHOW_MISSING_CONCEPTS_AT_EXIT and MISSING_CONCEPTS:
@@ -126,21 +141,39 @@ class Terminology(object):
 
    Returns the root concepts in the terminology (=concepts without parents).
 
-.. method:: search(text)
+.. method:: search(text, limit = None, offset = 0, rank = False, active_only = None, semantic_tag = None)
 
    Searches for concepts whose terms match the given text (free-text search).
    
+   The options are those of :meth:`search_hits`, except that rank defaults to False (results in index order, as in previous versions).
+   
    :returns: a list of concept.
    
+.. method:: search_hits(text, limit = None, offset = 0, rank = True, active_only = None, semantic_tag = None)
+
+   Searches for concepts whose terms match the given text (full-text search, available for SNOMED CT, ICD10 and MedDRA),
+   and returns an iterator over the matching concepts, as :class:`SearchHit`. Each concept is yielded once, with its best matching term.
+   Hits are read from the database lazily, and concepts are loaded only when the hits' concept attribute is used.
+   
+   :param limit: the maximum number of hits (None for no limit).
+   :param offset: the number of hits to skip, e.g. for paginating results.
+   :param rank: if True, hits are sorted by decreasing relevance (BM25). Ranking requires FTS5 full-text indexes;
+      for databases built by older versions of PyMedTermino, hits are not ranked, unless scripts/migrate_fts5.py is used.
+   :param active_only: if True, only active concepts are searched. Defaults to :data:`REMOVE_SUPPRESSED_CONCEPTS`.
+   :param semantic_tag: if given, only concepts with this semantic tag are searched
+      (SNOMED CT semantic tag, e.g. "disorder", or MedDRA level, e.g. "PT").
+   
 
 """
   _use_weakref = 1
+  snapshot     = None # The pymedtermino.snapshot.Snapshot used by the terminology, if any
   def __init__(self, name):
     self.name = name
     if self._use_weakref:
       self.dict = weakref.WeakValueDictionary()
     else:
       self.dict = {}
+    self.concept_cache = ConceptCache(CACHE_SIZE, CACHE_MEMORY)
     self.Concept = self._create_Concept()
     self.Concept.terminology = self
     self.canonize_code = self.Concept.canonize_code
@@ -180,10 +213,12 @@ class Terminology(object):
     """Retuns the concept of the given code, or None if no such concept."""
     code = self.canonize_code(code)
     concept = self.dict.get(code)
-    if not concept:
-      try:                            concept = self.Concept(code)
-      except (ValueError, TypeError): return None
-    return concept
+    if concept:
+      self.concept_cache.touch(concept)
+      return concept
+    try:                            concept = self.Concept(code)
+    except (ValueError, TypeError): return None
+    return self._registered(concept)
   
   def has_concept(self, code):
     """Retuns True if the terminology has a concept of the given code."""
@@ -196,7 +231,9 @@ class Terminology(object):
 Also available as Terminology[code] (i.e. Terminology.__getitem__)."""
     code = self.canonize_code(code)
     concept = self.dict.get(code)
-    if concept: return concept
+    if concept:
+      self.concept_cache.touch(concept)
+      return concept
       #if self._use_weakref:
       #  concept = concept()
       #  if concept: return concept
@@ -206,18 +243,384 @@ Also available as Terminology[code] (i.e. Terminology.__getitem__)."""
     except ValueError:
       MISSING_CONCEPTS.add("%s:%s" % (self.name, code))
       raise ValueError(u"Missing concept %s:%s !" % (self.name, code))
-    return concept
+    return self._registered(concept)
   __getitem__ = concept
   __call__    = concept
   
+  def get_many(self, codes):
+    """Returns a dict mapping the given codes (canonized) to their concepts. Codes that do not correspond to a concept are absent from the dict.
+
+Concepts that are not already loaded are loaded together, with as few SQL queries as possible (instead of one or two queries per concept)."""
+    r       = {}
+    missing = []
+    for code in codes:
+      try: code = self.canonize_code(code)
+      except (ValueError, TypeError): continue
+      if code in r: continue
+      concept = self.dict.get(code)
+      if concept:
+        self.concept_cache.touch(concept)
+        r[code] = concept
+      else:
+        r[code] = None
+        missing.append(code)
+    if missing:
+      for code, concept in self._load_many(missing).items(): r[code] = self._registered(concept)
+    return dict((code, concept) for (code, concept) in r.items() if concept)
+  
+  def concepts_for(self, codes):
+    """Returns the set (:class:`Concepts`) of the concepts of the given codes, loaded with :meth:`get_many`.
+Raises ValueError, listing all the missing codes at once, if some codes do not correspond to a concept."""
+    codes    = list(codes)
+    concepts = self.get_many(codes)
+    missing  = []
+    for code in codes:
+      try: code = self.canonize_code(code)
+      except (ValueError, TypeError): pass
+      if not code in concepts: missing.append(code)
+    if missing:
+      for code in missing: MISSING_CONCEPTS.add("%s:%s" % (self.name, code))
+      raise ValueError(u"Missing concepts %s !" % u", ".join(u"%s:%s" % (self.name, code) for code in missing))
+    return Concepts(concepts.values())
+  
+  def aget(self, code):
+    """Asynchronous version of :meth:`get`, for asyncio (Python 3 only); returns an awaitable. See :mod:`pymedtermino.aio`."""
+    import pymedtermino.aio
+    return pymedtermino.aio.aget(self, code)
+  
+  def aget_many(self, codes):
+    """Asynchronous version of :meth:`get_many`, for asyncio (Python 3 only); returns an awaitable. See :mod:`pymedtermino.aio`."""
+    import pymedtermino.aio
+    return pymedtermino.aio.aget_many(self, codes)
+  
+  def asearch(self, text, **kargs):
+    """Asynchronous version of search(), for asyncio (Python 3 only); returns an awaitable. See :mod:`pymedtermino.aio`."""
+    import pymedtermino.aio
+    return pymedtermino.aio.asearch(self, text, **kargs)
+  
+  def _hits_concepts(self, hits):
+    # Returns the list of the concepts of the given search hits, loaded together.
+    hits     = list(hits)
+    concepts = self.get_many([hit.code for hit in hits])
+    return [concepts[hit.code] for hit in hits if hit.code in concepts]
+  
+  def _ancestor_codes(self, concepts):
+    # Returns a dict mapping each of the given concepts to the set of the codes of its ancestors (excluding itself), see _ancestor_codes().
+    # Parents are loaded level by level, with set-at-a-time queries.
+    level   = Concepts(concepts)
+    already = set(level)
+    while level:
+      level.prefetch("parents")
+      level = Concepts(parent for concept in level for parent in concept.parents if not parent in already)
+      already.update(level)
+    return dict((concept, set(ancestor.code for ancestor in concept.ancestors_no_double())) for concept in concepts)
+  
+  def _registered(self, concept):
+    # Returns the concept registered for concept.code; it may differ from concept if another thread has loaded it concurrently.
+    return self.dict.get(concept.code) or concept
+  
+  def use_snapshot(self, snapshot):
+    """Uses the given snapshot (a :class:`pymedtermino.snapshot.Snapshot` or a snapshot filename) for the parents and children attributes,
+the relation attributes available in the snapshot and is_a(), instead of the database (see :mod:`pymedtermino.snapshot`). Use None for no longer using a snapshot.
+Raises ValueError if the snapshot has been exported from another terminology, or with different settings."""
+    if snapshot is None:
+      self.snapshot = None
+      return
+    import pymedtermino.snapshot
+    if not isinstance(snapshot, pymedtermino.snapshot.Snapshot): snapshot = pymedtermino.snapshot.load(snapshot)
+    if snapshot.terminology_name != self.name: raise ValueError("Snapshot %s has been exported from terminology %s, not %s!" % (snapshot.filename, snapshot.terminology_name, self.name))
+    if snapshot.settings != self._snapshot_settings(): raise ValueError("Snapshot %s has been exported with different settings (%s)!" % (snapshot.filename, snapshot.settings))
+    self.snapshot = snapshot
+    
+  def _snapshot_settings(self):
+    # Returns the settings that change the relations loaded, and thus must be the same when exporting and using a snapshot.
+    return { "REMOVE_SUPPRESSED_CONCEPTS" : int(bool(REMOVE_SUPPRESSED_CONCEPTS)), "REMOVE_SUPPRESSED_RELATIONS" : int(bool(REMOVE_SUPPRESSED_RELATIONS)) }
+  
+  def _all_codes(self):
+    # Returns the codes of all concepts, e.g. for exporting snapshots. Terminologies should override it with a single SQL query.
+    return [concept.code for concept in self.all_concepts_no_double()]
+  
+  def _from_snapshot(self, concept, attr):
+    # Sets attr from the snapshot, if it is available there for the given concept, and returns True if done.
+    codes = self.snapshot.related_codes(concept.code, attr)
+    if codes is None: return False
+    related = self.get_many(codes)
+    for code in codes:
+      if not code in related: return False
+    setattr(concept, attr, [related[code] for code in codes])
+    return True
+  
+  def _prefetch(self, concepts, attr):
+    # Loads attr for all the given concepts (which have not loaded it yet); see Concepts.prefetch().
+    # Terminologies should override it with set-at-a-time queries; this default implementation loads attr concept by concept.
+    for concept in concepts: getattr(concept, attr, None)
+    
+  def _set_prefetched(self, concepts, attr, code_2_codes):
+    # Sets attr to the list of the concepts whose codes are given in the code_2_codes dict, for each concept.
+    # Concepts for which some codes are missing are left untouched, so as __getattr__ will raise the error as usual.
+    related = self.get_many(set(code for codes in code_2_codes.values() for code in codes))
+    for concept in concepts:
+      codes = code_2_codes.get(concept.code, [])
+      for code in codes:
+        if not code in related: break
+      else:
+        setattr(concept, attr, [related[code] for code in codes])
+        
+  def _refset_members(self, concepts, refset):
+    # Returns the given concepts that are members of refset; see Concepts.filter_refset().
+    # Terminologies with reference sets (SNOMED CT) override it; in other terminologies, concepts are never members of a refset.
+    return []
+  
+  def _load_many(self, codes):
+    # Loads the concepts of the given canonized codes, which are not loaded yet, and returns a dict mapping codes to concepts.
+    # Terminologies should override it with chunked "IN (...)" queries; this default implementation loads concepts one by one.
+    r = {}
+    for code in codes:
+      try:                            r[code] = self.Concept(code)
+      except (ValueError, TypeError): pass
+    return r
+  
+
+class ConceptCache(object):
+  """A size-bounded cache of concepts, evicting the least recently used ones first.
+
+Each terminology has its own cache, in its concept_cache attribute. A concept stays in memory while it is in the cache
+(or referenced elsewhere), and it keeps its lazily loaded attributes (parents, children, relations,...).
+The cache can be replaced by any object with the same touch(), add() and stats() methods. It can be used from several threads.
+
+:param capacity: the maximum number of concepts in the cache (0 for no limit).
+:param max_memory: the approximate maximum memory used by the concepts in the cache, in bytes (0 for no limit).
+   The memory used by a concept is estimated with sys.getsizeof() on the concept and its attributes, when the concept is added to the cache.
+"""
+  def __init__(self, capacity = 500, max_memory = 0):
+    self.capacity   = capacity
+    self.max_memory = max_memory
+    self.memory     = 0
+    self.hits       = 0
+    self.misses     = 0
+    self.evictions  = 0
+    self._entries   = OrderedDict() # code => (concept, estimated size), from least to most recently used
+    self._lock      = threading.RLock()
+    
+  def __len__(self): return len(self._entries)
+  
+  def __contains__(self, concept): return concept.code in self._entries
+  
+  def touch(self, concept):
+    """Records a cache hit on the given concept, and marks it as the most recently used."""
+    with self._lock:
+      self.hits += 1
+      entry = self._entries.pop(concept.code, None)
+      if entry and (entry[0] is concept): # Keeps the size estimated when the concept was added
+        self._entries[concept.code] = entry
+        return
+      if entry: self.memory -= entry[1]
+      self._store(concept)
+    
+  def add(self, concept):
+    """Records a cache miss, and adds the given (newly created) concept to the cache."""
+    with self._lock:
+      self.misses += 1
+      entry = self._entries.pop(concept.code, None)
+      if entry: self.memory -= entry[1]
+      self._store(concept)
+    
+  def _store(self, concept):
+    if self.max_memory: size = self.sizeof(concept)
+    else:               size = 0
+    self._entries[concept.code] = (concept, size)
+    self.memory += size
+    self._evict()
+    
+  def _evict(self):
+    while (self.capacity and (len(self._entries) > self.capacity)) or (self.max_memory and (self.memory > self.max_memory) and (len(self._entries) > 1)):
+      code, (concept, size) = self._entries.popitem(last = False)
+      self.memory    -= size
+      self.evictions += 1
+      
+  def resize(self, capacity, max_memory = 0):
+    """Changes the capacity and the memory limit of the cache, evicting concepts if needed."""
+    with self._lock:
+      self.capacity   = capacity
+      self.max_memory = max_memory
+      self.memory     = 0
+      for code, (concept, size) in list(self._entries.items()):
+        if max_memory: size = self.sizeof(concept)
+        else:          size = 0
+        self._entries[code] = (concept, size)
+        self.memory += size
+      self._evict()
+    
+  def clear(self):
+    """Removes all concepts from the cache (statistics are kept)."""
+    with self._lock:
+      self._entries.clear()
+      self.memory = 0
+    
+  def stats(self):
+    """Returns a dict with the cache statistics: size, capacity, memory, max_memory, hits, misses and evictions."""
+    with self._lock:
+      return { "size" : len(self._entries), "capacity" : self.capacity, "memory" : self.memory, "max_memory" : self.max_memory,
+               "hits" : self.hits, "misses" : self.misses, "evictions" : self.evictions }
+  
+  @staticmethod
+  def sizeof(concept):
+    size = sys.getsizeof(concept)
+    if hasattr(concept, "__dict__"):
+      size += sys.getsizeof(concept.__dict__)
+      for value in concept.__dict__.values(): size += sys.getsizeof(value)
+    return size
+  
+def _chunks(l, size = None):
+  """Splits the list l into chunks, e.g. for building "IN (...)" SQL queries."""
+  l    = list(l)
+  size = size or SQL_CHUNK_SIZE
+  for i in range(0, len(l), size): yield l[i : i + size]
+  
+def _sql_params(nb, param = "?"):
+  """Returns the placeholders for nb parameters in a "IN (...)" SQL query."""
+  return ", ".join([param] * nb)
+  
+def _ancestor_codes(concepts):
+  """Returns a dict mapping each of the given concepts to the set of the codes of its ancestors, computed with as few queries as possible.
+Concepts with a specific is_a() (e.g. VCM icons) are not included in the dict."""
+  terminology_2_concepts = defaultdict(list)
+  for concept in concepts:
+    if concept._is_a_by_ancestors: terminology_2_concepts[concept.terminology].append(concept)
+  r = {}
+  for terminology, concepts in terminology_2_concepts.items(): r.update(terminology._ancestor_codes(concepts))
+  return r
+
+def _information_content(descendant_count, nb_concepts):
+  """Returns the intrinsic information content of Seco et al. (2004), 1 - log(descendant_count + 1) / log(nb_concepts)
+(the same formula is used at import time, see pymedtermino.utils.closure.build_hierarchy_stats)."""
+  if nb_concepts <= 1: return 1.0
+  return max(0.0, 1.0 - math.log(descendant_count + 1) / math.log(nb_concepts))
+
+def _hierarchy_stats(concept, nb_concepts, is_active = None):
+  # Computes (depth, descendant_count, information_content) by walking the hierarchy, for databases built by older versions of PyMedTermino.
+  # Only the descendants for which is_active(descendant) is true are counted.
+  depth = 0
+  for ancestor, depth in concept.iter_breadth_first("parents", include_self = True, dedupe = True, yield_depth = True):
+    if not ancestor.parents: break
+  descendant_count = len([descendant for descendant in set(concept.descendants_no_double()) if (is_active is None) or is_active(descendant)])
+  return depth, descendant_count, _information_content(descendant_count, nb_concepts)
+
+def _concepts_by_key(concepts):
+  # Indexes the given concepts by (terminology, code); concepts with a specific is_a() are never ancestors of the other concepts.
+  r = defaultdict(list)
+  for concept in concepts:
+    if concept._is_a_by_ancestors: r[concept.terminology, concept.code].append(concept)
+  return r
+
+def _remove_by_key(by_key, concept):
+  l = by_key.get((concept.terminology, concept.code))
+  if l:
+    for i in range(len(l)):
+      if l[i] is concept:
+        del l[i]
+        break
+        
+def _fetch_grouped(db_cursor, sql, codes, args = (), distinct = 1, param = "?"):
+  """Executes sql, which includes an "IN (%s)" clause, by chunks of codes (args being the additional parameters, after the codes).
+Returns a dict mapping the first column of each row to the list of the remaining column(s), in the order of the rows."""
+  r    = defaultdict(list)
+  seen = set()
+  for chunk in _chunks(codes):
+    db_cursor.execute(sql % _sql_params(len(chunk), param), list(chunk) + list(args))
+    for row in db_cursor.fetchall():
+      if distinct:
+        if row in seen: continue
+        seen.add(row)
+      if len(row) == 2: r[row[0]].append(row[1])
+      else:             r[row[0]].append(row[1:])
+  return r
+  
+def _is_fts5(db_cursor, fts_table):
+  db_cursor.execute("SELECT sql FROM sqlite_master WHERE name=?", (fts_table,))
+  row = db_cursor.fetchone()
+  return bool(row) and ("fts5" in row[0].lower())
+
+def _fts5_quote(text):
+  # FTS5 query syntax rejects some characters in bare words (e.g. "-" or "."); quote each word, keeping prefix queries ("word*").
+  # Used for retrying the queries that FTS5 cannot parse.
+  words = []
+  for word in text.split():
+    if word.endswith("*"): words.append(u'"%s"*' % word[:-1].replace('"', '""'))
+    else:                  words.append(u'"%s"'  % word     .replace('"', '""'))
+  return u" ".join(words)
+
+def _search_sql(hits_sql, rank):
+  # hits_sql returns (code, term, score, position) rows, one per matching term; keeps one row per concept, with the best matching term.
+  # "LIMIT -1" prevents SQLite from flattening the subquery, because FTS5's bm25() cannot be used inside an aggregate function.
+  if rank: return "SELECT code, term, MAX(score) AS score FROM (%s LIMIT -1) GROUP BY code ORDER BY score DESC, code" % hits_sql
+  else:    return "SELECT code, term, NULL FROM (%s LIMIT -1) GROUP BY code ORDER BY MIN(position)" % hits_sql
+
+SEARCH_FETCH_SIZE = 100 # Number of rows read at a time by search_hits()
+
+def _search_hits(terminology, db, sql, args, limit = None, offset = 0):
+  # Yields the SearchHit of a full-text query returning (code, term, score) rows; args[0] is the full-text query.
+  # The query is executed on a dedicated cursor, so as the caller can use the terminology (with the thread's shared cursor) while iterating.
+  if limit is None: limit = -1
+  args   = list(args) + [limit, offset]
+  cursor = db.connection().cursor()
+  try:
+    try:
+      cursor.execute(sql + " LIMIT ? OFFSET ?", args)
+    except sql_module.OperationalError:
+      text = args[0]
+      if _fts5_quote(text) == text: raise
+      for i in range(len(args)):
+        if args[i] == text: args[i] = _fts5_quote(text) # The query may be repeated, e.g. once per language
+      cursor.execute(sql + " LIMIT ? OFFSET ?", args)
+    while 1:
+      rows = cursor.fetchmany(SEARCH_FETCH_SIZE)
+      if not rows: break
+      for (code, term, score) in rows: yield SearchHit(terminology, code, term, score)
+  finally:
+    cursor.close()
+    
+class SearchHit(object):
+  """A full-text search hit, as returned by :meth:`Terminology.search_hits`.
+
+.. attribute:: code
+
+   the code of the matching concept
+
+.. attribute:: term
+
+   the term of the concept that matches the query (may be a synonym, a translation or a textual note)
+
+.. attribute:: score
+
+   the relevance of the hit (higher is better), or None if the hits are not ranked
 
-_CACHES = [None] * 500
-_NEXT_CACHE_ID = 0
+.. attribute:: concept
+
+   the matching concept, loaded on demand (None if it cannot be loaded)
+"""
+  __slots__ = ["terminology", "code", "term", "score", "_concept"]
+  def __init__(self, terminology, code, term, score):
+    self.terminology = terminology
+    self.code        = code
+    self.term        = term
+    self.score       = score
+    self._concept    = None
+    
+  def __repr__(self): return "<SearchHit %s:%s %r (%s)>" % (self.terminology.name, self.code, self.term, self.score)
+  
+  def _get_concept(self):
+    if self._concept is None: self._concept = self.terminology.get(self.code)
+    return self._concept
+  concept = property(_get_concept)
+  
 def cache(o):
-  global _NEXT_CACHE_ID
-  _CACHES[_NEXT_CACHE_ID] = o
-  _NEXT_CACHE_ID += 1
-  if _NEXT_CACHE_ID >= len(_CACHES): _NEXT_CACHE_ID = 0
+  """Adds the given concept to its terminology's cache."""
+  o.terminology.concept_cache.add(o)
+  
+def cache_stats():
+  """Returns a dict mapping the name of each loaded terminology to the statistics of its concept cache (see :meth:`ConceptCache.stats`)."""
+  return dict((name, terminology.concept_cache.stats()) for (name, terminology) in TERMINOLOGIES.items())
   
 
 class Concept(object):
@@ -248,6 +651,20 @@ class Concept(object):
 
    the list of the available relations for this concept. The available relations depend of the terminology, and is-a relations are not included (use parents and children attributes). Each relation corresponds to an attribute of the concept.
 
+.. attribute:: depth
+
+   the length of the shortest is-a path from a root concept to this concept (0 for root concepts).
+
+.. attribute:: descendant_count
+
+   the number of descendants of this concept (not including inactive concepts, if the terminology has inactive concepts).
+
+.. attribute:: information_content
+
+   the intrinsic information content of this concept (Seco et al., 2004), from 0 (for the root) to 1 (for leaves), e.g. for ranking or semantic similarity.
+
+   .. note:: depth, descendant_count and information_content are available for SNOMED CT, ICD10 and MedDRA, and are precomputed when importing the terminologies.
+
 .. automethod:: full_code
 .. automethod:: get_translation
 .. automethod:: get_translations
@@ -270,14 +687,22 @@ class Concept(object):
 
 .. automethod:: self_and_descendants
 .. automethod:: self_and_descendants_no_double
+
+.. automethod:: iter_depth_first
+.. automethod:: iter_breadth_first
+.. automethod:: aload
 """
+  _is_a_by_ancestors = True # True if is_a() is equivalent to membership in the ancestors; false for concepts with a specific is_a()
+  
   def __init__(self, code, term):
     self.code = code #: the code of the concept
     if not term is None: self.term = term #: the preferred term (i.e. label) of the concept
     #if self.terminology._use_weakref: self.terminology.dict[code] = weakref.ref(self)
     #else:                             self.terminology.dict[code] = self
-    self.terminology.dict[code] = self
-    cache(self)
+    with _REGISTER_LOCK: # If two threads load the same concept, the first one registered wins (see Terminology._registered())
+      registered = self.terminology.dict.get(code) is None
+      if registered: self.terminology.dict[code] = self
+    if registered: cache(self) # Caching the loser would evict the registered concept from the cache, and it could then be garbage-collected
     
   def full_code(self):
     """Returns the 'full code' for this concept, including both terminology name and concept code (for example "icd10:I10")."""
@@ -293,28 +718,90 @@ class Concept(object):
   def is_a(self, concept):
     """Returns True if this concept is a child of the given concept (or if both concepts are the same)."""
     if self is concept: return True
+    r = self._snapshot_is_a(concept)
+    if not r is None: return r
     for parent in self.parents:
       if parent.is_a(concept): return True
     return False
   imply = is_a
   
+  def _snapshot_is_a(self, concept):
+    # Returns is_a() computed from the terminology's snapshot, or None if there is no snapshot or the snapshot cannot tell.
+    snapshot = self.terminology.snapshot
+    if (snapshot is None) or (getattr(concept, "terminology", None) is not self.terminology): return None
+    return snapshot.is_a(self.code, concept.code)
+  
   def copy(self): return self # Immutable
   __copy__ = __deepcopy__ = copy
   
+  def iter_depth_first(self, relation = "children", max_depth = None, include_self = False, dedupe = False, yield_depth = False, already = None):
+    """Returns a generator for iterating over the concepts reachable from this concept through the given relation
+(e.g. "children" or "parents"), in depth-first pre-order. An explicit stack is used instead of recursion.
+
+:param max_depth: if given, concepts further than max_depth steps are not yielded.
+:param include_self: if True, this concept is yielded first (at depth 0).
+:param dedupe: if True, each concept is yielded (and explored) only once.
+:param yield_depth: if True, (concept, depth) pairs are yielded.
+:param already: the set of the concepts already yielded, when dedupe is True (it is updated).
+"""
+    if dedupe and (already is None): already = set()
+    if include_self:
+      if dedupe: already.add(self)
+      if yield_depth: yield self, 0
+      else:           yield self
+    if max_depth == 0: return
+    
+    stack = [iter(getattr(self, relation))]
+    while stack:
+      for concept in stack[-1]:
+        if dedupe:
+          if concept in already: continue
+          already.add(concept)
+        depth = len(stack)
+        if yield_depth: yield concept, depth
+        else:           yield concept
+        if (max_depth is None) or (depth < max_depth): stack.append(iter(getattr(concept, relation)))
+        break
+      else:
+        stack.pop()
+        
+  def iter_breadth_first(self, relation = "children", max_depth = None, include_self = False, dedupe = False, yield_depth = False, already = None):
+    """Returns a generator for iterating over the concepts reachable from this concept through the given relation
+(e.g. "children" or "parents"), level by level. Parameters are the same as for :meth:`iter_depth_first`."""
+    if dedupe and (already is None): already = set()
+    if include_self:
+      if dedupe: already.add(self)
+      if yield_depth: yield self, 0
+      else:           yield self
+      
+    level = [self]
+    depth = 0
+    while level and ((max_depth is None) or (depth < max_depth)):
+      depth += 1
+      next_level = []
+      for parent in level:
+        for concept in getattr(parent, relation):
+          if dedupe:
+            if concept in already: continue
+            already.add(concept)
+          if yield_depth: yield concept, depth
+          else:           yield concept
+          next_level.append(concept)
+      level = next_level
+      
   def ancestors(self):
     """Returns a generator for iterating over all ancestors of this concept."""
-    for parent in self.parents:
-      yield parent
-      for concept in parent.ancestors():
-        yield concept
-        
+    return self.iter_depth_first("parents")
+  
   def descendants(self):
     """Returns a generator for iterating over all descendants of this concept."""
-    for child in self.children:
-      yield child
-      for concept in child.descendants():
-        yield concept
-        
+    return self.iter_depth_first("children")
+  
+  def aload(self, *attrs):
+    """Loads the given attributes (e.g. "children") asynchronously, for asyncio (Python 3 only); returns an awaitable. See :func:`pymedtermino.aio.aload`."""
+    import pymedtermino.aio
+    return pymedtermino.aio.aload(self, *attrs)
+  
   def self_and_ancestors(self):
     """Returns a generator for iterating over all ancestors of this concept, including the concept itself."""
     yield self
@@ -347,32 +834,47 @@ class Concept(object):
     return self.terms # No translation available in default implementation
   
 class MonoaxialConcept(Concept):
+  # Nested interval numbering: for terminologies that store it, interval_start is the concept's rank in a pre-order
+  # traversal of the hierarchy, and interval_end the rank of its last descendant. A concept is then a descendant of
+  # another if its interval_start falls in the interval of the other, and the terminology must provide
+  # _concepts_in_interval(start, end) and _count_concepts_in_interval(start, end).
+  interval_start = None
+  interval_end   = None
+
+  def is_a(self, concept):
+    if self is concept: return True
+    if (not self.interval_start is None) and (getattr(concept, "terminology", None) is self.terminology) and (not concept.interval_start is None):
+      return concept.interval_start <= self.interval_start <= concept.interval_end
+    return Concept.is_a(self, concept)
+  imply = is_a
+
+  def descendants(self):
+    """Returns a generator for iterating over all descendants of this concept."""
+    if self.interval_start is None: return Concept.descendants(self)
+    return iter(self.terminology._concepts_in_interval(self.interval_start + 1, self.interval_end))
+
+  def _get_descendant_count(self):
+    if self.interval_start is None: return len(list(self.descendants()))
+    return self.terminology._count_concepts_in_interval(self.interval_start + 1, self.interval_end)
+  descendant_count = property(_get_descendant_count)
+
   ancestors_no_double   = Concept.ancestors
-  descendants_no_double = Concept.descendants
-  
+  descendants_no_double = descendants
+
 class MultiaxialConcept(Concept):
   def ancestors_no_double(self, already = None):
-    if already is None: already = set()
-    for parent in self.parents:
-      if not parent in already:
-        already.add(parent)
-        yield parent
-        for concept in parent.ancestors_no_double(already):
-          yield concept
-          
+    return self.iter_depth_first("parents", dedupe = True, already = already)
+  
   def descendants_no_double(self, already = None):
-    if already is None: already = set()
-    for child in self.children:
-      if not child in already:
-        already.add(child)
-        yield child
-        for concept in child.descendants_no_double(already):
-          yield concept
-          
+    return self.iter_depth_first("children", dedupe = True, already = already)
+  
 class CycleSafeMultiaxialConcept(MultiaxialConcept):
   def is_a(self, concept, already = None):
     if self is concept: return True
-    if already is None: already = set([self])
+    if already is None:
+      r = self._snapshot_is_a(concept)
+      if not r is None: return r
+      already = set([self])
     for parent in self.parents:
       if not parent in already:
         already.add(parent)
@@ -422,6 +924,30 @@ inherits from Python's :class:`set` the methods for computing intersection, unio
       r.update((terminology >> destination_terminology).map_concepts(concepts))
     return r
   
+  def prefetch(self, *attrs):
+    """Loads the given attributes (e.g. "parents", "children", "terms" or relation names) for all concepts in the set,
+with one set-at-a-time query per attribute and per terminology, instead of one query per concept. Returns the set itself.
+
+For example, Concepts(...).prefetch("parents", "children")."""
+    terminology_2_concepts = defaultdict(list)
+    for concept in self: terminology_2_concepts[concept.terminology].append(concept)
+    for terminology, concepts in terminology_2_concepts.items():
+      for attr in attrs:
+        missings = [concept for concept in concepts if not attr in concept.__dict__]
+        if missings and terminology.snapshot and (attr in terminology.snapshot.attrs):
+          missings = [concept for concept in missings if not terminology._from_snapshot(concept, attr)]
+        if missings: terminology._prefetch(missings, attr)
+    return self
+  
+  def filter_refset(self, refset):
+    """Returns the set (:class:`Concepts`) of the concepts of this set that are members of the given SNOMED CT reference set
+(a :class:`pymedtermino.snomedct.Refset`, or its identifier), with a single query per terminology (see :meth:`pymedtermino.snomedct.SNOMEDCT.refset`)."""
+    terminology_2_concepts = defaultdict(list)
+    for concept in self: terminology_2_concepts[concept.terminology].append(concept)
+    r = Concepts()
+    for terminology, concepts in terminology_2_concepts.items(): r.update(terminology._refset_members(concepts, refset))
+    return r
+  
   def find(self, parent_concept):
     """returns the first concept of the set that is a descendant of parent_concept (including parent_concept itself)."""
     for c in self:
@@ -462,23 +988,48 @@ inherits from Python's :class:`set` the methods for computing intersection, unio
   
   def keep_most_specific(self, more_specific_than = None):
     """keeps only the most specific concepts, i.e. remove all concepts that are more general that another concept in the set."""
-    clone = self.copy()
+    clone      = self.copy()
+    candidates = list(more_specific_than or clone)
+    ancestors  = _ancestor_codes(clone)
+    by_key     = _concepts_by_key(candidates)
     for t1 in clone:
-      for t2 in more_specific_than or clone:
-        if (not t1 is t2) and t1.is_a(t2): # t2 is more generic than t1 => we keep t1
-          self.discard(t2)
-          
+      if t1 in ancestors:
+        for code in ancestors[t1]:
+          for t2 in by_key.get((t1.terminology, code), ()):
+            if not t1 is t2: self.discard(t2) # t2 is more generic than t1 => we keep t1
+      else:
+        for t2 in candidates:
+          if (not t1 is t2) and t1.is_a(t2): # t2 is more generic than t1 => we keep t1
+            self.discard(t2)
+            
   def keep_most_generic(self, more_generic_than = None):
     """keeps only the most general concepts, i.e. remove all concepts that are more specific that another concept in the set."""
-    clone  = self.copy()
-    clone2 = self.copy()
+    clone      = self.copy()
+    clone2     = self.copy()
+    candidates = more_generic_than and list(more_generic_than)
+    ancestors  = _ancestor_codes(clone)
+    by_key     = _concepts_by_key(candidates or clone2)
     for t1 in clone:
-      for t2 in more_generic_than or clone2:
-        if (not t1 is t2) and t1.is_a(t2): # t2 is more generic than t1 => we keep t2
-          self  .discard(t1)
-          clone2.discard(t1)
-          break
-          
+      if t1 in ancestors:
+        more_generic = False
+        for code in ancestors[t1]:
+          for t2 in by_key.get((t1.terminology, code), ()):
+            if not t1 is t2:
+              more_generic = True
+              break
+          if more_generic: break
+      else:
+        for t2 in candidates or clone2:
+          if (not t1 is t2) and t1.is_a(t2):
+            more_generic = True
+            break
+        else: more_generic = False
+      if more_generic: # t2 is more generic than t1 => we keep t2
+        self  .discard(t1)
+        clone2.discard(t1)
+        if not candidates: _remove_by_key(by_key, t1)
+        
+
   def extract(self, parent_concept):
     """returns all concepts of the set that are descendant of parent_concept (including parent_concept itself)."""
     return Concepts([c for c in self if c.is_a(parent_concept)])
@@ -497,10 +1048,13 @@ inherits from Python's :class:`set` the methods for computing intersection, unio
     while modified:
       modified = 0
       clone = self.copy()
+      self.prefetch("parents")
       if only_family_with_more_than_one_child:
+        Concepts([p for i in self for p in i.parents]).prefetch("children")
         parents = set([p for i in self for p in i.parents if len(p.children) > 1])
       else:
         parents = set([p for i in self for p in i.parents])
+        Concepts(parents).prefetch("children")
         
       while parents:
         t = parents.pop()
@@ -514,17 +1068,54 @@ inherits from Python's :class:`set` the methods for computing intersection, unio
           self.add(t)
   
           
+  def _lowest_common_ancestors(self):
+    # Walks upward level by level from all the concepts of the set at once, with a bitmask per reached concept
+    # (bit i is set if the concept is the i-th member of the set or one of its ancestors).
+    # Concepts reached with all the bits set are common ancestors; the walk does not go further above them,
+    # since their own ancestors cannot be the lowest ones.
+    # Returns the set of the lowest common ancestors, and a dict mapping them to the level at which they have been reached.
+    masks  = {}
+    for i, concept in enumerate(self): masks[concept] = masks.get(concept, 0) | (1 << i)
+    full   = (1 << len(self)) - 1
+    levels = {}
+    level  = 0
+    front  = Concepts(self)
+    while front:
+      Concepts(concept for concept in front if masks[concept] != full).prefetch("parents")
+      next_front = Concepts()
+      for concept in front:
+        mask = masks[concept]
+        if mask == full:
+          if not concept in levels: levels[concept] = level
+          continue
+        for parent in concept.parents:
+          parent_mask = masks.get(parent, 0)
+          if parent_mask | mask != parent_mask:
+            masks[parent] = parent_mask | mask
+            next_front.add(parent)
+      front  = next_front
+      level += 1
+      
+    common_ancestors = Concepts(levels)
+    common_ancestors.keep_most_specific()
+    return common_ancestors, levels
+  
   def lowest_common_ancestors(self):
-    """returns the lowest common ancestors between this set of concepts."""
+    """returns the lowest common ancestors between this set of concepts, i.e. the common ancestors (including the concepts themselves)
+that are not ancestors of another common ancestor."""
     if len(self) == 0: return None
     if len(self) == 1: return Concepts(self)
-    
-    ancestors = [set(concept.self_and_ancestors_no_double()) for concept in self]
-    common_ancestors = Concepts(reduce(operator.and_, ancestors))
-    r = Concepts()
-    common_ancestors.keep_most_specific()
-    return common_ancestors
-
+    return self._lowest_common_ancestors()[0]
+  
+  def lowest_common_ancestor(self):
+    """returns a single lowest common ancestor between this set of concepts, or None if they have no common ancestor.
+If there are several lowest common ancestors, the one closest to the concepts of the set (in number of is-a relations) is returned."""
+    if len(self) == 0: return None
+    if len(self) == 1: return tuple(self)[0]
+    common_ancestors, levels = self._lowest_common_ancestors()
+    if not common_ancestors: return None
+    return min(common_ancestors, key = lambda concept: (levels[concept], concept.code))
+  
   def all_subsets(self):
     """returns all the subsets included in this set."""
     l = [Concepts()]
@@ -546,6 +1137,8 @@ inherits from Python's :class:`set` the methods for computing intersection, unio
 
 
 class ModifiedConcept(Concept):
+  _is_a_by_ancestors = False
+  
   def __init__(self, origin, modifiers, term = None):
     term = term or origin.term
     self.code        = "%s:%s" % (origin.code, u":".join(modifier.code for modifier in modifiers))
@@ -678,6 +1271,11 @@ class Mapping(object):
     if isinstance(concepts, Concept):  concepts = [concepts]
     return self.map_concepts(concepts)
   
+  def amap_concepts(self, concepts, **kargs):
+    """Asynchronous version of :meth:`__call__`, for asyncio (Python 3 only); returns an awaitable. See :mod:`pymedtermino.aio`."""
+    import pymedtermino.aio
+    return pymedtermino.aio.amap_concepts(self, concepts, **kargs)
+  
 class ChainMapping(Mapping):
   def __init__(self, mappings):
     self.mappings = mappings
@@ -692,12 +1290,12 @@ class SQLMapping(Mapping):
   def __init__(self, terminology1, terminology2, db_filename, has_and = 1, reversed = 0, get_concept_parents = None):
     Mapping.__init__(self, terminology1, terminology2)
     if isinstance(db_filename, str):
-      self.db                 = sql_module.connect(db_filename)
+      self.db                 = SQLiteDatabase(db_filename)
       self.db_cursor          = self.db.cursor()
     else:
       self.db_cursor          = db_filename
-    self.db_cursor.execute("PRAGMA query_only = TRUE;")
-    
+      self.db_cursor.execute("PRAGMA query_only = TRUE;")
+      
     self._has_and             = has_and
     self.reversed             = reversed
     if not reversed:
@@ -781,14 +1379,84 @@ class SameCodeMapping(Mapping):
     return r
 
   
-def connect_sqlite3(base_filename, read_only=True):
-    """Open existing DB in DATA_DIR as sqlite3 DB
+class SQLiteDatabase(object):
+  """A SQLite database, with one connection per thread (SQLite connections and cursors cannot be shared safely between threads).
+Connections are opened on demand, the first time a thread uses the database, so as concurrent readers do not serialize
+on a single connection.
+
+:param path: the database filename.
+:param query_only: if True, connections are read-only ("PRAGMA query_only").
+:param pragmas: additional PRAGMA statements, executed on each new connection.
+
+.. automethod:: cursor
+"""
+  def __init__(self, path, query_only = True, pragmas = ()):
+    self.path         = path
+    self.query_only   = query_only
+    self.pragmas      = list(pragmas)
+    self._local       = threading.local()
+    self._lock        = threading.Lock()
+    self._connections = [] # (thread, connection) pairs
+    self._cursor      = _ThreadLocalCursor(self)
+    
+  def connection(self):
+    """Returns the connection of the current thread."""
+    connection = getattr(self._local, "connection", None)
+    if connection is None:
+      connection = sql_module.connect(self.path, check_same_thread = False)
+      if self.query_only: connection.execute("PRAGMA query_only = TRUE;")
+      for pragma in self.pragmas: connection.execute(pragma)
+      self._local.connection = connection
+      self._local.cursor     = connection.cursor()
+      with self._lock:
+        for thread, other in self._connections[:]: # Closes the connections of the finished threads
+          if not thread.is_alive():
+            other.close()
+            self._connections.remove((thread, other))
+        self._connections.append((threading.current_thread(), connection))
+    return connection
+  
+  def _thread_cursor(self):
+    cursor = getattr(self._local, "cursor", None)
+    if cursor is None:
+      self.connection()
+      cursor = self._local.cursor
+    return cursor
+  
+  def cursor(self):
+    """Returns a cursor that can be shared between threads: each thread actually executes the queries with its own connection and cursor."""
+    return self._cursor
+  
+  def execute(self, sql, args = ()): return self._thread_cursor().execute(sql, args)
+  
+  def commit(self): self.connection().commit()
+  
+  def close(self):
+    """Closes all the connections (of all threads)."""
+    with self._lock:
+      for thread, connection in self._connections: connection.close()
+      self._connections = []
+      self._local       = threading.local()
+      
+class _ThreadLocalCursor(object):
+  def __init__(self, database): self.database = database
+  
+  def execute    (self, sql, args = ()): return self.database._thread_cursor().execute(sql, args)
+  def executemany(self, sql, args):      return self.database._thread_cursor().executemany(sql, args)
+  def fetchone   (self):                 return self.database._thread_cursor().fetchone()
+  def fetchall   (self):                 return self.database._thread_cursor().fetchall()
+  def fetchmany  (self, *args):          return self.database._thread_cursor().fetchmany(*args)
+  def __iter__   (self):                 return iter(self.database._thread_cursor())
+  
+  rowcount    = property(lambda self: self.database._thread_cursor().rowcount)
+  lastrowid   = property(lambda self: self.database._thread_cursor().lastrowid)
+  description = property(lambda self: self.database._thread_cursor().description)
+  
+def connect_sqlite3(base_filename, read_only = True, pragmas = ()):
+    """Open existing DB in DATA_DIR as sqlite3 DB, and returns it as a :class:`SQLiteDatabase` (with one connection per thread).
     Connection will be read-only if read_only and READ_ONLY_DATABASE
     """
     path = '%s.sqlite3' % os.path.join(DATA_DIR, base_filename)
     if not os.path.exists(path):
       raise IOError('Database %s not available. Please build, or set pymedtermino.DATA_DIR correctly' % path)
-    db = sql_module.connect(path)
-    if READ_ONLY_DATABASE and read_only:
-      db.cursor().execute("PRAGMA query_only = TRUE;")
-    return db
+    return SQLiteDatabase(path, READ_ONLY_DATABASE and read_only, pragmas)
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+# PyMedTermino
+# Copyright (C) 2012-2013 Jean-Baptiste LAMY
+# LIMICS (Laboratoire d'informatique médicale et d'ingénierie des connaissances en santé), UMR_S 1142
+# University Paris 13, Sorbonne paris-Cité, Bobigny, France
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+pymedtermino.aio
+****************
+
+Asynchronous API for PyMedTermino, for asyncio-based applications (Python 3 only).
+
+Blocking PyMedTermino calls are run in a bounded pool of threads, so as they do not stall the event loop,
+and the number of concurrent calls on each database is limited.
+
+The same functions are available as methods of terminologies, concepts and mappings, for example:
+
+::
+
+  concept  = await SNOMEDCT.aget(123037004)
+  children = await concept.aload("children")
+  icd10s   = await (SNOMEDCT >> ICD10).amap_concepts([concept])
+
+.. autodata:: pymedtermino.aio.MAX_WORKERS
+.. autodata:: pymedtermino.aio.DATABASE_CONCURRENCY
+
+.. autofunction:: aget
+.. autofunction:: aget_many
+.. autofunction:: asearch
+.. autofunction:: aload
+.. autofunction:: amap_concepts
+.. autofunction:: run_in_executor
+.. autofunction:: set_executor
+"""
+
+__all__ = ["aget", "aget_many", "asearch", "aload", "amap_concepts", "run_in_executor", "set_executor"]
+
+import sys, asyncio, functools, weakref, concurrent.futures
+import pymedtermino
+
+MAX_WORKERS          = int(pymedtermino._get_env("ASYNC_MAX_WORKERS", 8)) #: the maximum number of threads running blocking calls. Default : 8.
+DATABASE_CONCURRENCY = int(pymedtermino._get_env("ASYNC_DATABASE_CONCURRENCY", 4)) #: the maximum number of concurrent calls on each database. Default : 4.
+
+_executor   = None
+_semaphores = weakref.WeakKeyDictionary() # Event loop => { database : asyncio.Semaphore }
+
+def set_executor(executor):
+  """Sets the :mod:`concurrent.futures` executor that runs blocking calls (by default, a ThreadPoolExecutor with MAX_WORKERS threads)."""
+  global _executor
+  _executor = executor
+
+def _get_executor():
+  global _executor
+  if _executor is None: _executor = concurrent.futures.ThreadPoolExecutor(max_workers = MAX_WORKERS, thread_name_prefix = "pymedtermino")
+  return _executor
+
+def _database(o):
+  # Returns the database used by a terminology or a mapping, for the concurrency limits.
+  database = getattr(o, "db", None) or getattr(getattr(o, "db_cursor", None), "database", None)
+  if database is None: database = getattr(sys.modules.get(o.__class__.__module__), "db", None)
+  if database is None:
+    if isinstance(o, pymedtermino.Mapping): return _database(o.terminology1)
+    return o
+  return database
+
+def _semaphore(database):
+  loop       = asyncio.get_event_loop()
+  semaphores = _semaphores.get(loop)
+  if semaphores is None: semaphores = _semaphores[loop] = {}
+  semaphore  = semaphores.get(database)
+  if semaphore is None: semaphore = semaphores[database] = asyncio.Semaphore(DATABASE_CONCURRENCY)
+  return semaphore
+
+async def run_in_executor(database, func, *args, **kargs):
+  """Runs func(\\*args, \\*\\*kargs) in the executor, with at most DATABASE_CONCURRENCY concurrent calls on the given database, and returns its result.
+
+:param database: the database used by func (any hashable object, e.g. the db attribute of a terminology module).
+"""
+  async with _semaphore(database):
+    return await asyncio.get_event_loop().run_in_executor(_get_executor(), functools.partial(func, *args, **kargs))
+
+async def aget(terminology, code):
+  """Returns the concept of the given code in the given terminology, or None if no such concept (see :meth:`pymedtermino.Terminology.get`)."""
+  return await run_in_executor(_database(terminology), terminology.get, code)
+
+async def aget_many(terminology, codes):
+  """Returns a dict mapping the given codes to their concepts in the given terminology (see :meth:`pymedtermino.Terminology.get_many`)."""
+  return await run_in_executor(_database(terminology), terminology.get_many, list(codes))
+
+async def asearch(terminology, text, **kargs):
+  """Searches the given terminology for the given text, and returns the list of the matching concepts (see the terminology's search() method)."""
+  return await run_in_executor(_database(terminology), terminology.search, text, **kargs)
+
+async def aload(concept, *attrs):
+  """Loads the given attributes of the concept (e.g. "children", "parents" or a relation name), and returns the value of the attribute,
+or the list of the values if several attributes are given."""
+  def load(): return [getattr(concept, attr) for attr in attrs]
+  values = await run_in_executor(_database(concept.terminology), load)
+  if len(attrs) == 1: return values[0]
+  return values
+
+async def amap_concepts(mapping, concepts, **kargs):
+  """Maps the given concept(s) with the given mapping, and returns the set of mapped concepts (see :meth:`pymedtermino.Mapping.__call__`)."""
+  if isinstance(concepts, pymedtermino.Concept): concepts = [concepts]
+  return await run_in_executor(_database(mapping), mapping.map_concepts, list(concepts), **kargs)
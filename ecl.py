@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+# PyMedTermino
+# Copyright (C) 2012-2013 Jean-Baptiste LAMY
+# LIMICS (Laboratoire d'informatique médicale et d'ingénierie des connaissances en santé), UMR_S 1142
+# University Paris 13, Sorbonne paris-Cité, Bobigny, France
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+pymedtermino.ecl
+****************
+
+SNOMED CT Expression Constraint Language (ECL) queries.
+
+ECL expression constraints are compiled to a single SQL query on the SNOMED CT database, which evaluates them set-at-a-time
+(using the IsaClosure table when available). Use :meth:`pymedtermino.snomedct.SNOMEDCT.ecl` for evaluating them:
+
+::
+
+  SNOMEDCT.ecl("<< 404684003 |Clinical finding| : 363698007 |Finding site| = << 39057004 |Pulmonary valve|")
+
+The following subset of ECL is supported:
+
+ * concept references (with optional \|term\|) and the \* wildcard,
+ * the hierarchy operators < (descendants), << (descendants or self), <! (children), <<! (children or self),
+   > (ancestors), >> (ancestors or self), >! (parents) and >>! (parents or self),
+ * AND (or ","), OR and MINUS, and parentheses (ECL requires parentheses when mixing them),
+ * attribute refinements (after ":"), with = and !=, attribute names with hierarchy operators (e.g. << 363698007) or \*,
+   reverse attributes (R), cardinalities (e.g. [0..0] or [1..*]) and conjunction / disjunction of attributes,
+ * attribute groups ({ ... }), without cardinalities,
+ * member of (^), e.g. "^ 723264001" (the refsets must have been imported, see :meth:`pymedtermino.snomedct.SNOMEDCT.refset`).
+
+Relations and concepts follow pymedtermino.REMOVE_SUPPRESSED_RELATIONS and pymedtermino.REMOVE_SUPPRESSED_CONCEPTS.
+
+.. autofunction:: parse
+.. autofunction:: to_sql
+"""
+
+__all__ = ["parse", "to_sql"]
+
+import re
+
+_IS_A = 116680003
+
+_TOKEN    = re.compile(r"""\s*(?:(/\*.*?\*/)|(\|[^|]*\|)|(<<!|<<|<!|<|>>!|>>|>!|>|!=|=|\.\.|[(){}\[\]:,*^])|(\d+)|([A-Za-z]+))""", re.S)
+_OPERATORS = set(["<", "<<", "<!", "<<!", ">", ">>", ">!", ">>!"])
+_BINARY    = { "AND" : "and", "," : "and", "OR" : "or", "MINUS" : "minus" }
+
+def parse(expression):
+  """Parses the given ECL expression constraint, and returns its syntax tree (nested tuples). Raises ValueError if the expression is invalid or not supported."""
+  return _Parser(expression).parse()
+
+def to_sql(expression, closure = True, active_relations = True, active_concepts = True, refsets = True):
+  """Compiles the given ECL expression constraint (a string or a syntax tree returned by :func:`parse`) to a SQL query on the SNOMED CT database,
+which returns the ids of the matching concepts.
+
+:param closure: if True, the IsaClosure table is used for hierarchy operators, otherwise recursive queries on the Relationship table are used.
+:param active_relations: if True, only active relations are considered.
+:param active_concepts: if True, only active concepts are returned.
+:param refsets: if True, the RefsetMember table is used for member of (^), otherwise member of raises ValueError."""
+  if not isinstance(expression, tuple): expression = parse(expression)
+  sql = _Compiler(closure, active_relations, refsets).compile(expression)
+  if active_concepts: return "SELECT id FROM Concept WHERE (active = 1) AND (id IN (%s))" % sql
+  return "SELECT id FROM Concept WHERE id IN (%s)" % sql
+
+
+class _Parser(object):
+  def __init__(self, expression):
+    self.expression = expression
+    self.tokens     = [] # (token, position) pairs
+    position        = 0
+    expression      = expression.rstrip()
+    while position < len(expression):
+      match = _TOKEN.match(expression, position)
+      if not match: raise ValueError("Invalid ECL expression '%s' at position %s!" % (self.expression, position))
+      comment, term, symbol, number, word = match.groups()
+      if   symbol: self.tokens.append((symbol, match.start(3)))
+      elif number: self.tokens.append((number, match.start(4)))
+      elif word:   self.tokens.append((word.upper(), match.start(5)))
+      # Comments and |terms| are ignored
+      position = match.end()
+    self.i = 0
+
+  def error(self, message = "unexpected token"):
+    if self.i < len(self.tokens): return ValueError("Invalid ECL expression '%s' at position %s: %s!" % (self.expression, self.tokens[self.i][1], message))
+    return ValueError("Invalid ECL expression '%s' at end: %s!" % (self.expression, message))
+
+  def peek(self):
+    if self.i < len(self.tokens): return self.tokens[self.i][0]
+
+  def next(self):
+    token = self.peek()
+    if token is None: raise self.error("unexpected end")
+    self.i += 1
+    return token
+
+  def expect(self, token):
+    if self.peek() != token: raise self.error("'%s' expected" % token)
+    self.i += 1
+
+  def parse(self):
+    r = self.expression_constraint()
+    if not self.peek() is None: raise self.error()
+    return r
+
+  def compound(self, first, parse_item):
+    items = [first]
+    op    = None
+    while self.peek() in _BINARY:
+      next_op = _BINARY[self.peek()]
+      if op and (next_op != op): raise self.error("parentheses are required when mixing AND, OR and MINUS")
+      if (next_op == "minus") and op: raise self.error("parentheses are required when chaining MINUS")
+      self.i += 1
+      op = next_op
+      items.append(parse_item())
+    if op: return (op,) + tuple(items)
+    return first
+
+  def expression_constraint(self):
+    sub = self.sub_expression_constraint()
+    if self.peek() == ":":
+      self.i += 1
+      return ("refine", sub, self.refinement())
+    return self.compound(sub, self.sub_expression_constraint)
+
+  def sub_expression_constraint(self):
+    op = None
+    if self.peek() in _OPERATORS: op = self.next()
+    token = self.peek()
+    if   token == "*":
+      self.i += 1
+      focus = ("any",)
+    elif token == "(":
+      self.i += 1
+      focus = self.expression_constraint()
+      self.expect(")")
+    elif token == "^":
+      self.i += 1
+      if   self.peek() == "*":
+        self.i += 1
+        refset = ("any",)
+      elif self.peek() == "(":
+        self.i += 1
+        refset = self.expression_constraint()
+        self.expect(")")
+      elif self.peek() and self.peek().isdigit():
+        refset = ("concept", int(self.next()))
+      else:
+        raise self.error("refset expected")
+      focus = ("member_of", refset)
+    elif token and token.isdigit():
+      self.i += 1
+      focus = ("concept", int(token))
+    else:
+      raise self.error("concept expected")
+    if op: return (op, focus)
+    return focus
+
+  def refinement(self):
+    return self.compound(self.sub_refinement(), self.sub_refinement)
+
+  def sub_refinement(self):
+    if self.peek() == "(":
+      self.i += 1
+      r = self.refinement()
+      self.expect(")")
+      return r
+    cardinality = self.cardinality()
+    if self.peek() == "{":
+      if cardinality: raise self.error("cardinalities are not supported on attribute groups")
+      self.i += 1
+      r = ("group", self.attribute_set())
+      self.expect("}")
+      return r
+    return self.attribute(cardinality)
+
+  def attribute_set(self):
+    return self.compound(self.sub_attribute_set(), self.sub_attribute_set)
+
+  def sub_attribute_set(self):
+    if self.peek() == "(":
+      self.i += 1
+      r = self.attribute_set()
+      self.expect(")")
+      return r
+    return self.attribute(self.cardinality())
+
+  def cardinality(self):
+    if self.peek() != "[": return None
+    self.i += 1
+    minimum = self.next()
+    self.expect("..")
+    maximum = self.next()
+    self.expect("]")
+    if (not minimum.isdigit()) or not (maximum.isdigit() or (maximum == "*")): raise self.error("invalid cardinality")
+    if maximum == "*": return (int(minimum), None)
+    if int(maximum) < int(minimum): raise self.error("invalid cardinality")
+    return (int(minimum), int(maximum))
+
+  def attribute(self, cardinality):
+    reverse = self.peek() == "R"
+    if reverse: self.i += 1
+    op = None
+    if self.peek() in ("<", "<<"): op = self.next()
+    if self.peek() == "*":
+      self.i += 1
+      name = ("any",)
+    elif self.peek() and self.peek().isdigit():
+      name = ("concept", int(self.next()))
+    else:
+      raise self.error("attribute expected")
+    if op: name = (op, name)
+    comparison = self.peek()
+    if not comparison in ("=", "!="): raise self.error("'=' or '!=' expected")
+    self.i += 1
+    return ("attribute", cardinality, reverse, name, comparison, self.sub_expression_constraint())
+
+
+class _Compiler(object):
+  def __init__(self, closure, active_relations, refsets = True):
+    self.closure          = closure
+    self.active_relations = active_relations
+    self.refsets          = refsets
+    self.nb_tables        = 0
+    if active_relations: self.relationship = "(Relationship.active = 1) AND "
+    else:                self.relationship = ""
+
+  def compile(self, node):
+    kind = node[0]
+    if kind == "concept": return "SELECT %s AS id" % node[1]
+    if kind == "any":     return "SELECT id FROM Concept"
+    if kind in _OPERATORS: return self.hierarchy(kind, self.compile(node[1]))
+    if kind == "member_of":
+      if not self.refsets: raise ValueError("Member of (^) requires the refsets, which are not in the SNOMED CT database (see scripts/import_snomedct_refsets.py)!")
+      if node[1] == ("any",): return "SELECT referencedComponentId AS id FROM RefsetMember WHERE active = 1"
+      return "SELECT referencedComponentId AS id FROM RefsetMember WHERE (active = 1) AND (refsetId IN (%s))" % self.compile(node[1])
+    if kind == "and":     return " INTERSECT ".join("SELECT id FROM (%s)" % self.compile(item) for item in node[1:])
+    if kind == "or":      return " UNION ".join    ("SELECT id FROM (%s)" % self.compile(item) for item in node[1:])
+    if kind == "minus":   return " EXCEPT ".join   ("SELECT id FROM (%s)" % self.compile(item) for item in node[1:])
+    if kind == "refine":
+      focus = self.compile(node[1])
+      return "SELECT id FROM (%s) INTERSECT SELECT id FROM (%s)" % (focus, self.refinement(node[2], focus))
+    raise ValueError("Unsupported ECL node %s!" % (node,))
+
+  def hierarchy(self, op, sql):
+    if op.endswith("!"): # Children / parents
+      if op.startswith("<"): r = "SELECT sourceId AS id FROM Relationship WHERE %s(typeId = %s) AND (destinationId IN (%s))" % (self.relationship, _IS_A, sql)
+      else:                  r = "SELECT destinationId AS id FROM Relationship WHERE %s(typeId = %s) AND (sourceId IN (%s))" % (self.relationship, _IS_A, sql)
+    elif self.closure:
+      if op.startswith("<"): r = "SELECT descendant AS id FROM IsaClosure WHERE (active = %s) AND (ancestor IN (%s))"   % (int(bool(self.active_relations)), sql)
+      else:                  r = "SELECT ancestor AS id FROM IsaClosure WHERE (active = %s) AND (descendant IN (%s))" % (int(bool(self.active_relations)), sql)
+    else:
+      self.nb_tables += 1
+      table = "_ecl%s" % self.nb_tables
+      if op.startswith("<"): column, other_column = "sourceId", "destinationId"
+      else:                  column, other_column = "destinationId", "sourceId"
+      r = "WITH RECURSIVE %s(id) AS (SELECT %s FROM Relationship WHERE %s(typeId = %s) AND (%s IN (%s)) UNION SELECT Relationship.%s FROM Relationship, %s WHERE %s(Relationship.typeId = %s) AND (Relationship.%s = %s.id)) SELECT id FROM %s" % (
+        table, column, self.relationship, _IS_A, other_column, sql, column, table, self.relationship, _IS_A, other_column, table, table)
+    if op in ("<<", ">>", "<<!", ">>!"): r = "SELECT id FROM (%s) UNION SELECT id FROM (%s)" % (sql, r)
+    return r
+
+  def refinement(self, node, focus):
+    kind = node[0]
+    if kind == "and":       return " INTERSECT ".join("SELECT id FROM (%s)" % self.refinement(item, focus) for item in node[1:])
+    if kind == "or":        return " UNION ".join    ("SELECT id FROM (%s)" % self.refinement(item, focus) for item in node[1:])
+    if kind == "group":     return "SELECT id FROM (%s)" % self.group(node[1])
+    if kind == "attribute": return self.attribute(node, focus)
+    raise ValueError("Unsupported ECL node %s!" % (node,))
+
+  def relationships(self, node):
+    # Returns the (column, other_column, SQL condition) of the relationships matching the given attribute, without cardinality.
+    kind, cardinality, reverse, name, comparison, value = node
+    if reverse: column, other_column = "destinationId", "sourceId"
+    else:       column, other_column = "sourceId", "destinationId"
+    if name == ("any",): condition = "%s(typeId != %s)" % (self.relationship, _IS_A)
+    else:                condition = "%s(typeId IN (%s))" % (self.relationship, self.compile(name))
+    if value != ("any",):
+      if comparison == "=": condition += " AND (%s IN (%s))"     % (other_column, self.compile(value))
+      else:                 condition += " AND (%s NOT IN (%s))" % (other_column, self.compile(value))
+    elif comparison == "!=": condition += " AND 0"
+    return column, other_column, condition
+
+  def attribute(self, node, focus):
+    cardinality = node[1]
+    column, other_column, condition = self.relationships(node)
+    if not cardinality: return "SELECT %s AS id FROM Relationship WHERE %s" % (column, condition)
+    minimum, maximum = cardinality
+    counted = "SELECT %s AS id FROM Relationship WHERE %s GROUP BY %s HAVING COUNT(DISTINCT %s)" % (column, condition, column, other_column)
+    if minimum == 0:
+      if maximum is None: return focus
+      return "SELECT id FROM (%s) EXCEPT %s > %s" % (focus, counted, maximum)
+    if maximum is None: return "%s >= %s" % (counted, minimum)
+    return "%s BETWEEN %s AND %s" % (counted, minimum, maximum)
+
+  def group(self, node):
+    # Returns a SQL query on (id, grp) pairs; relations in group 0 are each considered as a separate group.
+    kind = node[0]
+    if kind == "and": return " INTERSECT ".join("SELECT id, grp FROM (%s)" % self.group(item) for item in node[1:])
+    if kind == "or":  return " UNION ".join    ("SELECT id, grp FROM (%s)" % self.group(item) for item in node[1:])
+    if kind == "attribute":
+      if node[1]: raise ValueError("Cardinalities are not supported inside ECL attribute groups!")
+      if node[2]: raise ValueError("Reverse attributes are not supported inside ECL attribute groups!")
+      column, other_column, condition = self.relationships(node)
+      return "SELECT %s AS id, CASE relationshipGroup WHEN 0 THEN -Relationship.id ELSE relationshipGroup END AS grp FROM Relationship WHERE %s" % (column, condition)
+    raise ValueError("Unsupported ECL node %s!" % (node,))
@@ -34,15 +34,20 @@ PyMedtermino module for ICD10. Currently supports English and (ATIH) French vers
    Defaults to false.
    Must be set **before** loading ICD10 concepts.
 
+.. data:: LOAD_ALL
+
+   If True, ICD10 is loaded in memory when the module is imported (see :meth:`ICD10.load_all`).
+   Defaults to the PYMEDTERMINO_ICD10_LOAD_ALL environment variable, or False.
 
 """
 
-__all__ = ["ICD10"]
+__all__ = ["ICD10", "ICD10Range"]
 
-import os, os.path
+import os, os.path, bisect
 import pymedtermino
 
 ATIH_EXTENSION = False
+LOAD_ALL       = pymedtermino._get_bool_env("ICD10_LOAD_ALL", False)
 
 
 db        = pymedtermino.connect_sqlite3("icd10")
@@ -50,47 +55,404 @@ db_cursor = db.cursor()
 #db_cursor.execute("PRAGMA synchronous  = OFF;")
 #db_cursor.execute("PRAGMA journal_mode = OFF;")
 
-_CONCEPT = {}
-_SEARCH  = "SELECT Concept.code FROM Concept, Concept_fts WHERE Concept_fts.term MATCH ? AND Concept.id = Concept_fts.docid"
+import atexit
+atexit.register(db.close)
+
+db_cursor.execute("PRAGMA table_info(Concept)")
+_COLUMNS = [column[1] for column in db_cursor.fetchall()]
+_HAS_INTERVALS       = "interval_start"      in _COLUMNS # False for databases built by older versions of PyMedTermino
+_HAS_HIERARCHY_STATS = "information_content" in _COLUMNS
+
+_ROW_COLUMNS = ["parent_code", "term_en", "term_fr", "dagger", "star", "morbidity", "mortality1", "mortality2", "mortality3", "mortality4", "atih_extension", "pmsi_restriction"]
+if _HAS_INTERVALS:       _ROW_COLUMNS.extend(["interval_start", "interval_end"])
+if _HAS_HIERARCHY_STATS: _ROW_COLUMNS.extend(["depth", "descendant_count", "information_content"])
+_ROW_INDEX = dict((column, i) for (i, column) in enumerate(_ROW_COLUMNS))
+_CONCEPT   = "SELECT %s FROM Concept WHERE code=?" % ", ".join(_ROW_COLUMNS) # Whole rows, kept in ICD10Concept._row
+_CONCEPTS  = "SELECT code, %s FROM Concept WHERE code IN (%%s)" % ", ".join(_ROW_COLUMNS)
+_HAS_FTS5 = pymedtermino._is_fts5(db_cursor, "Concept_fts") # False for databases built by older versions of PyMedTermino (FTS4, no ranking)
+if _HAS_FTS5:
+  db_cursor.execute("PRAGMA table_info(Concept_fts)")
+  _FTS_LANGS = [column[1][5:] for column in db_cursor.fetchall() if column[1].startswith("term_")] # Empty for older FTS5 indexes, with a single term column
+else:
+  _FTS_LANGS = []
+_SEARCH_FTS5 = "SELECT Concept.code AS code, Concept_fts.term AS term, %s AS score, Concept_fts.rowid AS position FROM Concept, Concept_fts WHERE Concept_fts MATCH ? AND Concept.code = Concept_fts.code"
+_SEARCH_FTS5_LANG = "SELECT Concept.code AS code, Concept_fts.term_%s AS term, %s AS score, Concept_fts.rowid AS position FROM Concept, Concept_fts WHERE Concept_fts.term_%s MATCH ? AND Concept.code = Concept_fts.code"
+_SEARCH_FTS4 = "SELECT Concept.code AS code, Concept.term_en AS term, NULL AS score, Concept_fts.rowid AS position FROM Concept, Concept_fts WHERE Concept_fts.term MATCH ? AND Concept.id = Concept_fts.rowid"
 _TEXT1 = "SELECT text_en FROM Text WHERE id=?"
 _TEXT2 = "SELECT id, text_en, text_en, dagger, reference FROM Text WHERE code=? AND relation=?"
-for lang in ["en", "fr"]:
-  _CONCEPT[lang] = "SELECT parent_code, term_%s FROM Concept WHERE code=?" % lang
+_TEXTS = "SELECT code, relation, id, text_en, dagger, reference FROM Text WHERE code IN (%s)"
+_REFERENCING_TEXTS = "SELECT code, relation, id, text_en, dagger FROM Text WHERE reference=?"
 _ATIH = " AND atih_extension = 0"
+_HIERARCHY_STATS_ATTRS = set(["depth", "descendant_count", "information_content"])
+_ROW_ATTRS    = set(["dagger", "star", "morbidity", "mortality1", "mortality2", "mortality3", "mortality4", "pmsi_restriction"])
+_COLUMN_ATTRS = _ROW_ATTRS | set(["terms", "atih_extension"])
+_MEMORY = None # The Concept and Text tables loaded in memory (_LoadedTables), see ICD10.load_all()
   
 class ICD10(pymedtermino.Terminology):
   def __init__(self):
     pymedtermino.Terminology.__init__(self, "ICD10")
     
+  def _snapshot_settings(self):
+    settings = pymedtermino.Terminology._snapshot_settings(self)
+    settings["ATIH_EXTENSION"] = int(bool(ATIH_EXTENSION))
+    return settings
+  
+  def load_all(self):
+    """Loads the whole ICD10 (the Concept and Text tables) in memory, with a single pass on each table.
+Afterwards, concepts, their hierarchy and their attributes (including texts such as inclusions and exclusions) are obtained from memory, without SQL queries;
+only :meth:`search` still uses the database. It takes a few MB (see the icd10_load_all benchmark in scripts/benchmark.py).
+
+For keeping all concepts in memory too (and not only the tables), the concept cache can be made unlimited with ICD10.concept_cache.resize(0)."""
+    global _MEMORY
+    if _MEMORY is None: _MEMORY = _LoadedTables(db.connection().cursor())
+    
+  def unload_all(self):
+    """Frees the memory used by :meth:`load_all`; concepts are then loaded from the database again."""
+    global _MEMORY
+    _MEMORY = None
+    
+  def _all_codes(self):
+    if _MEMORY: return _MEMORY.all_codes()
+    if ATIH_EXTENSION: db_cursor.execute("SELECT code FROM Concept")
+    else:              db_cursor.execute("SELECT code FROM Concept WHERE atih_extension = 0")
+    return [code for (code,) in db_cursor.fetchall()]
+    
   def _create_Concept(self): return BaseICD10Concept
   
   def first_levels(self):
     return [self[code] for code in ["I", "II", "III", "IV", "V", "VI", "VII", "VIII", "IX", "X", "XI", "XII", "XIII", "XIV", "XV", "XVI", "XVII", "XVIII", "XIX", "XX", "XXI", "XXII"]]
   
-  def search(self, text):
+  def search(self, text, limit = None, offset = 0, rank = False, active_only = None, semantic_tag = None, lang = None, prefix = False, texts = True):
+    return self._hits_concepts(self.search_hits(text, limit, offset, rank, active_only, semantic_tag, lang, prefix, texts))
+  
+  def search_hits(self, text, limit = None, offset = 0, rank = True, active_only = None, semantic_tag = None, lang = None, prefix = False, texts = True):
+    """Searches for concepts whose terms or texts match the given text; see :meth:`pymedtermino.Terminology.search_hits`. Accents are ignored (e.g. "hepatite" matches "hépatite").
+In addition, the following options are available:
+
+:param lang: if given, only the terms in this language ("en" or "fr") are searched (texts, such as inclusions, are only in English). By default, all languages are searched.
+:param prefix: if True, the last word of text is a prefix, e.g. for autocompletion ("hypert" matches "hypertension").
+:param texts: if False, only the terms of the concepts are searched, and not their texts (inclusions, exclusions, etc).
+
+lang and texts require a database built (or migrated with scripts/migrate_fts5.py) by this version of PyMedTermino."""
+    # ICD10 has no inactive concepts; active_only is accepted for compatibility with the other terminologies.
+    if semantic_tag: raise ValueError("ICD10 has no semantic tags!")
+    if (lang or not texts) and not _FTS_LANGS: raise ValueError("The ICD10 full-text index has no language and source columns; rebuild it with scripts/migrate_fts5.py!")
+    if lang and not lang in _FTS_LANGS: raise ValueError("No ICD10 terms in language '%s'!" % lang)
+    if prefix and not text.endswith("*"): text = text + "*"
     if ATIH_EXTENSION: atih = ""
     else:              atih = _ATIH
-    db_cursor.execute(_SEARCH + atih, (text,))
-    r = db_cursor.fetchall()
-    #db_cursor.execute(_SEARCH1 + atih, (text,))
-    #r1 = db_cursor.fetchall()
-    #db_cursor.execute(_SEARCH2, (text,))
-    #r2 = db_cursor.fetchall()
-    return [self[code] for (code,) in r]
+    if not texts: atih += " AND Concept_fts.source = 'term'"
+    rank = rank and _HAS_FTS5
+    if rank: score = "-bm25(Concept_fts)"
+    else:    score = "NULL"
+    if   not _HAS_FTS5:  sqls = [_SEARCH_FTS4]
+    elif not _FTS_LANGS: sqls = [_SEARCH_FTS5 % score]
+    elif lang:           sqls = [_SEARCH_FTS5_LANG % (lang, score, lang)]
+    else:                sqls = [_SEARCH_FTS5_LANG % (lang2, score, lang2) for lang2 in _FTS_LANGS] # One query per language, for returning the matching term
+    sql = " UNION ALL ".join(sql + atih for sql in sqls)
+    return pymedtermino._search_hits(self, db, pymedtermino._search_sql(sql, rank), [text] * len(sqls), limit, offset)
+  
+  def range(self, start, end = None, include_descendants = True, exclude = None):
+    """Returns the set (:class:`ICD10Range`) of the concepts in the given range of codes, e.g. ICD10.range("E10", "E14").
+
+:param start: the first concept (or code) of the range, or, if end is None, a single concept or code, or a range of codes in a string (e.g. "E10-E14" or "C00-D48.9").
+   Block codes (e.g. "I10-I15") are considered as single concepts.
+:param end: the last concept (or code) of the range.
+:param include_descendants: if True (default), the descendants of the concepts in the range are included (e.g. E10.0 to E14.9 for E10-E14);
+   if False, only the most general concepts of the range are included (E10, E11, E12, E13 and E14).
+:param exclude: a concept, a code, a range of codes in a string or an ICD10Range, or a list of them, whose concepts (and their descendants) are removed from the range (e.g. "I24.1").
+
+Blocks or chapters that are only partly covered by the range are not included. Raises ValueError if a code does not exist, or if end is before start."""
+    if not _HAS_INTERVALS: raise ValueError("ICD10 ranges require the interval numbering, which is missing in this database (built by an older version of PyMedTermino)!")
+    if end is None:
+      first, last = self._range_bounds(start)
+    else:
+      first, last = self._range_bounds(start)[0], self._range_bounds(end)[1]
+    if first.interval_start > last.interval_end: raise ValueError("Empty ICD10 range %s-%s!" % (first.code, last.code))
+    
+    # The most general concepts of the range, obtained by jumping from one to the next (in pre-order), rather than scanning the whole range
+    tops     = []
+    position = first.interval_start
+    while position <= last.interval_end:
+      top_end = self._interval_end_at(position)
+      if (top_end is None) or (top_end > last.interval_end): position += 1 # A grouping partly covered by the range: continue with its first child
+      else:
+        tops.append((position, top_end))
+        position = top_end + 1
+    if include_descendants: r = ICD10Range(tops)
+    else:                   r = ICD10Range([(top_start, top_start) for (top_start, top_end) in tops])
+    
+    if exclude is not None:
+      if not isinstance(exclude, (list, tuple, set, frozenset)): exclude = [exclude]
+      for excluded in exclude:
+        if not isinstance(excluded, ICD10Range): excluded = self.range(excluded)
+        r = r - excluded
+    return r
+  
+  def load_texts(self, concepts, relations = None):
+    """Loads the texts (:class:`Text`, e.g. inclusions, exclusions or notes) of the given concepts, for all relations or only for the given list of relations,
+with a single query (per chunk of concepts), instead of one query per concept and relation. The texts are then available in the relation attributes of the concepts
+(e.g. concept.exclusion); when all relations are loaded, the :attr:`relations <pymedtermino.Concept.relations>` attribute is loaded too.
+The concepts the texts refer to are not loaded (see :attr:`Text.reference`)."""
+    concepts = [concept for concept in concepts if isinstance(concept, ICD10Concept)]
+    if _MEMORY:
+      texts = dict((concept.code, _MEMORY.texts.get(concept.code, ())) for concept in concepts)
+    elif relations is None:
+      texts = pymedtermino._fetch_grouped(db_cursor, _TEXTS, [concept.code for concept in concepts], distinct = 0)
+    else:
+      texts = pymedtermino._fetch_grouped(db_cursor, _TEXTS + " AND relation IN (%s)" % pymedtermino._sql_params(len(relations)), [concept.code for concept in concepts], relations, distinct = 0)
+      
+    for concept in concepts:
+      relation_2_texts = {}
+      for (relation, id, text_en, dagger, reference) in texts.get(concept.code, ()):
+        relation_2_texts.setdefault(relation, []).append(Text(id, concept, relation, text_en, text_en, dagger, reference))
+      if relations is None:
+        concept.relations = set(relation_2_texts)
+        for relation in concept.relations: setattr(concept, relation, relation_2_texts[relation])
+      else:
+        for relation in relations: setattr(concept, relation, relation_2_texts.get(relation, []))
+        
+  def _range_bounds(self, spec):
+    # Returns the first and last concepts of the given concept, code or range string.
+    if isinstance(spec, pymedtermino.Concept):
+      if not isinstance(spec, ICD10Concept): raise ValueError("%s is not an ICD10 concept!" % spec)
+      return spec, spec
+    concept = self.get(spec)
+    if concept and isinstance(concept, ICD10Concept): return concept, concept
+    codes = spec.split("-")
+    if (len(codes) != 2) or (not codes[0].strip()) or (not codes[1].strip()): raise ValueError(u"Missing concept %s:%s !" % (self.name, spec))
+    return self[codes[0].strip()], self[codes[1].strip()]
+  
+  def _interval_end_at(self, start):
+    # Returns the interval_end of the concept whose interval_start is start, or None.
+    if _MEMORY: return _MEMORY.interval_end_at(start)
+    db_cursor.execute("SELECT interval_end FROM Concept WHERE interval_start = ?", (start,))
+    r = db_cursor.fetchone()
+    return r and r[0]
+  
+  def _codes_in_interval(self, start, end):
+    if _MEMORY: return _MEMORY.codes_in_interval(start, end)
+    if ATIH_EXTENSION: atih = ""
+    else:              atih = _ATIH
+    db_cursor.execute("SELECT code FROM Concept WHERE interval_start BETWEEN ? AND ?" + atih + " ORDER BY interval_start", (start, end))
+    return [code for (code,) in db_cursor.fetchall()]
+  
+  def _concepts_in_interval(self, start, end):
+    return self._concepts_in_order(self._codes_in_interval(start, end))
+  
+  def _concepts_in_order(self, codes):
+    concepts = self.get_many(codes)
+    return [concepts[code] for code in codes]
+  
+  def _prefetch(self, concepts, attr):
+    if _MEMORY: return pymedtermino.Terminology._prefetch(self, concepts, attr) # No query needed
+    
+    others   = [concept for concept in concepts if not isinstance(concept, ICD10Concept)]
+    concepts = [concept for concept in concepts if     isinstance(concept, ICD10Concept)]
+    if others: pymedtermino.Terminology._prefetch(self, others, attr)
+    
+    if   attr == "parents":
+      parents = self.get_many(set(concept.parent_code for concept in concepts if concept.parent_code))
+      for concept in concepts:
+        if   not concept.parent_code:        concept.parents = []
+        elif concept.parent_code in parents: concept.parents = [parents[concept.parent_code]]
+        
+    elif attr == "children":
+      if ATIH_EXTENSION: atih = ""
+      else:              atih = _ATIH
+      children = pymedtermino._fetch_grouped(db_cursor, "SELECT parent_code, code FROM Concept WHERE parent_code IN (%s)" + atih, [concept.code for concept in concepts])
+      self._set_prefetched(concepts, attr, children)
+      
+    elif attr == "relations":
+      relations = pymedtermino._fetch_grouped(db_cursor, "SELECT DISTINCT code, relation FROM Text WHERE code IN (%s)", [concept.code for concept in concepts])
+      for concept in concepts: concept.relations = set(relations.get(concept.code, []))
+      
+    elif attr in _HIERARCHY_STATS_ATTRS: # Loaded with the rows of the concepts (or computed, for older databases)
+      pymedtermino.Terminology._prefetch(self, concepts, attr)
+      
+    elif not (attr.startswith("_") or (attr in _COLUMN_ATTRS) or hasattr(ICD10Concept, attr)): # Texts, e.g. inclusion or exclusion
+      self.load_texts(concepts, [attr])
+        
+    else:
+      pymedtermino.Terminology._prefetch(self, concepts, attr)
+      
+  def _load_many(self, codes):
+    r       = {}
+    simples = []
+    for code in codes:
+      if ("+" in code) or code.startswith(u"("):
+        try:               r[code] = self.Concept(code)
+        except ValueError: pass
+      elif _MEMORY:
+        row = _MEMORY.rows.get(code)
+        if row: r[code] = self.dict.get(code) or ICD10Concept(code, row)
+      else: simples.append(code)
+    for chunk in pymedtermino._chunks(simples):
+      db_cursor.execute(_CONCEPTS % pymedtermino._sql_params(len(chunk)), chunk)
+      for row in db_cursor.fetchall():
+        r[row[0]] = self.dict.get(row[0]) or ICD10Concept(row[0], row[1:])
+    return r
+  
+  def _count_concepts_in_interval(self, start, end):
+    if ATIH_EXTENSION: return end - start + 1
+    if _MEMORY: return len(_MEMORY.codes_in_interval(start, end))
+    db_cursor.execute("SELECT COUNT(*) FROM Concept WHERE interval_start BETWEEN ? AND ?" + _ATIH, (start, end))
+    return db_cursor.fetchone()[0]
   
 
+class _LoadedTables(object):
+  # The Concept and Text tables, loaded in memory by ICD10.load_all().
+  def __init__(self, db_cursor):
+    self.rows = {} # code => row (as in ICD10Concept._row)
+    
+    children = {}
+    db_cursor.execute("SELECT code, %s FROM Concept ORDER BY id" % ", ".join(_ROW_COLUMNS))
+    for row in db_cursor:
+      code = row[0]
+      self.rows[code] = row[1:]
+      children.setdefault(row[1], []).append(code)
+    self.children = dict((code, tuple(codes)) for (code, codes) in children.items()) # parent code => codes
+    
+    texts      = {}
+    references = {}
+    db_cursor.execute("SELECT code, relation, id, text_en, dagger, reference FROM Text ORDER BY id")
+    for row in db_cursor:
+      texts.setdefault(row[0], []).append(row[1:])
+      if row[5]: references.setdefault(row[5], []).append(row[:5])
+    self.texts      = dict((code, tuple(rows)) for (code, rows) in texts.items()) # code => (relation, id, text_en, dagger, reference) rows
+    self.references = dict((code, tuple(rows)) for (code, rows) in references.items()) # referenced code => (code, relation, id, text_en, dagger) rows
+    
+    if _HAS_INTERVALS: # Codes sorted by interval_start, for bisect
+      i = _ROW_INDEX["interval_start"]
+      self.interval_codes  = sorted(self.rows, key = lambda code: self.rows[code][i])
+      self.interval_starts = [self.rows[code][i] for code in self.interval_codes]
+      
+  def is_visible(self, code): return ATIH_EXTENSION or not self.rows[code][_ROW_INDEX["atih_extension"]]
+  
+  def all_codes(self): return [code for code in self.rows if self.is_visible(code)]
+  
+  def children_codes(self, code): return [child for child in self.children.get(code, ()) if self.is_visible(child)]
+  
+  def interval_end_at(self, start):
+    i = bisect.bisect_left(self.interval_starts, start)
+    if (i < len(self.interval_starts)) and (self.interval_starts[i] == start): return self.rows[self.interval_codes[i]][_ROW_INDEX["interval_end"]]
+    return None
+  
+  def codes_in_interval(self, start, end):
+    i = bisect.bisect_left (self.interval_starts, start)
+    j = bisect.bisect_right(self.interval_starts, end)
+    return [code for code in self.interval_codes[i:j] if self.is_visible(code)]
+  
+  def relation_texts(self, code, relation):
+    return [(id, text_en, text_en, dagger, reference) for (relation2, id, text_en, dagger, reference) in self.texts.get(code, ()) if relation2 == relation]
+  
+  
+def _merge_intervals(intervals):
+  # Sorts the given (start, end) intervals, and merges those that overlap or are adjacent.
+  r = []
+  for start, end in sorted(intervals):
+    if r and (start <= r[-1][1] + 1):
+      if end > r[-1][1]: r[-1] = (r[-1][0], end)
+    else: r.append((start, end))
+  return r
+
+def _intersect_intervals(intervals1, intervals2):
+  r = []
+  i = j = 0
+  while (i < len(intervals1)) and (j < len(intervals2)):
+    start = max(intervals1[i][0], intervals2[j][0])
+    end   = min(intervals1[i][1], intervals2[j][1])
+    if start <= end: r.append((start, end))
+    if intervals1[i][1] < intervals2[j][1]: i += 1
+    else:                                   j += 1
+  return r
+
+def _subtract_intervals(intervals1, intervals2):
+  r = []
+  for start, end in intervals1:
+    for start2, end2 in intervals2:
+      if end2 < start: continue
+      if start2 > end: break
+      if start2 > start: r.append((start, start2 - 1))
+      start = end2 + 1
+      if start > end: break
+    if start <= end: r.append((start, end))
+  return r
+
+class ICD10Range(object):
+  """A set of ICD10 concepts defined by ranges of codes, as returned by :meth:`ICD10.range`. It behaves as a read-only set of concepts.
+It relies on the nested interval numbering of ICD10 concepts: membership is tested without query, and the concepts are obtained by scanning the interval index.
+
+ICD10Ranges can be combined with | (union), & (intersection) and - (difference).
+
+.. attribute:: intervals
+
+   The sorted list of the disjoint (start, end) intervals of interval numbers (see interval_start in :class:`ICD10Concept`) covered by the range.
+"""
+  def __init__(self, intervals):
+    self.intervals = _merge_intervals(intervals)
+    self._starts   = [start for (start, end) in self.intervals]
+    
+  def __repr__(self): return "<ICD10Range %s>" % " ".join("%s-%s" % interval for interval in self.intervals)
+  
+  def __contains__(self, concept):
+    if not isinstance(concept, pymedtermino.Concept):
+      try: concept = ICD10.get(concept)
+      except (ValueError, TypeError): return False
+    if (getattr(concept, "terminology", None) is not ICD10) or (getattr(concept, "interval_start", None) is None): return False # Not ICD10, or dagger + star
+    if (not ATIH_EXTENSION) and concept.atih_extension: return False
+    i = bisect.bisect_right(self._starts, concept.interval_start) - 1
+    return (i >= 0) and (concept.interval_start <= self.intervals[i][1])
+  
+  def __len__(self): return sum(ICD10._count_concepts_in_interval(start, end) for (start, end) in self.intervals)
+  
+  def __iter__(self):
+    for start, end in self.intervals:
+      for concept in ICD10._concepts_in_interval(start, end): yield concept
+      
+  def __eq__(self, other): return isinstance(other, ICD10Range) and (self.intervals == other.intervals)
+  def __ne__(self, other): return not self == other
+  def __hash__(self): return hash(tuple(self.intervals))
+  
+  def __or__ (self, other): return ICD10Range(self.intervals + other.intervals)
+  def __and__(self, other): return ICD10Range(_intersect_intervals(self.intervals, other.intervals))
+  def __sub__(self, other): return ICD10Range(_subtract_intervals(self.intervals, other.intervals))
+  
+  def codes(self):
+    """Returns the list of the codes of the concepts in the range, in the order of the classification, without loading the concepts."""
+    return [code for (start, end) in self.intervals for code in ICD10._codes_in_interval(start, end)]
+  
+  def concepts(self):
+    """Returns the set (:class:`pymedtermino.Concepts`) of the concepts in the range."""
+    return pymedtermino.Concepts(self)
+  
+  
 class Text(object):
-  """A text in an ICD10 definition for a concept (for example, an exclusion, and inclusion, etc)."""
+  """A text in an ICD10 definition for a concept (for example, an exclusion, and inclusion, etc).
+
+.. attribute:: reference
+
+   The concept the text refers to (e.g. the concept excluded, for an exclusion), or None. It is loaded on first access.
+
+.. attribute:: reference_code
+
+   The code of the concept the text refers to, or None.
+"""
   
   def __init__(self, id, concept, relation, text, text_en, dagger, reference):
-    self.id       = id
-    self.concept  = concept
-    self.relation = relation
-    self.text     = text or text_en
-    self.dagger   = dagger
-    if reference: self.reference = ICD10[reference]
-    else:         self.reference = None
+    self.id             = id
+    self.concept        = concept
+    self.relation       = relation
+    self.text           = text or text_en
+    self.dagger         = dagger
+    self.reference_code = reference or None
     
+  def _get_reference(self):
+    if self.reference_code is None: return None
+    if not "_reference" in self.__dict__: self._reference = ICD10[self.reference_code]
+    return self._reference
+  reference = property(_get_reference)
+  
   def get_translation(self, language):
     """Translates this text in the given language."""
     db_cursor.execute(_TEXT1, (self.id,))
@@ -134,26 +496,49 @@ class ICD10Concept(pymedtermino.MonoaxialConcept, pymedtermino._StringCodeConcep
 
 Additional attributes can be available, and are listed in the :attr:`relations <pymedtermino.Concept.relations>` attribute.
 
+The whole row of the concept in the database is loaded with the concept (by a single query, or by a few queries for many concepts with :meth:`get_many <pymedtermino.Terminology.get_many>`),
+and the attributes above are obtained from it.
+
 """
-  def __init__(self, code):
+  def __init__(self, code, r = None):
     if code.startswith(u"("): code = code[1:-1]
-    db_cursor.execute(_CONCEPT[pymedtermino.LANGUAGE], (code,))
-    r = db_cursor.fetchone()
-    if not r:
-      raise ValueError(code)
+    if r is None:
+      if _MEMORY: r = _MEMORY.rows.get(code)
+      else:
+        db_cursor.execute(_CONCEPT, (code,))
+        r = db_cursor.fetchone()
+      if not r:
+        raise ValueError(code)
+    self._row        = r
     self.parent_code = r[0]
-    term             = r[1]
-    if not term:
-      db_cursor.execute("SELECT term_en FROM Concept WHERE code=?", (code,))
-      term = db_cursor.fetchone()[0]
-    pymedtermino.MonoaxialConcept.__init__(self, code, term)
+    if _HAS_INTERVALS: self.interval_start, self.interval_end = r[_ROW_INDEX["interval_start"]], r[_ROW_INDEX["interval_end"]]
+    pymedtermino.MonoaxialConcept.__init__(self, code, r[_ROW_INDEX.get("term_%s" % pymedtermino.LANGUAGE, 1)] or r[1]) # Defaults to English
     
   def __getattr__(self, attr):
+    if self.terminology.snapshot and (attr in self.terminology.snapshot.attrs) and self.terminology._from_snapshot(self, attr): return self.__dict__[attr]
     if   attr == "parents":
       if self.parent_code == "": return []
       self.parents = [self.terminology[self.parent_code]]
       return self.parents
     
+    elif attr in _ROW_ATTRS:
+      setattr(self, attr, self._row[_ROW_INDEX[attr]])
+      return getattr(self, attr)
+    
+    elif attr == "atih_extension":
+      self.atih_extension = bool(self._row[_ROW_INDEX["atih_extension"]])
+      return self.atih_extension
+    
+    elif attr in _HIERARCHY_STATS_ATTRS:
+      if _HAS_HIERARCHY_STATS:
+        self._set_hierarchy_stats([self._row[_ROW_INDEX[column]] for column in ["depth", "descendant_count", "information_content"]])
+      else:
+        db_cursor.execute("SELECT COUNT(*) FROM Concept WHERE atih_extension = 0")
+        self._set_hierarchy_stats(pymedtermino._hierarchy_stats(self, db_cursor.fetchone()[0]))
+      return getattr(self, attr)
+    
+    elif _MEMORY: return self._getattr_from_memory(attr)
+    
     elif attr == "children":
       if ATIH_EXTENSION: atih = ""
       else:              atih = _ATIH
@@ -168,38 +553,59 @@ Additional attributes can be available, and are listed in the :attr:`relations <
       self.relations = set(i for (i,) in db_cursor.fetchall())
       return self.relations
     
-    elif (attr == "dagger") or (attr == "star"):
-      db_cursor.execute("SELECT dagger, star FROM Concept WHERE code=?", (self.code,))
-      self.dagger, self.star = db_cursor.fetchone()
-      return getattr(self, attr)
-    
-    elif (attr == "morbidity") or (attr.startswith("mortality")):
-      db_cursor.execute("SELECT morbidity, mortality1, mortality2, mortality3, mortality4 FROM Concept WHERE code=?", (self.code,))
-      self.morbidity, self.mortality1, self.mortality2, self.mortality3, self.mortality4 = db_cursor.fetchall()
-      return getattr(self, attr)
-    
-    elif attr == "atih_extension":
-      db_cursor.execute("SELECT atih_extension FROM Concept WHERE code=?", (self.code,))
-      self.atih_extension = bool(db_cursor.fetchall())
-      return self.atih_extension
-    
-    elif attr == "pmsi_restriction":
-      db_cursor.execute("SELECT pmsi_restriction FROM Concept WHERE code=?", (self.code,))
-      self.pmsi_restriction = db_cursor.fetchall()
-      return self.pmsi_restriction
-      
-      
     else:
-      db_cursor.execute(_TEXT2, (self.code, attr))
-      l = [Text(id, self, attr, text, text_en, dagger, reference) for (id, text, text_en, dagger, reference) in db_cursor.fetchall()]
+      if ("relations" in self.__dict__) and not (attr in self.relations): l = [] # No text for this relation
+      else:
+        db_cursor.execute(_TEXT2, (self.code, attr))
+        l = [Text(id, self, attr, text, text_en, dagger, reference) for (id, text, text_en, dagger, reference) in db_cursor.fetchall()]
       setattr(self, attr, l)
       return l
     
     raise AttributeError(attr)
   
+  def _getattr_from_memory(self, attr):
+    # As __getattr__, when ICD10 is loaded in memory.
+    if   attr == "children":
+      self.children = [self.terminology[code] for code in _MEMORY.children_codes(self.code)]
+      return self.children
+    
+    elif attr == "terms": return [self.term]
+    
+    elif attr == "relations":
+      self.relations = set(relation for (relation, id, text_en, dagger, reference) in _MEMORY.texts.get(self.code, ()))
+      return self.relations
+    
+    l = [Text(id, self, attr, text, text_en, dagger, reference) for (id, text, text_en, dagger, reference) in _MEMORY.relation_texts(self.code, attr)]
+    setattr(self, attr, l)
+    return l
+  
+  def referencing_texts(self, relation = None):
+    """Returns the list of the texts (:class:`Text`) of other concepts that refer to this concept, for all relations or only the given one,
+using the index of text references (a single query). For example, [text.concept for text in concept.referencing_texts("exclusion")]
+are the concepts that exclude this concept."""
+    if _MEMORY:
+      rows = _MEMORY.references.get(self.code, ())
+    else:
+      db_cursor.execute(_REFERENCING_TEXTS, (self.code,))
+      rows = db_cursor.fetchall()
+    rows     = [row for row in rows if (relation is None) or (row[1] == relation)]
+    concepts = self.terminology.get_many(set(row[0] for row in rows))
+    return [Text(id, concepts[code], relation2, text_en, text_en, dagger, self.code) for (code, relation2, id, text_en, dagger) in rows if code in concepts]
+  
   def get_translation(self, language):
+    if ("term_%s" % language) in _ROW_INDEX: return self._row[_ROW_INDEX["term_%s" % language]]
     db_cursor.execute("SELECT term_%s FROM Concept WHERE code=?" % language, (self.code,))
     return db_cursor.fetchone()[0]
+  
+  def _set_hierarchy_stats(self, stats):
+    self.depth, self._descendant_count, self.information_content = stats
+    
+  def _get_descendant_count(self):
+    if _HAS_HIERARCHY_STATS:
+      if not "_descendant_count" in self.__dict__: self.depth # Loads the hierarchy stats
+      return self._descendant_count
+    return pymedtermino.MonoaxialConcept._get_descendant_count(self)
+  descendant_count = property(_get_descendant_count)
 
   
 class ICD10DaggerStarConcept(pymedtermino.MonoaxialConcept, pymedtermino._StringCodeConcept):
@@ -236,3 +642,5 @@ class ICD10DaggerStarConcept(pymedtermino.MonoaxialConcept, pymedtermino._String
 ICD10 = ICD10()
 
 ICD10Concept.terminology = ICD10DaggerStarConcept.terminology = ICD10
+
+if LOAD_ALL: ICD10.load_all()
@@ -48,14 +48,16 @@ import sys, os, os.path
 import pymedtermino
 
 
-db        = pymedtermino.connect_sqlite3("meddra")
+db        = pymedtermino.connect_sqlite3("meddra", pragmas = ["PRAGMA synchronous  = OFF;", "PRAGMA journal_mode = OFF;"])
 db_cursor = db.cursor()
-db_cursor.execute("PRAGMA synchronous  = OFF;")
-db_cursor.execute("PRAGMA journal_mode = OFF;")
 
 import atexit
 atexit.register(db.close)
 
+db_cursor.execute("PRAGMA table_info(Concept)")
+_HAS_HIERARCHY_STATS = "information_content" in [column[1] for column in db_cursor.fetchall()] # False for databases built by older versions of PyMedTermino
+_HAS_FTS5 = pymedtermino._is_fts5(db_cursor, "Concept_fts") # False for databases built by older versions of PyMedTermino (FTS4, no ranking)
+
 class MEDDRA(pymedtermino.Terminology):
   def __init__(self):
     pymedtermino.Terminology.__init__(self, "MEDDRA")
@@ -65,6 +67,11 @@ class MEDDRA(pymedtermino.Terminology):
     
   def _create_Concept(self): return MEDDRAConcept
   
+  def _all_codes(self):
+    if pymedtermino.REMOVE_SUPPRESSED_CONCEPTS: db_cursor.execute("SELECT code FROM Concept WHERE active")
+    else:                                       db_cursor.execute("SELECT code FROM Concept")
+    return [code for (code,) in db_cursor.fetchall()]
+  
   def first_levels(self):
     db_cursor.execute("SELECT Concept.code FROM Concept WHERE Concept.depth = 0")
     db_cursor.execute("SELECT Concept.code FROM Concept_SOC, Concept WHERE Concept.id = Concept_SOC.id ORDER BY Concept_SOC.international_order")
@@ -77,19 +84,55 @@ class MEDDRA(pymedtermino.Terminology):
       if concept: concepts.append(concept)
     return concepts
     
-  def search(self, text):
-    if pymedtermino.REMOVE_SUPPRESSED_CONCEPTS:
-      db_cursor.execute("SELECT DISTINCT Concept.code FROM Concept, Concept_fts WHERE (Concept_fts.term MATCH ?) AND (Concept.id = Concept_fts.docid) AND (Concept.active = 1)", (text,))
+  def search(self, text, limit = None, offset = 0, rank = False, active_only = None, semantic_tag = None):
+    return self._hits_concepts(self.search_hits(text, limit, offset, rank, active_only, semantic_tag))
+  
+  def search_hits(self, text, limit = None, offset = 0, rank = True, active_only = None, semantic_tag = None):
+    if active_only is None: active_only = pymedtermino.REMOVE_SUPPRESSED_CONCEPTS
+    rank = rank and _HAS_FTS5
+    if rank: score = "-bm25(Concept_fts)"
+    else:    score = "NULL"
+    if _HAS_FTS5: sql = "SELECT Concept.code AS code, Concept_fts.term AS term, %s AS score, Concept_fts.rowid AS position FROM Concept, Concept_fts WHERE (Concept_fts MATCH ?) AND (Concept.code = Concept_fts.code)" % score
+    else:         sql = "SELECT Concept.code AS code, Concept.term_en AS term, %s AS score, Concept_fts.rowid AS position FROM Concept, Concept_fts WHERE (Concept_fts.term MATCH ?) AND (Concept.id = Concept_fts.rowid)" % score
+    args = [text]
+    if active_only: sql += " AND (Concept.active = 1)"
+    if semantic_tag: # MedDRA level, e.g. "PT"
+      if not semantic_tag.upper() in _TYPE_2_DEPTH: raise ValueError("Unknown MedDRA level '%s'!" % semantic_tag)
+      sql += " AND (Concept.depth = ?)"
+      args.append(_TYPE_2_DEPTH[semantic_tag.upper()])
+    return pymedtermino._search_hits(self, db, pymedtermino._search_sql(sql, rank), args, limit, offset)
+  
+  def _prefetch(self, concepts, attr):
+    if   attr == "parents":
+      if pymedtermino.REMOVE_SUPPRESSED_CONCEPTS:
+        sql = "SELECT child, parent FROM IsA, Concept WHERE (child IN (%s)) AND (Concept.code = child) AND (Concept.active)"
+      else:
+        sql = "SELECT child, parent FROM IsA WHERE child IN (%s)"
+    elif attr == "children":
+      if pymedtermino.REMOVE_SUPPRESSED_CONCEPTS:
+        sql = "SELECT parent, child FROM IsA, Concept WHERE (parent IN (%s)) AND (Concept.code = child) AND (Concept.active)"
+      else:
+        sql = "SELECT parent, child FROM IsA WHERE parent IN (%s)"
+    elif ((attr == "descendant_count") or (attr == "information_content")) and _HAS_HIERARCHY_STATS:
+      stats = pymedtermino._fetch_grouped(db_cursor, "SELECT code, descendant_count, information_content FROM Concept WHERE code IN (%s)", [concept.code for concept in concepts])
+      for concept in concepts:
+        if concept.code in stats: concept.descendant_count, concept.information_content = stats[concept.code][0]
+      return
     else:
-      db_cursor.execute("SELECT DISTINCT Concept.code FROM Concept, Concept_fts WHERE (Concept_fts.term MATCH ?) AND (Concept.id = Concept_fts.docid)", (text,))
-    r = db_cursor.fetchall()
-    l = []
-    for (code,) in r:
-      try: l.append(self[code])
-      except ValueError: pass
-    return l
+      return pymedtermino.Terminology._prefetch(self, concepts, attr)
+    self._set_prefetched(concepts, attr, pymedtermino._fetch_grouped(db_cursor, sql, [concept.code for concept in concepts], distinct = 0))
+    
+  def _load_many(self, codes):
+    r = {}
+    for chunk in pymedtermino._chunks(codes):
+      db_cursor.execute(_CONCEPTS[pymedtermino.LANGUAGE] % pymedtermino._sql_params(len(chunk)), chunk)
+      for row in db_cursor.fetchall():
+        try:               r[row[0]] = self.dict.get(row[0]) or MEDDRAConcept(row[0], row[1:])
+        except ValueError: pass
+    return r
 
 _DEPTH_2_TYPE = { 0 : "SOC", 1 : "HLGT", 2 : "HLT", 3 : "PT", 4 : "LLT" }
+_TYPE_2_DEPTH = dict((type, depth) for (depth, type) in _DEPTH_2_TYPE.items())
 
 
 class MEDDRAConcept(pymedtermino.MultiaxialConcept, pymedtermino._StringCodeConcept):
@@ -118,10 +161,11 @@ Additional attributes are available for relations, and are listed in the :attr:`
    The primary SOC associated to a PT (only available for PT).
 """
   
-  def __init__(self, code):
-    db_cursor.execute(_CONCEPT[pymedtermino.LANGUAGE], (code,))
-    r = db_cursor.fetchone()
-    if not r: raise ValueError()
+  def __init__(self, code, r = None):
+    if r is None:
+      db_cursor.execute(_CONCEPT[pymedtermino.LANGUAGE], (code,))
+      r = db_cursor.fetchone()
+      if not r: raise ValueError()
     self.sql_id, term, self.depth, self.active = r
     
     if pymedtermino.REMOVE_SUPPRESSED_CONCEPTS and not self.active: raise ValueError()
@@ -135,6 +179,7 @@ Additional attributes are available for relations, and are listed in the :attr:`
   meddra_type = property(_get_meddra_type)
   
   def __getattr__(self, attr):
+    if self.terminology.snapshot and (attr in self.terminology.snapshot.attrs) and self.terminology._from_snapshot(self, attr): return self.__dict__[attr]
     if   attr == "parents":
       if pymedtermino.REMOVE_SUPPRESSED_CONCEPTS:
         db_cursor.execute("SELECT parent FROM IsA, Concept WHERE (child=?) AND (Concept.code = child) AND (Concept.active)", (self.code,))
@@ -177,6 +222,15 @@ Additional attributes are available for relations, and are listed in the :attr:`
     elif attr == "terms":
       return [self.term]
       
+    elif (attr == "descendant_count") or (attr == "information_content"):
+      if _HAS_HIERARCHY_STATS:
+        db_cursor.execute("SELECT descendant_count, information_content FROM Concept WHERE id=?", (self.sql_id,))
+        self.descendant_count, self.information_content = db_cursor.fetchone()
+      else:
+        db_cursor.execute("SELECT COUNT(*) FROM Concept WHERE active")
+        self.descendant_count, self.information_content = pymedtermino._hierarchy_stats(self, db_cursor.fetchone()[0], lambda concept: concept.active)[1:]
+      return getattr(self, attr)
+      
     raise AttributeError(attr)
   
   def get_translation(self, language):
@@ -188,8 +242,12 @@ Additional attributes are available for relations, and are listed in the :attr:`
 MEDDRA = MEDDRA()
 
 
-_CONCEPT = {}
+_CONCEPT  = {}
+_CONCEPTS = {}
 for lang in MEDDRA.langs:
-  _CONCEPT[lang] = "SELECT id, term_%s, depth, active FROM Concept WHERE code=?" % lang
+  _CONCEPT [lang] = "SELECT id, term_%s, depth, active FROM Concept WHERE code=?" % lang
+  _CONCEPTS[lang] = "SELECT code, id, term_%s, depth, active FROM Concept WHERE code IN (%%s)" % lang
 
-if not pymedtermino.LANGUAGE in _CONCEPT: _CONCEPT[pymedtermino.LANGUAGE] = _CONCEPT["en"]
+if not pymedtermino.LANGUAGE in _CONCEPT:
+  _CONCEPT [pymedtermino.LANGUAGE] = _CONCEPT ["en"]
+  _CONCEPTS[pymedtermino.LANGUAGE] = _CONCEPTS["en"]
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+# PyMedTermino
+# Copyright (C) 2012-2013 Jean-Baptiste LAMY
+# LIMICS (Laboratoire d'informatique médicale et d'ingénierie des connaissances en santé), UMR_S 1142
+# University Paris 13, Sorbonne paris-Cité, Bobigny, France
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Micro-benchmarks for PyMedTermino.
+#
+# Usage: python benchmark.py <benchmark> [<benchmark arguments>...]
+# Run without argument for listing the available benchmarks.
+
+from __future__ import print_function
+
+import sys, time
+import pymedtermino
+
+BENCHMARKS = []
+def benchmark(func):
+  BENCHMARKS.append(func)
+  return func
+
+def timed(label, func, repeat = 3):
+  best = None
+  for i in range(repeat):
+    t0 = time.time()
+    r  = func()
+    t  = time.time() - t0
+    if (best is None) or (t < best): best = t
+  print("  %-50s %10.4f s" % (label, best))
+  return best, r
+
+
+# Recursive reference implementations (as in previous versions), for comparison.
+
+def recursive_descendants_no_double(concept, already = None):
+  if already is None: already = set()
+  for child in concept.children:
+    if not child in already:
+      already.add(child)
+      yield child
+      for descendant in recursive_descendants_no_double(child, already):
+        yield descendant
+
+def recursive_descendants(concept):
+  for child in concept.children:
+    yield child
+    for descendant in recursive_descendants(child):
+      yield descendant
+
+
+@benchmark
+def hierarchy():
+  """Full descendant walks below SNOMEDCT[404684003] (clinical finding), recursive generators vs explicit stack."""
+  from pymedtermino.snomedct import SNOMEDCT
+  root = SNOMEDCT[404684003]
+  list(pymedtermino.MultiaxialConcept.descendants_no_double(root)) # Loads the concepts and their children, outside timing
+
+  t1, l1 = timed("recursive descendants_no_double", lambda: list(recursive_descendants_no_double(root)))
+  t2, l2 = timed("iter_depth_first(dedupe = True)", lambda: list(root.iter_depth_first("children", dedupe = True)))
+  t3, l3 = timed("iter_breadth_first(dedupe = True)", lambda: list(root.iter_breadth_first("children", dedupe = True)))
+  t4, l4 = timed("descendants_no_double (IsaClosure when available)", lambda: list(root.descendants_no_double()))
+  assert l1 == l2
+  assert set(l1) == set(l3) == set(l4)
+  print("  %s descendants, explicit stack speedup: x%.2f" % (len(l1), t1 / t2))
+
+  t1, l1 = timed("recursive descendants", lambda: list(recursive_descendants(root)))
+  t2, l2 = timed("iter_depth_first()", lambda: list(root.iter_depth_first("children")))
+  assert l1 == l2
+  print("  %s descendants (with doubles), explicit stack speedup: x%.2f" % (len(l1), t1 / t2))
+
+
+@benchmark
+def threads():
+  """SNOMED CT query throughput (children and terms of all concepts) with 1, 2, 4 and 8 threads."""
+  import threading
+  from pymedtermino.snomedct import SNOMEDCT, db_cursor
+  db_cursor.execute("SELECT id FROM Concept WHERE active=1")
+  codes = [code for (code,) in db_cursor.fetchall()][:20000]
+
+  def work(codes):
+    for code in codes:
+      concept = SNOMEDCT[code]
+      for attr in ("children", "terms"): # Reloaded each time, so as to measure the queries
+        concept.__dict__.pop(attr, None)
+        getattr(concept, attr)
+
+  for nb in [1, 2, 4, 8]:
+    ts = [threading.Thread(target = work, args = (codes[i::nb],)) for i in range(nb)]
+    t0 = time.time()
+    for t in ts: t.start()
+    for t in ts: t.join()
+    t = time.time() - t0
+    print("  %s thread(s): %10.0f concepts/s" % (nb, len(codes) / t))
+
+
+@benchmark
+def search(text = "fracture", page_size = 20):
+  """[<text> [<page size>]] SNOMED CT full-text search, all matching concepts vs the first page of ranked hits."""
+  from pymedtermino.snomedct import SNOMEDCT
+  page_size = int(page_size)
+  
+  def search_all():
+    SNOMEDCT.concept_cache.clear()
+    return SNOMEDCT.search(text)
+  def first_page():
+    SNOMEDCT.concept_cache.clear()
+    return [hit.concept for hit in SNOMEDCT.search_hits(text, limit = page_size)]
+  
+  t1, l1 = timed("search() (all concepts)", search_all)
+  t2, l2 = timed("search_hits(limit = %s), codes only" % page_size, lambda: [hit.code for hit in SNOMEDCT.search_hits(text, limit = page_size)])
+  t3, l3 = timed("search_hits(limit = %s), concepts" % page_size, first_page)
+  assert set(l3) <= set(l1)
+  print("  %s matching concepts, first page speedup: x%.2f" % (len(l1), t1 / t3))
+  
+  
+@benchmark
+def aio(rate = 1000):
+  """[<requests per second>] Latency (p50 / p99) of concurrent SNOMED CT requests in an asyncio event loop, blocking API vs pymedtermino.aio (Python 3 only)."""
+  from pymedtermino.scripts.benchmark_aio import run
+  run(float(rate))
+
+
+@benchmark
+def load(nb = 200000):
+  """[<number of rows>] Bulk insertion of RF2-like relationship rows in an in-memory database, one SQL string per row (as in previous import scripts) vs load_rows()."""
+  import sqlite3
+  from pymedtermino.utils.db import load_rows
+  nb   = int(nb)
+  rows = [(i, 20150131, 1, 900000000000207008, 1000000 + i, 1000000 + i // 2, 0, 116680003, 900000000000011006) for i in range(nb)]
+
+  def insert(load):
+    db = sqlite3.connect(":memory:")
+    db_cursor = db.cursor()
+    db_cursor.execute("CREATE TABLE Relationship (id BIGINT PRIMARY KEY, effectiveTime DATE, active INTEGER, moduleId BIGINT, sourceId BIGINT, destinationId BIGINT, relationshipGroup INTEGER, typeId BIGINT, characteristicTypeId BIGINT)")
+    load(db_cursor)
+    db.commit()
+    db.close()
+  def per_row(db_cursor):
+    for row in rows: db_cursor.execute(u"""INSERT INTO Relationship VALUES ("%s")""" % u'", "'.join([str(i) for i in row]))
+  def batched(db_cursor):
+    load_rows(db_cursor, "INSERT INTO Relationship VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", iter(rows))
+
+  t1, r = timed("execute() per row, SQL string", lambda: insert(per_row))
+  t2, r = timed("load_rows() (executemany by batches)", lambda: insert(batched))
+  print("  %s rows, %.0f vs %.0f rows/s, speedup: x%.2f" % (nb, nb / t1, nb / t2, t1 / t2))
+
+
+@benchmark
+def icd10_load_all(nb = 3):
+  """[<number of passes>] ICD10.load_all() load time and memory, and throughput of concept / hierarchy / attribute accesses on all concepts, from the database vs from memory."""
+  import gc
+  from pymedtermino.icd10 import ICD10
+  codes = ICD10._all_codes()
+  nb    = int(nb)
+
+  def work():
+    ICD10.concept_cache.clear()
+    gc.collect() # Concepts are no longer loaded
+    for i in range(nb):
+      for code in codes:
+        concept = ICD10[code]
+        concept.parents, concept.children, concept.dagger, concept.star, concept.depth, concept.exclusion
+
+  t1, r = timed("from the database", work, 1)
+
+  t0 = time.time()
+  ICD10.load_all()
+  t  = time.time() - t0
+  try:    import tracemalloc
+  except ImportError: tracemalloc = None # Python 2
+  if tracemalloc: # Loads again for measuring memory, since tracemalloc slows down allocations
+    ICD10.unload_all()
+    tracemalloc.start()
+    ICD10.load_all()
+    print("  load_all(): %.3f s, %.1f MB" % (t, tracemalloc.get_traced_memory()[0] / 1048576.0))
+    tracemalloc.stop()
+  else:
+    print("  load_all(): %.3f s" % t)
+
+  t2, r = timed("from memory (load_all())", work, 1)
+  ICD10.unload_all()
+  print("  %s concepts x %s passes, %.0f vs %.0f concepts/s, speedup: x%.2f" % (len(codes), nb, len(codes) * nb / t1, len(codes) * nb / t2, t1 / t2))
+
+
+@benchmark
+def icd10_range(start = "C00", end = "D48.9"):
+  """[<start code> <end code>] Expansion of an ICD10 range of codes and membership tests, tree walk from ICD10.first_levels() vs ICD10.range()."""
+  from pymedtermino.icd10 import ICD10
+  first, last = ICD10[start], ICD10[end]
+  concepts    = [concept for root in ICD10.first_levels() for concept in root.self_and_descendants()]
+
+  def walk():
+    r = []
+    for root in ICD10.first_levels():
+      for concept in root.self_and_descendants():
+        if (first.interval_start <= concept.interval_start) and (concept.interval_end <= last.interval_end): r.append(concept)
+    return r
+  t1, l1 = timed("expansion, tree walk", walk)
+  t2, l2 = timed("expansion, list(ICD10.range())", lambda: list(ICD10.range(start, end)))
+  assert l1 == l2
+  print("  %s concepts in range, speedup: x%.2f" % (len(l1), t1 / t2))
+
+  ancestors = set(ICD10.range(start, end, include_descendants = False))
+  r         = ICD10.range(start, end)
+  t1, n1 = timed("membership of all concepts, is_a()", lambda: len([concept for concept in concepts if [ancestor for ancestor in ancestors if concept.is_a(ancestor)]]))
+  t2, n2 = timed("membership of all concepts, in ICD10.range()", lambda: len([concept for concept in concepts if concept in r]))
+  assert n1 == n2
+  print("  %s concepts tested, speedup: x%.2f" % (len(concepts), t1 / t2))
+
+
+@benchmark
+def icd10_texts(relation = "exclusion"):
+  """[<relation>] Loading of the texts of a relation (e.g. exclusions) for all ICD10 concepts, one query per concept vs ICD10.load_texts(),
+and search of the texts referring to each concept, scan of all texts vs referencing_texts()."""
+  from pymedtermino.icd10 import ICD10
+  codes = ICD10._all_codes()
+
+  def per_concept():
+    ICD10.concept_cache.clear()
+    return [len(getattr(ICD10[code], relation)) for code in codes]
+  def batched():
+    ICD10.concept_cache.clear()
+    concepts = [ICD10[code] for code in codes]
+    ICD10.load_texts(concepts, [relation])
+    return [len(getattr(concept, relation)) for concept in concepts]
+  t1, l1 = timed("concept.%s, one query per concept" % relation, per_concept, 1)
+  t2, l2 = timed("ICD10.load_texts()", batched, 1)
+  assert l1 == l2
+  print("  %s concepts, %s texts, speedup: x%.2f" % (len(codes), sum(l1), t1 / t2))
+
+  concepts = [ICD10[code] for code in codes[:500]]
+  def scan():
+    texts = [text for code in codes for text in getattr(ICD10[code], relation)]
+    return [len([text for text in texts if text.reference_code == concept.code]) for concept in concepts]
+  t1, l1 = timed("referring texts, scan of all texts", scan, 1)
+  t2, l2 = timed("referring texts, referencing_texts()", lambda: [len(concept.referencing_texts(relation)) for concept in concepts], 1)
+  assert l1 == l2
+  print("  %s concepts, speedup: x%.2f" % (len(concepts), t1 / t2))
+
+
+@benchmark
+def icd10_search(text = "hypertension", page_size = 10):
+  """[<word> [<page size>]] Latency (mean / max) of ICD10 autocompletion queries (the successive prefixes of a word, first page of hits),
+in all languages, in the current language and on terms only."""
+  from pymedtermino.icd10 import ICD10
+  page_size = int(page_size)
+  prefixes  = [text[:i] for i in range(2, len(text) + 1)]
+
+  def latencies(**kargs):
+    ts = []
+    for p in prefixes:
+      t0 = time.time()
+      hits = list(ICD10.search_hits(p, limit = page_size, prefix = True, **kargs))
+      ts.append(time.time() - t0)
+    return sum(ts) / len(ts), max(ts), len(hits)
+  for label, kargs in [("all languages", {}), ("lang = %s" % pymedtermino.LANGUAGE, { "lang" : pymedtermino.LANGUAGE }), ("lang = %s, texts = False" % pymedtermino.LANGUAGE, { "lang" : pymedtermino.LANGUAGE, "texts" : False })]:
+    mean, max_, nb = latencies(**kargs)
+    print("  %-50s %8.2f ms %8.2f ms (%s hits for '%s')" % (label, mean * 1000.0, max_ * 1000.0, nb, text))
+
+
+if __name__ == "__main__":
+  names = sys.argv[1:]
+  if not names:
+    print("Available benchmarks:")
+    for func in BENCHMARKS: print("  %-15s %s" % (func.__name__, func.__doc__))
+    sys.exit()
+
+  for func in BENCHMARKS:
+    if func.__name__ == names[0]: break
+  else:
+    print("No such benchmark: %s!" % names[0])
+    sys.exit(1)
+  print("%s:" % names[0])
+  func(*names[1:])
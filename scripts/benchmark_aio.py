@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+# PyMedTermino
+# Copyright (C) 2012-2013 Jean-Baptiste LAMY
+# LIMICS (Laboratoire d'informatique médicale et d'ingénierie des connaissances en santé), UMR_S 1142
+# University Paris 13, Sorbonne paris-Cité, Bobigny, France
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Latency benchmark for the asyncio API (Python 3 only); run through "python benchmark.py aio [<requests per second>]".
+
+import asyncio, random, time
+import pymedtermino
+
+NB_REQUESTS = 3000
+
+def percentile(values, p):
+  values = sorted(values)
+  return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+def reset(concept):
+  for attr in ("children", "parents", "terms"): concept.__dict__.pop(attr, None)
+
+async def blocking_request(terminology, code):
+  concept = terminology.get(code)
+  reset(concept)
+  concept.children, concept.parents, concept.terms
+  len(list(concept.ancestors_no_double()))
+
+async def async_request(terminology, code):
+  concept = await terminology.aget(code)
+  reset(concept)
+  await concept.aload("children", "parents", "terms")
+  await pymedtermino.aio.run_in_executor(pymedtermino.aio._database(terminology), lambda: len(list(concept.ancestors_no_double())))
+
+async def heartbeat(lags, stop):
+  # Measures how long the event loop is stalled
+  while not stop:
+    t0 = time.time()
+    await asyncio.sleep(0.001)
+    lags.append(time.time() - t0 - 0.001)
+
+async def load(request, terminology, codes, rate):
+  loop      = asyncio.get_event_loop()
+  latencies = []
+  lags      = []
+  stop      = []
+  async def one(arrival, code):
+    delay = arrival - loop.time()
+    if delay > 0: await asyncio.sleep(delay)
+    await request(terminology, code)
+    latencies.append(loop.time() - arrival)
+  beat  = asyncio.ensure_future(heartbeat(lags, stop))
+  start = loop.time() + 0.1
+  await asyncio.gather(*[one(start + i / rate, code) for (i, code) in enumerate(codes)]) # Open loop: requests arrive at a fixed rate, whatever the latency
+  stop.append(1)
+  await beat
+  return latencies, lags
+
+def run(rate):
+  import pymedtermino.aio
+  from pymedtermino.snomedct import SNOMEDCT, db_cursor
+  db_cursor.execute("SELECT id FROM Concept WHERE active=1")
+  codes = [code for (code,) in db_cursor.fetchall()]
+  codes = [random.choice(codes) for i in range(NB_REQUESTS)]
+  
+  print("  %s requests at %s requests/s" % (NB_REQUESTS, rate))
+  for label, request in [("blocking API", blocking_request), ("asyncio API", async_request)]:
+    latencies, lags = asyncio.get_event_loop().run_until_complete(load(request, SNOMEDCT, codes, rate))
+    print("  %-13s latency p50 %8.2f ms, p99 %8.2f ms, max event loop stall %8.2f ms" % (
+      label, percentile(latencies, 50) * 1000.0, percentile(latencies, 99) * 1000.0, max(lags or [0.0]) * 1000.0))
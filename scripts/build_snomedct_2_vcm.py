@@ -397,8 +397,10 @@ if __name__ == "__main__":
   if "--all" in sys.argv:
     snomedct2vcm = {}
     all_icons    = set()
+    findings     = list(SNOMEDCT[404684003].self_and_descendants_no_double())
     nb = 0
-    for t in SNOMEDCT[404684003].self_and_descendants_no_double():
+    for t in findings:
+      if (nb % 1000) == 0: SNOMEDCT.load_relations(findings[nb : nb + 1000]) # One query per 1000 findings, instead of several per finding
       nb += 1
       snomedct2vcm[t] = snomedct_2_icons(t)
       if (nb % 1000) == 0:
@@ -409,7 +411,7 @@ if __name__ == "__main__":
     #f = open("/tmp/snomedct_2_vcm.txt", "w")
     s = u""
     nb = 0
-    for t in SNOMEDCT[404684003].self_and_descendants_no_double():
+    for t in findings:
       nb += 1
       for parent in t.parents:
         if snomedct2vcm[t] != snomedct2vcm.get(parent):
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# PyMedTermino
+# Copyright (C) 2012-2013 Jean-Baptiste LAMY
+# LIMICS (Laboratoire d'informatique médicale et d'ingénierie des connaissances en santé), UMR_S 1142
+# University Paris 13, Sorbonne paris-Cité, Bobigny, France
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+# Exports a memory-mapped graph snapshot of a terminology (see pymedtermino.snapshot).
+#
+# Usage: python export_snapshot.py <terminology module, e.g. snomedct> <snapshot file> [<relation>...]
+#
+# The snapshot includes is-a relations and the given other relations (e.g. finding_site).
+# It follows the current settings (e.g. PYMEDTERMINO_REMOVE_SUPPRESSED_RELATIONS), which must be the same when using the snapshot.
+
+from __future__ import print_function
+
+import sys, time, importlib
+import pymedtermino
+from pymedtermino.snapshot import export
+
+if len(sys.argv) < 3:
+  print("Usage: python export_snapshot.py <terminology module, e.g. snomedct> <snapshot file> [<relation>...]")
+  sys.exit(1)
+
+module      = importlib.import_module("pymedtermino.%s" % sys.argv[1])
+terminology = [o for o in vars(module).values() if isinstance(o, pymedtermino.Terminology)][0]
+
+t = time.time()
+export(terminology, sys.argv[2], sys.argv[3:])
+print("%s exported in %s in %.1f s." % (terminology.name, sys.argv[2], time.time() - t))
@@ -72,6 +72,8 @@ HERE = os.path.dirname(sys.argv[0]) or "."
 sys.path.append(os.path.join(HERE, ".."))
 
 from utils.db import *
+from utils.closure import *
+from utils.fts import *
 
 SQLITE_FILE = os.path.join(HERE, "..", "icd10.sqlite3")
 
@@ -105,7 +107,9 @@ CREATE TABLE Concept (
   mortality4 TEXT,
   morbidity TEXT,
   atih_extension INTEGER,
-  pmsi_restriction INTEGER
+  pmsi_restriction INTEGER,
+  interval_start INTEGER,
+  interval_end INTEGER
 )
 """)
 
@@ -136,6 +140,8 @@ class Concept(object):
     self.morbidity        = ""
     self.atih_extension   = 0
     self.pmsi_restriction = 0
+    self.interval_start   = 0
+    self.interval_end     = 0
     self.texts            = []
     CONCEPTS[code] = self
 
@@ -148,7 +154,7 @@ class Concept(object):
     if self.mortality3 == u"UNDEF": self.mortality3 = u""
     if self.mortality4 == u"UNDEF": self.mortality4 = u""
     if self.morbidity  == u"UNDEF": self.morbidity  = u""
-    return u"""(NULL, "%s", "%s", "%s", "%s", "%s", "%s", "%s", "%s", "%s", "%s", "%s", "%s", "%s")""" % (self.parent_code, self.code, sql_escape(self.term_en), sql_escape(self.term_fr), self.dagger, self.star, self.mortality1, self.mortality2, self.mortality3, self.mortality4, self.morbidity, self.atih_extension, self.pmsi_restriction)
+    return u"""(NULL, "%s", "%s", "%s", "%s", "%s", "%s", "%s", "%s", "%s", "%s", "%s", "%s", "%s", "%s", "%s")""" % (self.parent_code, self.code, sql_escape(self.term_en), sql_escape(self.term_fr), self.dagger, self.star, self.mortality1, self.mortality2, self.mortality3, self.mortality4, self.morbidity, self.atih_extension, self.pmsi_restriction, self.interval_start, self.interval_end)
 
   def sql_text(self):
     return [
@@ -292,7 +298,29 @@ if CIM10_DIR: # Optional French translation
       concept.pmsi_restriction = int(pmsi_restriction)
       
       
-for concept in CONCEPTS.values():
+# Nested interval numbering: interval_start is the concept's rank in a pre-order traversal of the hierarchy,
+# and interval_end the rank of its last descendant. Children are numbered in insertion order, so that
+# the numbering follows the order in which the Concept.children attribute lists them.
+
+CONCEPTS_IN_ORDER = list(CONCEPTS.values())
+CHILDREN = {}
+for concept in CONCEPTS_IN_ORDER: CHILDREN.setdefault(concept.parent_code, []).append(concept)
+
+rank = 0
+for root in CONCEPTS_IN_ORDER:
+  if root.parent_code in CONCEPTS: continue
+  stack = [(root, 0)]
+  while stack:
+    concept, visited = stack.pop()
+    if visited:
+      concept.interval_end = rank
+    else:
+      rank += 1
+      concept.interval_start = rank
+      stack.append((concept, 1))
+      for child in reversed(CHILDREN.get(concept.code, [])): stack.append((child, 0))
+      
+for concept in CONCEPTS_IN_ORDER:
   do_sql(u"INSERT INTO Concept VALUES %s" % concept.sql())
   
 for concept in CONCEPTS.values():
@@ -301,9 +329,16 @@ for concept in CONCEPTS.values():
 
 do_sql(u"""CREATE UNIQUE INDEX Concept_code_index ON Concept(code)""")
 do_sql(u"""CREATE INDEX Concept_parent_code_index ON Concept(parent_code)""")
+do_sql(u"""CREATE INDEX Concept_interval_start_index ON Concept(interval_start)""")
 
 do_sql(u"""CREATE INDEX Text_code_index          ON Text(code)""")
 do_sql(u"""CREATE INDEX Text_code_relation_index ON Text(code, relation)""")
+do_sql(u"""CREATE INDEX Text_reference_index     ON Text(reference)""")
+
+sys.stderr.write("Computing depth, descendant count and information content ...\n")
+
+# Descendant counts do not include ATIH extensions, as in ICD10Concept.descendant_count
+build_hierarchy_stats(db_cursor, "Concept", "code", edges = u"SELECT code, parent_code FROM Concept WHERE parent_code != ''", concept_condition = "atih_extension = 0")
 
 
 #do_sql(u"""CREATE VIRTUAL TABLE Concept_fts USING fts4(content="Concept", term_en, term_fr);""")
@@ -314,11 +349,9 @@ do_sql(u"""CREATE INDEX Text_code_relation_index ON Text(code, relation)""")
 #do_sql(u"""INSERT INTO Text_fts(docid, text_en) SELECT id, text_en FROM Text;""")
 #do_sql(u"""INSERT INTO Text_fts(Text_fts) VALUES('optimize');""")
 
-do_sql(u"""CREATE VIRTUAL TABLE Concept_fts USING fts4(content="Concept", term);""")
-do_sql(u"""INSERT INTO Concept_fts(docid, term) SELECT id, term_en FROM Concept;""")
-do_sql(u"""INSERT INTO Concept_fts(docid, term) SELECT id, term_fr FROM Concept;""")
-do_sql(u"""INSERT INTO Concept_fts(docid, term) SELECT Concept.id, Text.text_en FROM Text, Concept WHERE Concept.code = Text.code;""")
-do_sql(u"""INSERT INTO Concept_fts(Concept_fts) VALUES('optimize');""")
+build_icd10_fts(db_cursor)
+
+db.commit()
 
 do_sql(u"""VACUUM;""")
 
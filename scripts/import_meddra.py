@@ -34,6 +34,8 @@ sys.path.append(os.path.join(HERE, ".."))
 
 
 from utils.db import *
+from utils.closure import *
+from utils.fts import *
 
 if len(sys.argv) > 1:
   MEDDRA_DIRS = {}
@@ -202,10 +204,13 @@ do_sql(u"""CREATE INDEX Concept_depth_index            ON Concept    (depth)""")
 do_sql(u"""CREATE INDEX IsA_parent_index      ON IsA(parent)""")
 do_sql(u"""CREATE INDEX IsA_child_index       ON IsA(child)""")
 
+sys.stderr.write("Computing descendant count and information content ...\n")
 
-do_sql(u"""CREATE VIRTUAL TABLE Concept_fts USING fts4(content="Concept", term);""")
-for lang in LANGS:
-  do_sql(u"""INSERT INTO Concept_fts(docid, term) SELECT id, term_%s FROM Concept;""" % lang)
+# MedDRA depth (0 for SOC, ..., 4 for LLT) is already available
+build_hierarchy_stats(db_cursor, "Concept", "code", edges = u"SELECT child, parent FROM IsA", concept_condition = "active", depth = False)
+
+
+build_meddra_fts(db_cursor, LANGS)
 
 # ALREADY_DONE = set()
 # for depth in [4, 3, 2, 1, 0]:
@@ -217,9 +222,6 @@ for lang in LANGS:
 #       do_sql(u"""INSERT INTO Concept_fts(docid, term) VALUES ("%s", "%s")""" % (concept.code, sql_escape(term)))
 #       ALREADY_DONE.add(term)
 
-
-do_sql(u"""INSERT INTO Concept_fts(Concept_fts) VALUES('optimize');""")
-
 db.commit()
 
 do_sql(u"""VACUUM;""")
@@ -32,14 +32,21 @@ SNOMEDCT_CORE_FILE = "/home/jiba/telechargements/base_med/SNOMEDCT_CORE_SUBSET_2
 #ONLY_ACTIVE_CONCEPT = 1
 ONLY_ACTIVE_CONCEPT = 0
 
+# If 1, also computes the PartOrIsaClosure table (combined part-of / is-a closure), used by is_part_of(); it makes the database larger.
+PART_OR_ISA_CLOSURE = 1
 
-import sys, os, os.path, stat, sqlite3
+
+import sys, os, os.path, stat, sqlite3, time
 
 HERE = os.path.dirname(sys.argv[0])
 sys.path.append(os.path.join(HERE, ".."))
 
 
 from utils.db import *
+from utils.closure import *
+from utils.snomedct_derived import *
+from utils.fts import *
+from utils.rf2 import *
 
 if len(sys.argv) >= 3:
   SNOMEDCT_DIR       = sys.argv[1]
@@ -60,10 +67,6 @@ def do_sql(sql):
   #r.write(";\n")
   db_cursor.execute(sql)
   
-def sql_escape(s):
-  return s.replace(u'"', u'""').replace(u'\r', u'').replace(u'\x92', u"'")
-
-
 do_sql(u"PRAGMA synchronous  = OFF")
 do_sql(u"PRAGMA journal_mode = OFF")
 do_sql(u"PRAGMA locking_mode = EXCLUSIVE")
@@ -123,62 +126,30 @@ if SNOMEDCT_CORE_FILE:
   for line in open(SNOMEDCT_CORE_FILE).read().split("\n")[1:]:
     if line:
       words = line.split("|")
-      if words[7] == "False": CORE_IDS.add(words[0])
+      if words[7] == "False": CORE_IDS.add(int(words[0]))
 
 sys.stderr.write("%s SNOMED CT terms in CORE Problem list.\n" %  len(CORE_IDS))
 
-ACTIVE_CONCEPTS = set()
-
-for table, language_dependent in [
-    ("Concept"       , False),
-    ("TextDefinition", True),
-    ("Description"   , True),
-    ("Relationship"  , False),
-  ]:
-  if language_dependent:
-    filename = os.path.join(SNOMEDCT_DIR, "Snapshot", "Terminology", "sct2_%s_Snapshot-%s_INT_%s.txt" % (table, LANGUAGE, NB))
-  else:
-    filename = os.path.join(SNOMEDCT_DIR, "Snapshot", "Terminology", "sct2_%s_Snapshot_INT_%s.txt" % (table, NB))
-    
+# The RF2 files are read line by line, and inserted by large batches in a single transaction; indexes are created afterwards.
+t0 = time.time()
+nb = 0
+for table, language_dependent, types in TERMINOLOGY_TABLES:
+  filename = terminology_file(SNOMEDCT_DIR, "Snapshot", table, language_dependent, LANGUAGE, NB)
   sys.stderr.write("Importing %s ...\n" % filename)
   
-  for line in read_file(filename).split(u"\n")[1:]:
-    if line:
-      words = line.replace(u"\r", u"").split(u"\t")
-      
-      if   table == "Concept":
-        if words[2] == u"1": ACTIVE_CONCEPTS.add(words[0])
-        if words[0]in CORE_IDS: words.append("1")
-        else:                   words.append("0")
-        
-      #elif table == "Description":
-        #if not words[4] in ACTIVE_CONCEPTS:
-          #continue # Active description of an inactive concept...!
-          #words[2] = u"0"
-          
-      #elif table == "TextDefinition":
-        #if not words[4] in ACTIVE_CONCEPTS:
-          #continue # Active def of an inactive concept...!
-          #words[2] = u"0"
-        
-      #elif table == "Relationship":
-        #if (not words[4] in ACTIVE_CONCEPTS) or (not words[5] in ACTIVE_CONCEPTS):
-          #continue # Active relation with an inactive concept...!
-          #words[2] = u"0"
-          
-      #del words[1:3]
-      
-      if table == "Relationship": del words[-1] # modifierId is unused yet
-      
-      data = u"""("%s")""" % '", "'.join(map(sql_escape, words))
-      sql  = u"""INSERT INTO %s VALUES %s""" % (table, data)
-      do_sql(sql)
+  rows = read_rf2_file(filename, types)
+  if table == "Concept": rows = (row + (int(row[0] in CORE_IDS),) for row in rows)
+  nb += load_rows(db_cursor, u"INSERT INTO %s VALUES (%s)" % (table, ", ".join(["?"] * (len(types) + (table == "Concept")))), rows, table)
+  
+  if ONLY_ACTIVE_CONCEPT and (table == "Concept"):
+    do_sql(u"SELECT COUNT(*) FROM Concept WHERE active=1")
+    sys.stderr.write("%s active concepts\n" % db_cursor.fetchone()[0])
     
-  if ONLY_ACTIVE_CONCEPT and (table == "Concept"): sys.stderr.write("%s active concepts\n" % len(ACTIVE_CONCEPTS))
+db.commit()
+sys.stderr.write("%s rows imported in %.1f s (%.0f rows/s).\n" % (nb, time.time() - t0, nb / max(time.time() - t0, 1e-6)))
 
-  db.commit()
-  
 sys.stderr.write("Indexing ...\n")
+t0 = time.time()
 
 do_sql(u"""CREATE INDEX Description_conceptId_index             ON Description(conceptId)""")
 
@@ -186,16 +157,44 @@ do_sql(u"""CREATE INDEX TextDefinition_conceptId_index          ON TextDefinitio
 
 do_sql(u"""CREATE INDEX Relationship_sourceId_typeId_index      ON Relationship(sourceId, typeId)""")
 do_sql(u"""CREATE INDEX Relationship_destinationId_typeId_index ON Relationship(destinationId, typeId)""")
+sys.stderr.write("  %.1f s\n" % (time.time() - t0))
+
+
+sys.stderr.write("Computing is-a transitive closure ...\n")
+build_isa_closure(db_cursor)
+db.commit()
 
 
-do_sql(u"""CREATE VIRTUAL TABLE Description_fts USING fts4(content="Description", term);""")
-do_sql(u"""INSERT INTO Description_fts(docid, term) SELECT id, term FROM Description;""")
-do_sql(u"""INSERT INTO Description_fts(Description_fts) VALUES('optimize');""")
+sys.stderr.write("Computing part-of transitive closure ...\n")
+build_part_of_closure(db_cursor)
+if PART_OR_ISA_CLOSURE: build_part_or_isa_closure(db_cursor)
+db.commit()
+
+
+sys.stderr.write("Computing depth, descendant count and information content ...\n")
+build_concept_stats(db_cursor)
+db.commit()
+
+
+sys.stderr.write("Indexing the relations of clinical findings ...\n")
+build_finding_relationship(db_cursor)
+db.commit()
+
+
+REFSET_DIR = os.path.join(SNOMEDCT_DIR, "Snapshot", "Refset")
+if os.path.exists(REFSET_DIR):
+  sys.stderr.write("Importing reference sets ...\n")
+  # Other refsets (e.g. national ones) can be added later with import_snomedct_refsets.py
+  sys.stderr.write("%s refset members.\n" % import_refsets(db_cursor, REFSET_DIR))
+  db.commit()
+
 
-do_sql(u"""CREATE VIRTUAL TABLE TextDefinition_fts USING fts4(content="TextDefinition", term);""")
-do_sql(u"""INSERT INTO TextDefinition_fts(docid, term) SELECT id, term FROM TextDefinition;""")
-do_sql(u"""INSERT INTO TextDefinition_fts(TextDefinition_fts) VALUES('optimize');""")
+sys.stderr.write("Building full-text indexes ...\n")
+t0 = time.time()
+build_snomedct_fts(db_cursor)
+sys.stderr.write("  %.1f s\n" % (time.time() - t0))
 
+set_metadata(db_cursor, "release", NB) # Updated by update_snomedct.py
 db.commit()
 
 do_sql(u"""VACUUM;""")
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# PyMedTermino
+# Copyright (C) 2012-2013 Jean-Baptiste LAMY
+# LIMICS (Laboratoire d'informatique médicale et d'ingénierie des connaissances en santé), UMR_S 1142
+# University Paris 13, Sorbonne paris-Cité, Bobigny, France
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Adds RF2 reference sets (e.g. national or organisational simple refsets, or map refsets) to an existing SNOMED CT database,
+# without reimporting SNOMED CT. The refsets of the international release are already imported by import_snomedct.py.
+#
+# Usage: python import_snomedct_refsets.py <release directory or der2_*Refset_*Snapshot*.txt file>... [--sqlite <sqlite3 file>]
+
+from __future__ import print_function
+
+import sys, os, os.path, stat, time
+
+HERE = os.path.dirname(sys.argv[0])
+sys.path.append(os.path.join(HERE, ".."))
+
+from utils.db import *
+from utils.rf2 import *
+
+args = sys.argv[1:]
+if "--sqlite" in args:
+  i = args.index("--sqlite")
+  SQLITE_FILE = args[i + 1]
+  del args[i : i + 2]
+else:
+  SQLITE_FILE = os.path.join(HERE, "..", "snomedct.sqlite3")
+
+if not args:
+  print("Usage: python import_snomedct_refsets.py <release directory or der2_*Refset_*Snapshot*.txt file>... [--sqlite <sqlite3 file>]")
+  sys.exit(1)
+
+os.chmod(SQLITE_FILE, stat.S_IREAD | stat.S_IWRITE | stat.S_IRGRP | stat.S_IROTH)
+db        = create_db(SQLITE_FILE, new_db = 0)
+db_cursor = db.cursor()
+
+t  = time.time()
+nb = 0
+for path in args: nb += import_refsets(db_cursor, path)
+db.commit()
+
+close_db(db, SQLITE_FILE)
+print("%s refset members imported in %.1f s." % (nb, time.time() - t))
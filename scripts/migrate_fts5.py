@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+# PyMedTermino
+# Copyright (C) 2012-2013 Jean-Baptiste LAMY
+# LIMICS (Laboratoire d'informatique médicale et d'ingénierie des connaissances en santé), UMR_S 1142
+# University Paris 13, Sorbonne paris-Cité, Bobigny, France
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Migrates the full-text indexes of a database built by an older version of PyMedTermino from FTS4 to FTS5,
+# without reimporting the terminology. FTS5 is needed for ranking search results by relevance.
+# For ICD10, it also rebuilds the FTS5 indexes of older versions, for searching by language and source (terms vs texts), with accent folding.
+#
+# Usage: python migrate_fts5.py snomedct|icd10|meddra [<sqlite3 file>]
+
+from __future__ import print_function
+
+import sys, os, os.path, stat, time
+
+HERE = os.path.dirname(sys.argv[0])
+sys.path.append(os.path.join(HERE, ".."))
+
+from utils.db import *
+from utils.fts import *
+
+if (len(sys.argv) < 2) or (not sys.argv[1] in ("snomedct", "icd10", "meddra")):
+  print("Usage: python migrate_fts5.py snomedct|icd10|meddra [<sqlite3 file>]")
+  sys.exit(1)
+
+name = sys.argv[1]
+if len(sys.argv) >= 3: SQLITE_FILE = sys.argv[2]
+else:                  SQLITE_FILE = os.path.join(HERE, "..", "%s.sqlite3" % name)
+
+os.chmod(SQLITE_FILE, stat.S_IREAD | stat.S_IWRITE | stat.S_IRGRP | stat.S_IROTH)
+db        = create_db(SQLITE_FILE, new_db = 0)
+db_cursor = db.cursor()
+
+t = time.time()
+if   name == "snomedct":
+  build_snomedct_fts(db_cursor)
+elif name == "icd10":
+  build_icd10_fts(db_cursor)
+elif name == "meddra":
+  db_cursor.execute("SELECT lang FROM SupportedLanguage")
+  build_meddra_fts(db_cursor, [lang for (lang,) in db_cursor.fetchall()])
+db.commit()
+
+db_cursor.execute("VACUUM")
+close_db(db, SQLITE_FILE)
+print("%s full-text indexes migrated to FTS5 in %.1f s." % (name, time.time() - t))
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+# PyMedTermino
+# Copyright (C) 2012-2013 Jean-Baptiste LAMY
+# LIMICS (Laboratoire d'informatique médicale et d'ingénierie des connaissances en santé), UMR_S 1142
+# University Paris 13, Sorbonne paris-Cité, Bobigny, France
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Applies the Delta files of a SNOMED CT RF2 release to a database built by import_snomedct.py, instead of reimporting the full snapshot.
+#
+# The rows of the delta are upserted by id, unless the database already has a more recent version (effectiveTime).
+# The full-text indexes are updated row by row, and the derived tables (closures, depth and descendant counts, index of the relations of
+# clinical findings) are only recomputed for the concepts whose relations have changed, and their descendants / ancestors.
+# The release applied is recorded in the Metadata table.
+#
+# Usage: python update_snomedct.py <RF2 release directory> [<sqlite3 file>] [--force]
+# (--force applies the delta even if the database has the same or a more recent release)
+
+from __future__ import print_function
+
+import sys, os, os.path, stat, time
+
+HERE = os.path.dirname(sys.argv[0])
+sys.path.append(os.path.join(HERE, ".."))
+
+from utils.db import *
+from utils.fts import *
+from utils.rf2 import *
+from utils.snomedct_derived import *
+
+args  = sys.argv[1:]
+force = "--force" in args
+if force: args.remove("--force")
+if not args:
+  print("Usage: python update_snomedct.py <RF2 release directory> [<sqlite3 file>] [--force]")
+  sys.exit(1)
+
+SNOMEDCT_DIR = args[0]
+if len(args) >= 2: SQLITE_FILE = args[1]
+else:              SQLITE_FILE = os.path.join(HERE, "..", "snomedct.sqlite3")
+
+LANGUAGE = "en"
+NB       = SNOMEDCT_DIR.rstrip("/").split("_")[-1]
+if NB.endswith("/RF2Release"): NB = NB.replace("/RF2Release", "")
+
+os.chmod(SQLITE_FILE, stat.S_IREAD | stat.S_IWRITE | stat.S_IRGRP | stat.S_IROTH)
+db        = create_db(SQLITE_FILE, new_db = 0)
+db_cursor = db.cursor()
+
+def do_sql(sql, args = ()):
+  db_cursor.execute(sql, args)
+
+do_sql("PRAGMA synchronous  = OFF")
+do_sql("PRAGMA journal_mode = OFF")
+do_sql("PRAGMA locking_mode = EXCLUSIVE")
+
+release = get_metadata(db_cursor, "release")
+if release and (NB <= release) and not force:
+  print("The database already has release %s; use --force for applying the delta of release %s anyway." % (release, NB))
+  sys.exit(1)
+
+do_sql("SELECT name FROM sqlite_master WHERE type='table'")
+TABLES = set(name for (name,) in db_cursor.fetchall())
+
+def columns_of(table):
+  db_cursor.execute("PRAGMA table_info(%s)" % table)
+  return [column[1] for column in db_cursor.fetchall()]
+
+t_start = time.time()
+
+
+sys.stderr.write("Reading delta files ...\n")
+
+# _Delta<table>: the delta rows, except those that are older than the ones in the database
+DELTA_COLUMNS = {}
+for table, language_dependent, types in TERMINOLOGY_TABLES:
+  DELTA_COLUMNS[table] = columns = columns_of(table)[:len(types)]
+  do_sql("CREATE TEMP TABLE _Delta%s AS SELECT %s FROM %s WHERE 0" % (table, ", ".join(columns), table))
+  filename = terminology_file(SNOMEDCT_DIR, "Delta", table, language_dependent, LANGUAGE, NB)
+  if os.path.exists(filename):
+    sys.stderr.write("Reading %s ...\n" % filename)
+    load_rows(db_cursor, "INSERT INTO _Delta%s VALUES (%s)" % (table, ", ".join(["?"] * len(columns))), read_rf2_file(filename, types), table)
+  do_sql("CREATE INDEX temp._Delta%s_id_index ON _Delta%s(id)" % (table, table))
+  do_sql("DELETE FROM _Delta%s WHERE EXISTS (SELECT 1 FROM %s WHERE (%s.id = _Delta%s.id) AND (%s.effectiveTime > _Delta%s.effectiveTime))" % (table, table, table, table, table, table))
+  do_sql("SELECT COUNT(*) FROM _Delta%s" % table)
+  sys.stderr.write("  %s %s rows to apply\n" % (db_cursor.fetchone()[0], table))
+
+
+sys.stderr.write("Finding the concepts affected by the changes ...\n")
+
+# Sources of the relationships changed, before (in the database) and after (in the delta) the update
+do_sql("CREATE TEMP TABLE _ChangedRelationship AS SELECT sourceId, typeId FROM _DeltaRelationship UNION SELECT sourceId, typeId FROM Relationship WHERE id IN (SELECT id FROM _DeltaRelationship)")
+
+# The concepts whose closure rows may change are the sources of the changed relations and their descendants, in the closures before the update
+# (using the active=0 rows, which include the descendants through inactive relations as well).
+def affected(name, sql):
+  do_sql("CREATE TEMP TABLE %s (id PRIMARY KEY) WITHOUT ROWID" % name)
+  do_sql("INSERT OR IGNORE INTO %s %s" % (name, sql))
+  return "SELECT id FROM temp.%s" % name
+
+HAS_CLOSURE = "IsaClosure" in TABLES
+if HAS_CLOSURE:
+  isa_sources     = "SELECT sourceId FROM _ChangedRelationship WHERE typeId = %s" % IS_A
+  part_of_sources = "SELECT sourceId FROM _ChangedRelationship WHERE typeId = %s" % PART_OF
+  sources         = "%s UNION %s" % (isa_sources, part_of_sources)
+  ISA_AFFECTED = affected("_IsaAffected", "%s UNION SELECT descendant FROM IsaClosure WHERE (active = 0) AND (ancestor IN (%s))" % (isa_sources, isa_sources))
+  if "PartOfClosure" in TABLES:
+    PART_OF_AFFECTED = affected("_PartOfAffected", "%s UNION SELECT descendant FROM PartOfClosure WHERE (active = 0) AND (ancestor IN (%s))" % (part_of_sources, part_of_sources))
+  if "PartOrIsaClosure" in TABLES:
+    PART_OR_ISA_AFFECTED = affected("_PartOrIsaAffected", "%s UNION SELECT descendant FROM IsaClosure WHERE (active = 0) AND (ancestor IN (%s)) UNION SELECT descendant FROM PartOrIsaClosure WHERE (active = 0) AND (ancestor IN (%s))" % (sources, sources, sources))
+  FINDING_AFFECTED = affected("_FindingAffected", "SELECT sourceId FROM _ChangedRelationship WHERE typeId != %s UNION %s" % (IS_A, ISA_AFFECTED))
+  
+  # Depth and descendant counts change for the concepts whose is-a ancestors change, the concepts changed, and all their ancestors before and after the update
+  STATS_AFFECTED  = affected("_StatsAffected", "%s UNION SELECT id FROM _DeltaConcept" % ISA_AFFECTED)
+  stats_ancestors = "INSERT OR IGNORE INTO _StatsAffected SELECT ancestor FROM IsaClosure WHERE (active = 1) AND (descendant IN (SELECT id FROM _IsaAffected UNION SELECT id FROM _DeltaConcept))"
+  do_sql(stats_ancestors)
+  do_sql("SELECT COUNT(*) FROM _IsaAffected")
+  sys.stderr.write("  %s concepts with is-a changes (including descendants)\n" % db_cursor.fetchone()[0])
+
+
+sys.stderr.write("Updating tables ...\n")
+
+FTS_TABLES = []
+for table in ["Description", "TextDefinition"]:
+  if ("%s_fts" % table in TABLES) and is_fts5(db_cursor, "%s_fts" % table): FTS_TABLES.append(table)
+
+# External content FTS5 indexes: the previous versions of the rows are removed from the index before updating them
+for table in FTS_TABLES:
+  do_sql("INSERT INTO %s_fts(%s_fts, rowid, term) SELECT 'delete', id, term FROM %s WHERE id IN (SELECT id FROM _Delta%s)" % (table, table, table, table))
+
+for table, language_dependent, types in TERMINOLOGY_TABLES:
+  columns = DELTA_COLUMNS[table]
+  do_sql("UPDATE %s SET (%s) = (SELECT %s FROM _Delta%s WHERE _Delta%s.id = %s.id) WHERE id IN (SELECT id FROM _Delta%s)" % (table, ", ".join(columns[1:]), ", ".join(columns[1:]), table, table, table, table))
+  do_sql("INSERT INTO %s (%s) SELECT %s FROM _Delta%s WHERE id NOT IN (SELECT id FROM %s)" % (table, ", ".join(columns), ", ".join(columns), table, table))
+do_sql("UPDATE Concept SET is_in_core = 0 WHERE is_in_core IS NULL") # New concepts
+
+for table in FTS_TABLES:
+  do_sql("INSERT INTO %s_fts(rowid, term) SELECT id, term FROM %s WHERE id IN (SELECT id FROM _Delta%s)" % (table, table, table))
+
+
+sys.stderr.write("Updating derived tables ...\n")
+
+# Derived tables that are missing (databases built by older versions of PyMedTermino) are fully built; PartOrIsaClosure is optional.
+t0 = time.time()
+if HAS_CLOSURE:
+  build_isa_closure(db_cursor, ISA_AFFECTED)
+  if "PartOfClosure"    in TABLES: build_part_of_closure(db_cursor, PART_OF_AFFECTED)
+  else:                            build_part_of_closure(db_cursor)
+  if "PartOrIsaClosure" in TABLES: build_part_or_isa_closure(db_cursor, PART_OR_ISA_AFFECTED)
+  do_sql(stats_ancestors) # Ancestors after the update
+  build_concept_stats(db_cursor, STATS_AFFECTED)
+  if "FindingRelationship" in TABLES: build_finding_relationship(db_cursor, FINDING_AFFECTED)
+  else:                               build_finding_relationship(db_cursor)
+else:
+  build_isa_closure(db_cursor)
+  build_part_of_closure(db_cursor)
+  build_concept_stats(db_cursor)
+  build_finding_relationship(db_cursor)
+sys.stderr.write("  %.1f s\n" % (time.time() - t0))
+
+if len(FTS_TABLES) < 2: # No FTS5 index => built
+  sys.stderr.write("Building full-text indexes ...\n")
+  build_snomedct_fts(db_cursor)
+
+REFSET_DIR = os.path.join(SNOMEDCT_DIR, "Delta", "Refset")
+if os.path.exists(REFSET_DIR):
+  sys.stderr.write("Updating reference sets ...\n")
+  sys.stderr.write("%s refset members.\n" % import_refsets(db_cursor, REFSET_DIR, release_type = "Delta"))
+
+set_metadata(db_cursor, "release", NB)
+db.commit()
+
+do_sql("PRAGMA optimize")
+close_db(db, SQLITE_FILE)
+print("SNOMED CT database updated to release %s in %.1f s." % (NB, time.time() - t_start))
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+# PyMedTermino
+# Copyright (C) 2012-2013 Jean-Baptiste LAMY
+# LIMICS (Laboratoire d'informatique médicale et d'ingénierie des connaissances en santé), UMR_S 1142
+# University Paris 13, Sorbonne paris-Cité, Bobigny, France
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+pymedtermino.snapshot
+*********************
+
+Memory-mapped graph snapshots of terminology hierarchies.
+
+A snapshot stores the is-a relations of a terminology (and optionally other relations, such as SNOMED CT attribute relations)
+as compressed sparse row (CSR) adjacency arrays in a binary file. The file is memory-mapped, so several processes
+using the same snapshot share a single copy in the OS page cache.
+
+Once a terminology uses a snapshot, the parents and children attributes, the exported relation attributes and is_a()
+are computed from the snapshot instead of the database; concepts that are not in the snapshot still use the database.
+
+::
+
+  from pymedtermino.snapshot import export
+  export(SNOMEDCT, "/tmp/snomedct.csr", ["finding_site", "associated_morphology"])
+
+  # Later, in each worker process:
+  SNOMEDCT.use_snapshot("/tmp/snomedct.csr")
+
+The snapshot must be exported with the same settings (e.g. pymedtermino.REMOVE_SUPPRESSED_RELATIONS) as the ones used when loading it.
+See also the scripts/export_snapshot.py script.
+
+.. autofunction:: export
+.. autofunction:: load
+.. autoclass:: Snapshot
+   :members: index, code, related_codes, is_a, close
+"""
+
+__all__ = ["export", "load", "Snapshot"]
+
+import sys, mmap, array, struct, json, bisect
+import pymedtermino
+
+_MAGIC             = b"PYMTCSR1"
+_IS_A              = 0 # Relation type of is-a relations
+_EXPORT_CHUNK_SIZE = 2000
+
+def export(terminology, filename, relations = ()):
+  """Exports the is-a relations of the given terminology, and the given other relations (relation attribute names, e.g. "finding_site"), in a snapshot file.
+
+The relations are loaded with the terminology's set-at-a-time queries (see :meth:`pymedtermino.Concepts.prefetch`), and thus follow the current settings."""
+  relations  = list(relations)
+  attrs      = [("parents", "children", _IS_A)] + [(relation, "INVERSE_%s" % relation, i + 1) for i, relation in enumerate(relations)]
+  attr_names = [a for (attr, inverse_attr, relation_type) in attrs for a in (attr, inverse_attr)]
+  outs       = {} # code => [(relation type, code)] ; None if the relations cannot be loaded
+  ins        = {}
+  pending    = list(terminology._all_codes())
+  codes      = set(pending)
+  while pending:
+    chunk, pending = pending[: _EXPORT_CHUNK_SIZE], pending[_EXPORT_CHUNK_SIZE :]
+    concepts = list(terminology.get_many(chunk).values())
+    pymedtermino.Concepts(concepts).prefetch(*attr_names)
+    for concept in concepts:
+      for attr in attr_names:
+        if not attr in concept.__dict__: # Cannot be loaded (e.g. related to a removed concept) ; the database will be used for this concept
+          outs[concept.code] = ins[concept.code] = None
+          break
+      else:
+        out = outs[concept.code] = []
+        in_ = ins [concept.code] = []
+        for (attr, inverse_attr, relation_type) in attrs:
+          for (l, a) in [(out, attr), (in_, inverse_attr)]:
+            for related in concept.__dict__[a]:
+              l.append((relation_type, related.code))
+              if not related.code in codes:
+                codes.add(related.code)
+                pending.append(related.code)
+                
+  codes     = sorted(codes)
+  str_codes = bool(codes) and isinstance(codes[0], type(u""))
+  index     = dict((code, i) for i, code in enumerate(codes))
+  arrays    = []
+  if str_codes:
+    blobs        = [code.encode("utf8") for code in codes]
+    code_offsets = array.array("q", [0])
+    for blob in blobs: code_offsets.append(code_offsets[-1] + len(blob))
+    arrays.append(("code_offsets", code_offsets))
+    arrays.append(("code_blob", array.array("B", b"".join(blobs))))
+  else:
+    arrays.append(("codes", array.array("q", codes)))
+  arrays.append(("flags", array.array("B", [(outs.get(code) is not None) for code in codes])))
+  for name, code_2_relateds in [("out", outs), ("in", ins)]:
+    offsets = array.array("q", [0])
+    targets = array.array("i")
+    types   = array.array("H")
+    for code in codes:
+      for (relation_type, related_code) in code_2_relateds.get(code) or ():
+        targets.append(index[related_code])
+        types  .append(relation_type)
+      offsets.append(len(targets))
+    arrays.extend([("%s_offsets" % name, offsets), ("%s_targets" % name, targets), ("%s_types" % name, types)])
+
+  header = {
+    "terminology" : terminology.name,
+    "settings"    : terminology._snapshot_settings(),
+    "byteorder"   : sys.byteorder,
+    "str_codes"   : str_codes,
+    "relations"   : relations,
+    "arrays"      : [],
+  }
+  offset = 0
+  for name, a in arrays:
+    header["arrays"].append([name, a.typecode, offset, len(a)])
+    offset += _aligned(len(a) * a.itemsize)
+  header_data = json.dumps(header).encode("utf8")
+  start       = _aligned(len(_MAGIC) + 8 + len(header_data))
+
+  f = open(filename, "wb")
+  f.write(_MAGIC)
+  f.write(struct.pack("<Q", len(header_data)))
+  f.write(header_data)
+  f.write(b"\0" * (start - len(_MAGIC) - 8 - len(header_data)))
+  for name, a in arrays:
+    data = _tobytes(a)
+    f.write(data)
+    f.write(b"\0" * (_aligned(len(data)) - len(data)))
+  f.close()
+
+def load(filename):
+  """Loads (memory-maps) the given snapshot file, and returns a :class:`Snapshot`."""
+  return Snapshot(filename)
+
+class Snapshot(object):
+  """A memory-mapped snapshot, as written by :func:`export`. Use :meth:`pymedtermino.Terminology.use_snapshot` for using it with a terminology.
+
+.. attribute:: terminology_name
+
+   The name of the exported terminology.
+
+.. attribute:: attrs
+
+   The set of the concept attributes available in the snapshot (e.g. "parents", "children", "finding_site", "INVERSE_finding_site").
+"""
+  def __init__(self, filename):
+    self.filename = filename
+    self._file    = open(filename, "rb")
+    self._mmap    = mmap.mmap(self._file.fileno(), 0, access = mmap.ACCESS_READ)
+    if self._mmap[: len(_MAGIC)] != _MAGIC: raise ValueError("'%s' is not a PyMedTermino snapshot!" % filename)
+    header_size, = struct.unpack("<Q", self._mmap[len(_MAGIC) : len(_MAGIC) + 8])
+    header       = json.loads(self._mmap[len(_MAGIC) + 8 : len(_MAGIC) + 8 + header_size].decode("utf8"))
+    if header["byteorder"] != sys.byteorder: raise ValueError("Snapshot '%s' has been exported on a platform with a different byte order!" % filename)
+    self.terminology_name = header["terminology"]
+    self.settings         = header["settings"]
+    self.relations        = header["relations"]
+    self._str_codes       = header["str_codes"]
+    self._indexes         = {} # Cache for the codes looked up
+
+    self.attrs = set(["parents", "children"])
+    self._attr_2_type = { "parents" : (0, _IS_A), "children" : (1, _IS_A) }
+    for i, relation in enumerate(self.relations):
+      self.attrs.add(relation)
+      self.attrs.add("INVERSE_%s" % relation)
+      self._attr_2_type[relation]               = (0, i + 1)
+      self._attr_2_type["INVERSE_%s" % relation] = (1, i + 1)
+
+    start = _aligned(len(_MAGIC) + 8 + header_size)
+    for name, typecode, offset, length in header["arrays"]:
+      setattr(self, "_%s" % name, _array(self._mmap, typecode, start + offset, length))
+    if self._str_codes: self._nb = len(self._code_offsets) - 1
+    else:               self._nb = len(self._codes)
+    self._offsets = (self._out_offsets, self._in_offsets)
+    self._targets = (self._out_targets, self._in_targets)
+    self._types   = (self._out_types,   self._in_types)
+
+  def __repr__(self): return "<Snapshot %s of %s>" % (self.filename, self.terminology_name)
+
+  def __len__(self): return self._nb
+
+  def code(self, index):
+    """Returns the code of the concept of the given index."""
+    if self._str_codes:
+      return _tobytes(self._code_blob[self._code_offsets[index] : self._code_offsets[index + 1]]).decode("utf8")
+    return self._codes[index]
+
+  def index(self, code):
+    """Returns the index of the concept of the given code, or None if it is not in the snapshot."""
+    i = self._indexes.get(code, -1)
+    if i == -1: i = self._indexes[code] = self._index(code)
+    return i
+  
+  def _index(self, code):
+    # Binary search in the sorted codes.
+    if self._str_codes:
+      code = code.encode("utf8")
+      lo, hi = 0, self._nb
+      while lo < hi:
+        mid = (lo + hi) // 2
+        if _tobytes(self._code_blob[self._code_offsets[mid] : self._code_offsets[mid + 1]]) < code: lo = mid + 1
+        else:                                                                                           hi = mid
+      if (lo < self._nb) and (_tobytes(self._code_blob[self._code_offsets[lo] : self._code_offsets[lo + 1]]) == code): return lo
+      return None
+    i = bisect.bisect_left(self._codes, code)
+    if (i < self._nb) and (self._codes[i] == code): return i
+    return None
+
+  def related_codes(self, code, attr):
+    """Returns the list of the codes of the concepts related to the concept of the given code by the given attribute (e.g. "parents"),
+or None if they are not available in the snapshot."""
+    direction_type = self._attr_2_type.get(attr)
+    if direction_type is None: return None
+    i = self.index(code)
+    if (i is None) or (not self._flags[i]): return None
+    direction, relation_type = direction_type
+    offsets, targets, types  = self._offsets[direction], self._targets[direction], self._types[direction]
+    return [self.code(targets[j]) for j in range(offsets[i], offsets[i + 1]) if types[j] == relation_type]
+
+  def is_a(self, code1, code2):
+    """Returns True if the concept of code code1 is the concept of code code2 or one of its descendants, False if it is not,
+or None if it cannot be determined from the snapshot."""
+    i1 = self.index(code1)
+    i2 = self.index(code2)
+    if (i1 is None) or (i2 is None): return None
+    if i1 == i2: return True
+    offsets, targets, types = self._out_offsets, self._out_targets, self._out_types
+    already = set([i1])
+    stack   = [i1]
+    while stack:
+      i = stack.pop()
+      if not self._flags[i]: return None
+      for j in range(offsets[i], offsets[i + 1]):
+        if types[j] == _IS_A:
+          parent = targets[j]
+          if parent == i2: return True
+          if not parent in already:
+            already.add(parent)
+            stack.append(parent)
+    return False
+
+  def close(self):
+    """Closes the snapshot file."""
+    for name in list(self.__dict__):
+      if name.startswith("_") and isinstance(self.__dict__[name], memoryview): self.__dict__[name].release()
+    self._offsets = self._targets = self._types = None
+    self._mmap.close()
+    self._file.close()
+
+
+def _aligned(size): return (size + 7) // 8 * 8
+
+if sys.version[0] == "2":
+  def _array(data, typecode, offset, length):
+    a = array.array(str(typecode))
+    a.fromstring(data[offset : offset + length * a.itemsize])
+    return a
+  def _tobytes(a):
+    if isinstance(a, array.array): return a.tostring()
+    return bytes(a)
+else:
+  def _array(data, typecode, offset, length):
+    return memoryview(data)[offset : offset + length * array.array(typecode).itemsize].cast(typecode)
+  def _tobytes(a): return a.tobytes()
@@ -28,23 +28,65 @@ PyMedtermino module for SNOMEDCT.
    The SNOMED CT terminology. See :class:`pymedtermino.Terminology` for common terminology members; only SNOMED CT-specific members are described here.
    
    .. automethod:: CORE_problem_list
+   .. automethod:: ecl
+   .. automethod:: ecl_codes
+   .. automethod:: load_relations
+   .. automethod:: refset
+
+.. autoclass:: Refset
+   :members:
 
 """
 
-__all__ = ["SNOMEDCT", "Group"]
+__all__ = ["SNOMEDCT", "Group", "Refset"]
 
 import sys, os, os.path
+from collections import defaultdict
 import pymedtermino
 
 
-db        = pymedtermino.connect_sqlite3("snomedct")
+db        = pymedtermino.connect_sqlite3("snomedct", pragmas = ["PRAGMA synchronous  = OFF;", "PRAGMA journal_mode = OFF;"])
 db_cursor = db.cursor()
-db_cursor.execute("PRAGMA synchronous  = OFF;")
-db_cursor.execute("PRAGMA journal_mode = OFF;")
 
 import atexit
 atexit.register(db.close)
 
+db_cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='IsaClosure'")
+_HAS_ISA_CLOSURE = bool(db_cursor.fetchone()) # False for databases built by older versions of PyMedTermino
+
+db_cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name IN ('PartOfClosure', 'PartOrIsaClosure')")
+_PART_OF_CLOSURES         = set(name for (name,) in db_cursor.fetchall())
+_HAS_PART_OF_CLOSURE      = "PartOfClosure"    in _PART_OF_CLOSURES # False for databases built by older versions of PyMedTermino
+_HAS_PART_OR_ISA_CLOSURE  = "PartOrIsaClosure" in _PART_OF_CLOSURES # Optional, see scripts/import_snomedct.py
+
+db_cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='FindingRelationship'")
+_HAS_FINDING_RELATIONSHIP = bool(db_cursor.fetchone()) # Index of the relations of clinical findings, by destination
+
+db_cursor.execute("PRAGMA table_info(Concept)")
+_HAS_HIERARCHY_STATS = "information_content" in [column[1] for column in db_cursor.fetchall()] # False for databases built by older versions of PyMedTermino
+_HIERARCHY_STATS_ATTRS = set(["depth", "descendant_count", "information_content"])
+
+db_cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='RefsetMember'")
+_HAS_REFSET_MEMBER = bool(db_cursor.fetchone()) # False for databases built by older versions of PyMedTermino
+
+_HAS_FTS5 = pymedtermino._is_fts5(db_cursor, "Description_fts") # False for databases built by older versions of PyMedTermino (FTS4, no ranking)
+
+_RELATIONSHIPS_QUERY = "SELECT sourceId, 0, relationshipGroup, typeId, destinationId FROM Relationship WHERE sourceId IN (%s)%s UNION ALL SELECT destinationId, 1, relationshipGroup, typeId, sourceId FROM Relationship WHERE destinationId IN (%s)%s"
+
+def _is_relationship_attr(attr):
+  return (attr in _RELATIONSHIP_ATTRS) or (attr in relation_2_code) or (attr.startswith(u"INVERSE_") and (attr[8:] in relation_2_code))
+
+def _distinct(l):
+  already = set()
+  r       = []
+  for i in l:
+    if not i in already:
+      already.add(i)
+      r.append(i)
+  return r
+
+_RELATIONSHIP_ATTRS = set(["parents", "children", "relations", "groups", "out_of_group"])
+
 class SNOMEDCT(pymedtermino.Terminology):
   def __init__(self):
     pymedtermino.Terminology.__init__(self, "SNOMEDCT")
@@ -54,27 +96,228 @@ class SNOMEDCT(pymedtermino.Terminology):
   def first_levels(self):
     return [self[code] for code in [u"123037004", u"404684003", u"308916002", u"272379006", u"106237007", u"363787002", u"410607006", u"373873005", u"78621006", u"260787004", u"71388002", u"362981000", u"419891008", u"243796009", u"48176007", u"370115009", u"123038009", u"254291000", u"105590001"]]
   
-  def search(self, text):
-    #db_cursor.execute("SELECT DISTINCT conceptId FROM Description WHERE term LIKE ?", ("%%%s%%" % text,))
-    if pymedtermino.REMOVE_SUPPRESSED_CONCEPTS:
-      db_cursor.execute("SELECT DISTINCT Description.conceptId FROM Concept, Description, Description_fts WHERE (Description_fts.term MATCH ?) AND (Description.id = Description_fts.docid) AND (Concept.id = Description.conceptId) AND (Concept.active = 1)", (text,))
+  def search(self, text, limit = None, offset = 0, rank = False, active_only = None, semantic_tag = None):
+    return self._hits_concepts(self.search_hits(text, limit, offset, rank, active_only, semantic_tag))
+  
+  def search_hits(self, text, limit = None, offset = 0, rank = True, active_only = None, semantic_tag = None):
+    if active_only is None: active_only = pymedtermino.REMOVE_SUPPRESSED_CONCEPTS
+    tables = "Description_fts, Description"
+    where  = "(Description_fts MATCH ?) AND (Description.id = Description_fts.rowid)"
+    args   = [text]
+    if active_only:
+      tables += ", Concept"
+      where  += " AND (Concept.id = Description.conceptId) AND (Concept.active = 1)"
+    if semantic_tag:
+      where  += " AND EXISTS (SELECT 1 FROM Description AS FSN WHERE (FSN.conceptId = Description.conceptId) AND (FSN.typeId = 900000000000003001) AND (FSN.active = 1) AND (FSN.term LIKE ?))"
+      args.append(u"%% (%s)" % semantic_tag)
+    rank = rank and _HAS_FTS5
+    if rank: score = "-bm25(Description_fts)"
+    else:    score = "NULL"
+    sql = "SELECT Description.conceptId AS code, Description.term AS term, %s AS score, Description_fts.rowid AS position FROM %s WHERE %s" % (score, tables, where)
+    return pymedtermino._search_hits(self, db, pymedtermino._search_sql(sql, rank), args, limit, offset)
+  
+  def _load_many(self, codes):
+    r = {}
+    for chunk in pymedtermino._chunks(codes):
+      if pymedtermino.REMOVE_SUPPRESSED_CONCEPTS:
+        db_cursor.execute("SELECT Description.conceptId, Description.term FROM Concept, Description WHERE (Concept.id IN (%s)) AND (Concept.active = 1) AND (Description.conceptId = Concept.id) AND (Description.typeId = 900000000000003001) AND (Description.active = 1)" % pymedtermino._sql_params(len(chunk)), chunk)
+      else:
+        db_cursor.execute("SELECT conceptId, term FROM Description WHERE (conceptId IN (%s)) AND (typeId = 900000000000003001)" % pymedtermino._sql_params(len(chunk)), chunk)
+      for (code, term) in db_cursor.fetchall():
+        if not code in r: r[code] = self.dict.get(code) or SNOMEDCTConcept(code, term)
+    return r
+  
+  def _ancestor_codes(self, concepts):
+    if not _HAS_ISA_CLOSURE: return pymedtermino.Terminology._ancestor_codes(self, concepts)
+    if pymedtermino.REMOVE_SUPPRESSED_RELATIONS: pymedtermino.Concepts(concepts).prefetch("active")
+    r = {}
+    for active in [0, 1]:
+      actives = [concept for concept in concepts if concept._get_isa_closure_active() == active]
+      if not actives: continue
+      ancestors = pymedtermino._fetch_grouped(db_cursor, "SELECT descendant, ancestor FROM IsaClosure WHERE descendant IN (%s) AND active=?", [concept.code for concept in actives], (active,))
+      for concept in actives: r[concept] = set(ancestors.get(concept.code, ()))
+    others = [concept for concept in concepts if concept._get_isa_closure_active() is None]
+    if others: r.update(pymedtermino.Terminology._ancestor_codes(self, others))
+    return r
+  
+  def _prefetch(self, concepts, attr):
+    if   attr == "active":
+      actives = pymedtermino._fetch_grouped(db_cursor, "SELECT id, active FROM Concept WHERE id IN (%s)", [concept.code for concept in concepts])
+      for concept in concepts:
+        if concept.code in actives: concept.active = actives[concept.code][0]
+      return
+    
+    if (attr in _HIERARCHY_STATS_ATTRS) and _HAS_HIERARCHY_STATS:
+      stats = pymedtermino._fetch_grouped(db_cursor, "SELECT id, depth, descendant_count, information_content FROM Concept WHERE id IN (%s)", [concept.code for concept in concepts])
+      for concept in concepts:
+        if concept.code in stats: concept.depth, concept.descendant_count, concept.information_content = stats[concept.code][0]
+      return
+    
+    if   attr == "parents":  column, other_column, relation_code = "sourceId",      "destinationId", 116680003 # 116680003 = is_a
+    elif attr == "children": column, other_column, relation_code = "destinationId", "sourceId",      116680003
+    elif attr in relation_2_code:
+      column, other_column, relation_code = "sourceId", "destinationId", relation_2_code[attr]
+    elif attr.startswith(u"INVERSE_") and (attr[8:] in relation_2_code):
+      column, other_column, relation_code = "destinationId", "sourceId", relation_2_code[attr[8:]]
+    elif attr == "terms":
+      column = None
+    elif attr == "_relationships":
+      column = None
     else:
-      db_cursor.execute("SELECT DISTINCT Description.conceptId FROM Description, Description_fts WHERE (Description_fts.term MATCH ?) AND (Description.id = Description_fts.docid)", (text,))
+      return pymedtermino.Terminology._prefetch(self, concepts, attr)
+    
+    # Relations and terms depend on whether the concept is active.
+    if pymedtermino.REMOVE_SUPPRESSED_RELATIONS or pymedtermino.REMOVE_SUPPRESSED_TERMS:
+      self._prefetch([concept for concept in concepts if not "active" in concept.__dict__], "active")
       
-    r = db_cursor.fetchall()
-    l = []
-    for (code,) in r:
-      try: l.append(self[code])
-      except ValueError: pass
-    return l
+    if attr == "_relationships":
+      self._load_relationships(concepts, load_related = True)
+      return
+    
+    if column is None:
+      actives = [concept for concept in concepts if pymedtermino.REMOVE_SUPPRESSED_TERMS and concept.active]
+      others  = [concept for concept in concepts if not (pymedtermino.REMOVE_SUPPRESSED_TERMS and concept.active)]
+      terms   = pymedtermino._fetch_grouped(db_cursor, "SELECT conceptId, term FROM Description WHERE conceptId IN (%s) AND active=1", [concept.code for concept in actives], distinct = 0)
+      terms.update(pymedtermino._fetch_grouped(db_cursor, "SELECT conceptId, term FROM Description WHERE conceptId IN (%s)", [concept.code for concept in others], distinct = 0))
+      for concept in concepts: concept.terms = terms.get(concept.code, [])
+      return
+    
+    actives = [concept for concept in concepts if pymedtermino.REMOVE_SUPPRESSED_RELATIONS and concept.active]
+    others  = [concept for concept in concepts if not (pymedtermino.REMOVE_SUPPRESSED_RELATIONS and concept.active)]
+    sql     = "SELECT %s, %s FROM Relationship WHERE %s IN (%%s) AND typeId=?" % (column, other_column, column)
+    related = pymedtermino._fetch_grouped(db_cursor, sql + " AND active=1", [concept.code for concept in actives], (relation_code,))
+    related.update(pymedtermino._fetch_grouped(db_cursor, sql, [concept.code for concept in others], (relation_code,)))
+    self._set_prefetched(concepts, attr, related)
+    
+  def _load_relationships(self, concepts, load_related):
+    # Loads the outgoing and incoming Relationship rows of the given concepts, with one query per chunk of concepts.
+    # If load_related, the related concepts are loaded at once, and each concept keeps its related concepts in _related (code => concept),
+    # so as they stay in memory (whatever the size of the concept cache) until the relation attributes are built.
+    # Otherwise, they are loaded when a relation attribute is built, and only those needed by the attribute (see _related_concepts()).
+    actives = [concept.code for concept in concepts if pymedtermino.REMOVE_SUPPRESSED_RELATIONS and concept.active]
+    others  = [concept.code for concept in concepts if not (pymedtermino.REMOVE_SUPPRESSED_RELATIONS and concept.active)]
+    rows    = defaultdict(list)
+    for codes, condition in [(actives, " AND active=1"), (others, "")]:
+      for chunk in pymedtermino._chunks(codes):
+        params = pymedtermino._sql_params(len(chunk))
+        db_cursor.execute(_RELATIONSHIPS_QUERY % (params, condition, params, condition), chunk + chunk)
+        for (code, inverse, group_id, rel, other_code) in db_cursor.fetchall(): rows[code].append((inverse, group_id, rel, other_code))
+    if load_related: related = self.get_many(set(row[3] for l in rows.values() for row in l))
+    for concept in concepts:
+      concept._relationships = rows.get(concept.code, [])
+      if load_related: concept._related = dict((row[3], related[row[3]]) for row in concept._relationships if row[3] in related)
+      
+  def _all_codes(self):
+    if pymedtermino.REMOVE_SUPPRESSED_CONCEPTS: db_cursor.execute("SELECT id FROM Concept WHERE active=1")
+    else:                                       db_cursor.execute("SELECT id FROM Concept")
+    return [code for (code,) in db_cursor.fetchall()]
   
+  def load_relations(self, concepts):
+    """Loads all the relations of the given concepts at once (see :meth:`SNOMEDCTConcept.load_relations`), with a single query
+for each chunk of concepts. The related concepts are loaded at once too, and kept with the concepts. This is faster than loading the relation attributes
+one by one when iterating over many concepts."""
+    pymedtermino.Concepts(concepts).prefetch("_relationships")
+    
   def CORE_problem_list(self):
     """Returns a generator iterating over all SNOMED CT concepts that are included in the CORE problem list."""
     pymedtermino.snomedct.db_cursor.execute("SELECT Id FROM Concept WHERE is_in_core = 1")
     for (code,) in pymedtermino.snomedct.db_cursor.fetchall():
       yield self[code]
       
+  def ecl_codes(self, expression):
+    """Returns the set of the codes of the concepts matching the given SNOMED CT Expression Constraint Language (ECL) expression, e.g. "<< 404684003 : 363698007 = << 39057004".
+The expression is evaluated by a single SQL query (see :mod:`pymedtermino.ecl`), without loading the concepts."""
+    import pymedtermino.ecl
+    db_cursor.execute(pymedtermino.ecl.to_sql(expression, _HAS_ISA_CLOSURE, pymedtermino.REMOVE_SUPPRESSED_RELATIONS, pymedtermino.REMOVE_SUPPRESSED_CONCEPTS, _HAS_REFSET_MEMBER))
+    return set(code for (code,) in db_cursor.fetchall())
+  
+  def ecl(self, expression):
+    """Returns the set (:class:`pymedtermino.Concepts`) of the concepts matching the given SNOMED CT Expression Constraint Language (ECL) expression, e.g. "<< 404684003 : 363698007 = << 39057004".
+See :mod:`pymedtermino.ecl` for the supported ECL subset."""
+    return pymedtermino.Concepts(self.get_many(self.ecl_codes(expression)).values())
+  
+  def refset(self, id):
+    """Returns the reference set (refset) of the given identifier (or refset concept), as a lazily evaluated set of concepts (:class:`Refset`).
+Refsets are imported from the RF2 release by scripts/import_snomedct.py, and other refsets (e.g. national ones) can be added with scripts/import_snomedct_refsets.py.
+Raises ValueError if the database has no such refset."""
+    if isinstance(id, pymedtermino.Concept): id = id.code
+    id = int(id)
+    if _HAS_REFSET_MEMBER:
+      db_cursor.execute("SELECT 1 FROM RefsetMember WHERE refsetId=? LIMIT 1", (id,))
+      if db_cursor.fetchone(): return Refset(self, id)
+    raise ValueError(u"Missing refset %s !" % id)
+  
+  def _refset_members(self, concepts, refset):
+    if not isinstance(refset, Refset): refset = self.refset(refset)
+    codes = set(concept.code for concept in concepts)
+    if len(codes) <= pymedtermino.SQL_CHUNK_SIZE:
+      db_cursor.execute(refset._members_sql("referencedComponentId") + " AND (referencedComponentId IN (%s))" % pymedtermino._sql_params(len(codes)), [refset.id] + list(codes))
+      members = set(code for (code,) in db_cursor.fetchall())
+    else: # Large set => a single scan of the refset (on the index), instead of many "IN (...)" queries
+      members = refset.codes() & codes
+    return [concept for concept in concepts if concept.code in members]
+  
+  
+class Refset(object):
+  """A SNOMED CT reference set (refset), as returned by :meth:`SNOMEDCT.refset`. It behaves as a read-only set of concepts, which is evaluated lazily:
+membership is tested with one indexed query, and the member concepts are loaded by chunks while iterating. Only the active members are considered,
+and only those that are concepts (e.g. not the descriptions of language refsets), and active concepts if :data:`pymedtermino.REMOVE_SUPPRESSED_CONCEPTS` is True.
+
+See also :meth:`pymedtermino.Concepts.filter_refset` for intersecting a large set of concepts with a refset.
+
+.. attribute:: id
+
+   The refset identifier (i.e. the code of the refset concept).
+"""
+  def __init__(self, terminology, id):
+    self.terminology = terminology
+    self.id          = id
+    
+  def __repr__(self): return "<Refset %s>" % self.id
+  
+  def _members_sql(self, select):
+    # Selects the members that are concepts (active ones, if REMOVE_SUPPRESSED_CONCEPTS), i.e. those yielded when iterating.
+    sql = "SELECT %s FROM RefsetMember, Concept WHERE (refsetId = ?) AND (RefsetMember.active = 1) AND (Concept.id = referencedComponentId)" % select
+    if pymedtermino.REMOVE_SUPPRESSED_CONCEPTS: sql += " AND (Concept.active = 1)"
+    return sql
+  
+  def __contains__(self, concept):
+    if not (isinstance(concept, SNOMEDCTConcept) and (concept.terminology is self.terminology)): return False
+    db_cursor.execute(self._members_sql("1") + " AND (referencedComponentId = ?) LIMIT 1", (self.id, concept.code))
+    return bool(db_cursor.fetchone())
+  
+  def __len__(self):
+    db_cursor.execute(self._members_sql("COUNT(DISTINCT referencedComponentId)"), (self.id,))
+    return db_cursor.fetchone()[0]
+  
+  def __iter__(self):
+    cursor = db.connection().cursor() # Not the shared cursor, which is used for loading concepts while iterating
+    try:
+      cursor.execute(self._members_sql("DISTINCT referencedComponentId"), (self.id,))
+      while 1:
+        codes = [code for (code,) in cursor.fetchmany(pymedtermino.SQL_CHUNK_SIZE)]
+        if not codes: break
+        concepts = self.terminology.get_many(codes)
+        for code in codes:
+          if code in concepts: yield concepts[code]
+    finally:
+      cursor.close()
       
+  def codes(self):
+    """Returns the set of the codes of the member concepts of the refset, without loading the concepts."""
+    db_cursor.execute(self._members_sql("referencedComponentId"), (self.id,))
+    return set(code for (code,) in db_cursor.fetchall())
+  
+  def concepts(self):
+    """Returns the set (:class:`pymedtermino.Concepts`) of the member concepts of the refset."""
+    return pymedtermino.Concepts(self)
+  
+  def map_targets(self, concept):
+    """For map refsets, returns the list of the map targets (e.g. ICD10 codes) of the given concept, ordered by map group and priority."""
+    db_cursor.execute("SELECT mapTarget FROM MapRefsetMember WHERE refsetId=? AND active=1 AND referencedComponentId=? ORDER BY mapGroup, mapPriority", (self.id, concept.code))
+    return [target for (target,) in db_cursor.fetchall()]
+  
+  
 class Group(object):
   """A group, grouping several SNOMED CT relation together in the definition of a Concept."""
   
@@ -133,22 +376,28 @@ class SNOMEDCTConcept(_parent_class, pymedtermino._IntCodeConcept):
 Additional attributes are available for relations, and are listed in the :attr:`relations <pymedtermino.Concept.relations>` attribute.
 """
   
-  def __init__(self, code):
-    if pymedtermino.REMOVE_SUPPRESSED_CONCEPTS:
-      db_cursor.execute("SELECT active FROM Concept WHERE id=?", (code,))
-      if db_cursor.fetchone()[0] != 1: raise ValueError()
-      
-      db_cursor.execute("SELECT term FROM Description WHERE conceptId=? AND typeId=900000000000003001 AND active=1", (code,))
-      self.active = 1
-      
-    else:
-      db_cursor.execute("SELECT term FROM Description WHERE conceptId=? AND typeId=900000000000003001", (code,))
+  def __init__(self, code, term = None):
+    if term is None:
+      if pymedtermino.REMOVE_SUPPRESSED_CONCEPTS:
+        db_cursor.execute("SELECT active FROM Concept WHERE id=?", (code,))
+        if db_cursor.fetchone()[0] != 1: raise ValueError()
+        
+        db_cursor.execute("SELECT term FROM Description WHERE conceptId=? AND typeId=900000000000003001 AND active=1", (code,))
+        
+      else:
+        db_cursor.execute("SELECT term FROM Description WHERE conceptId=? AND typeId=900000000000003001", (code,))
+        
+      r = db_cursor.fetchone()
+      if not r: raise ValueError()
+      term = r[0]
       
-    r = db_cursor.fetchone()
-    if not r: raise ValueError()
-    pymedtermino.MultiaxialConcept.__init__(self, code, r[0])
+    if pymedtermino.REMOVE_SUPPRESSED_CONCEPTS: self.active = 1
+    pymedtermino.MultiaxialConcept.__init__(self, code, term)
     
   def __getattr__(self, attr):
+    if self.terminology.snapshot and (attr in self.terminology.snapshot.attrs) and self.terminology._from_snapshot(self, attr): return self.__dict__[attr]
+    if ("_relationships" in self.__dict__) and _is_relationship_attr(attr): return self._relationship_attr(attr)
+    
     if   attr == "parents":
       if pymedtermino.REMOVE_SUPPRESSED_RELATIONS and self.active:
         db_cursor.execute("SELECT DISTINCT destinationId FROM Relationship WHERE sourceId=? AND typeId=116680003 AND active=1", (self.code,)) # 116680003 = is_a
@@ -191,14 +440,7 @@ Additional attributes are available for relations, and are listed in the :attr:`
       else:
         db_cursor.execute("SELECT DISTINCT relationshipGroup, typeId, destinationId FROM Relationship WHERE sourceId=?", (self.code,))
         
-      data = db_cursor.fetchall()
-      groups = [Group() for i in range(1 + max([0] + [group_id for (group_id, rel, code) in data]))]
-      for (group_id, rel, code) in data:
-        if rel == 116680003: continue # 116680003 = is_a
-        group = groups[group_id]
-        group.add_relation(code_2_relation[rel], self.terminology[code])
-      self.groups       = [group for group in groups[1:] if group.relations] # Pourquoi y a-t-il des groupes vides dans la SNOMED CT ???
-      self.out_of_group = groups[0]
+      self._set_groups(db_cursor.fetchall())
       if attr == "groups": return self.groups
       else:                return self.out_of_group
       
@@ -252,10 +494,134 @@ Additional attributes are available for relations, and are listed in the :attr:`
       self.is_in_core = int(db_cursor.fetchone()[0])
       return self.is_in_core
     
+    elif attr == "_relationships":
+      self.terminology._load_relationships([self], load_related = False) # Related concepts may be very numerous (e.g. INVERSE_finding_site of body structures)
+      return self._relationships
+    
+    elif attr in _HIERARCHY_STATS_ATTRS:
+      if _HAS_HIERARCHY_STATS:
+        db_cursor.execute("SELECT depth, descendant_count, information_content FROM Concept WHERE id=?", (self.code,))
+        self.depth, self.descendant_count, self.information_content = db_cursor.fetchone()
+      else:
+        db_cursor.execute("SELECT COUNT(*) FROM Concept WHERE active=1")
+        self.depth, self.descendant_count, self.information_content = pymedtermino._hierarchy_stats(self, db_cursor.fetchone()[0], lambda concept: concept.active)
+      return getattr(self, attr)
+    
     raise AttributeError(attr)
   
+  def load_relations(self):
+    """Loads all the relations of this concept (parents, children, relations, groups, out_of_group, and all relation and INVERSE\_ relation
+attributes) with a single query, instead of one query per attribute. The attributes are then built from the loaded relations when accessed;
+the related concepts needed by an attribute are loaded at once when it is first accessed. Returns the concept itself.
+
+See also :meth:`SNOMEDCT.load_relations` for loading the relations of many concepts at once."""
+    self._relationships
+    return self
+  
+  def _relationship_attr(self, attr):
+    # Builds attr from the Relationship rows loaded by load_relations(), without querying the database.
+    if attr == "relations":
+      self.relations = set()
+      for (inverse, group_id, rel, code) in self._relationships:
+        if rel != 116680003: # 116680003 = is_a
+          if inverse: self.relations.add("INVERSE_%s" % code_2_relation[rel])
+          else:       self.relations.add(code_2_relation[rel])
+      return self.relations
+    
+    if (attr == "groups") or (attr == "out_of_group"):
+      data = _distinct((group_id, rel, code) for (inverse, group_id, rel, code) in self._relationships if not inverse)
+      self._set_groups(data, self._related_concepts([code for (group_id, rel, code) in data if rel != 116680003])) # 116680003 = is_a
+      return getattr(self, attr)
+    
+    if   attr == "parents":            relation_inverse, relation_code = 0, 116680003 # 116680003 = is_a
+    elif attr == "children":           relation_inverse, relation_code = 1, 116680003
+    elif attr.startswith(u"INVERSE_"): relation_inverse, relation_code = 1, relation_2_code[attr[8:]]
+    else:                              relation_inverse, relation_code = 0, relation_2_code[attr]
+    codes   = _distinct(code for (inverse, group_id, rel, code) in self._relationships if (inverse == relation_inverse) and (rel == relation_code))
+    related = self._related_concepts(codes)
+    l = [related[code] for code in codes]
+    setattr(self, attr, l)
+    return l
+  
+  def _related_concepts(self, codes):
+    # Returns a dict mapping the given codes (of concepts related in the rows loaded by load_relations()) to their concepts.
+    # The concepts that have not been loaded with the relations are loaded at once, and kept in _related.
+    related = self.__dict__.get("_related")
+    if related is None: related = self._related = {}
+    missing = [code for code in codes if not code in related]
+    if missing:
+      related.update(self.terminology.get_many(missing))
+      for code in missing:
+        if not code in related: related[code] = self.terminology[code] # Not loaded by get_many(), e.g. inactive concepts
+    return related
+  
+  def _set_groups(self, data, related = None):
+    # related is an optional dict mapping the codes in data to their concepts.
+    groups = [Group() for i in range(1 + max([0] + [group_id for (group_id, rel, code) in data]))]
+    for (group_id, rel, code) in data:
+      if rel == 116680003: continue # 116680003 = is_a
+      group = groups[group_id]
+      if related is None: group.add_relation(code_2_relation[rel], self.terminology[code])
+      else:               group.add_relation(code_2_relation[rel], related[code])
+    self.groups       = [group for group in groups[1:] if group.relations] # Pourquoi y a-t-il des groupes vides dans la SNOMED CT ???
+    self.out_of_group = groups[0]
+  
+  def _get_isa_closure_active(self):
+    # Selects the part of the IsaClosure table that matches the relations used by the parents attribute,
+    # or returns None if the closure cannot be used (older database, or inactive concept whose inactive relations
+    # must be followed only for the first level).
+    if not _HAS_ISA_CLOSURE: return None
+    if not pymedtermino.REMOVE_SUPPRESSED_RELATIONS: return 0
+    if self.active: return 1
+    return None
+  
+  def is_a(self, concept, already = None):
+    if self is concept: return True
+    if already is None:
+      r = self._snapshot_is_a(concept)
+      if not r is None: return r
+    active = self._get_isa_closure_active()
+    if active is None:
+      if already is None: return _parent_class.is_a(self, concept)
+      return _parent_class.is_a(self, concept, already)
+    if not isinstance(concept, SNOMEDCTConcept): return False
+    db_cursor.execute("SELECT 1 FROM IsaClosure WHERE active=? AND descendant=? AND ancestor=?", (active, self.code, concept.code))
+    return db_cursor.fetchone() is not None
+  imply = is_a
+  
+  def ancestors_no_double(self, already = None):
+    active = self._get_isa_closure_active()
+    if active is None: return _parent_class.ancestors_no_double(self, already)
+    db_cursor.execute("SELECT ancestor FROM IsaClosure WHERE active=? AND descendant=? ORDER BY distance", (active, self.code))
+    return self._concepts_not_already(db_cursor.fetchall(), already)
+  
+  def descendants_no_double(self, already = None):
+    active = self._get_isa_closure_active()
+    if active is None: return _parent_class.descendants_no_double(self, already)
+    db_cursor.execute("SELECT descendant FROM IsaClosure WHERE active=? AND ancestor=? ORDER BY distance", (active, self.code))
+    return self._concepts_not_already(db_cursor.fetchall(), already)
+  
+  def _concepts_not_already(self, codes, already):
+    # codes are the (code,) rows of a closure query; the concepts are loaded by chunks with get_many(), in the order of the rows.
+    if already is None: already = set()
+    for chunk in pymedtermino._chunks([code for (code,) in codes]):
+      concepts = self.terminology.get_many(chunk)
+      for code in chunk:
+        concept = concepts.get(code)
+        if concept is None: concept = self.terminology[code] # Not loaded by get_many(), e.g. inactive concepts
+        if not concept in already:
+          already.add(concept)
+          yield concept
+        
   def is_part_of(self, concept, already = None):
+    """Returns True if this concept is the given concept, or one of its parts (or sub-parts, recursively), following both part-of and is-a relations."""
     if self is concept: return True
+    if (already is None) and _HAS_PART_OR_ISA_CLOSURE and isinstance(concept, SNOMEDCTConcept):
+      active = self._get_isa_closure_active()
+      if not active is None:
+        db_cursor.execute("SELECT EXISTS (SELECT 1 FROM IsaClosure WHERE active=? AND descendant=? AND ancestor=?) OR EXISTS (SELECT 1 FROM PartOrIsaClosure WHERE active=? AND descendant=? AND ancestor=?)", (active, self.code, concept.code, active, self.code, concept.code))
+        return bool(db_cursor.fetchone()[0])
+      
     if already is None: already = set([self])
     if u"part_of" in self.relations: parents = set(self.parents + self.part_of)
     else:                           parents =     self.parents
@@ -265,32 +631,123 @@ Additional attributes are available for relations, and are listed in the :attr:`
         if parent.is_part_of(concept, already): return True
     return False
   
+  def _get_part_of_closure_active(self):
+    # As _get_isa_closure_active(), for the PartOfClosure table.
+    if not _HAS_PART_OF_CLOSURE: return None
+    return self._get_isa_closure_active()
+  
   def descendant_parts(self):
-    """Returns the sub-parts of this concept, recursively."""
-    if u"INVERSE_part_of" in self.relations:
-      for child in self.INVERSE_part_of:
-        yield child
-        for concept in child.descendant_parts():
-          yield concept
-          
+    """Returns the sub-parts of this concept, recursively. Each sub-part is returned once."""
+    active = self._get_part_of_closure_active()
+    if active is None: return self.iter_depth_first("INVERSE_part_of", dedupe = True, already = set([self]))
+    db_cursor.execute("SELECT descendant FROM PartOfClosure WHERE active=? AND ancestor=? ORDER BY distance", (active, self.code))
+    return self._concepts_not_already(db_cursor.fetchall(), None)
+  
   def ancestor_parts(self):
-    """Returns the super-part of this concept, recursively."""
-    if u"part_of" in self.relations:
-      for parent in self.part_of:
-        yield parent
-        for concept in parent.ancestor_parts():
-          yield concept
-          
+    """Returns the super-part of this concept, recursively. Each super-part is returned once."""
+    active = self._get_part_of_closure_active()
+    if active is None: return self.iter_depth_first("part_of", dedupe = True, already = set([self]))
+    db_cursor.execute("SELECT ancestor FROM PartOfClosure WHERE active=? AND descendant=? ORDER BY distance", (active, self.code))
+    return self._concepts_not_already(db_cursor.fetchall(), None)
+  
   def associated_clinical_findings(self):
     """Return the clinical finding concepts associated to this concept (which is expected to be a anatomical structure, a morphology, etc)."""
-    r = pymedtermino.Concepts()
+    return pymedtermino.Concepts(self.iter_associated_clinical_findings())
+  
+  def iter_associated_clinical_findings(self):
+    """Iterates over the clinical finding concepts associated to this concept (see :meth:`associated_clinical_findings`).
+The concepts are loaded by chunks, while iterating."""
+    active = self._get_isa_closure_active()
+    if active is None:
+      for concept in self._associated_clinical_findings_no_closure(): yield concept
+      return
+    
+    # This concept, its descendants and its sub-parts (recursively)
+    if active: condition = " AND (Relationship.active = 1)"
+    else:      condition = ""
+    if _HAS_PART_OF_CLOSURE:
+      parts = "SELECT descendant FROM PartOfClosure WHERE (active = %s) AND (ancestor = ?)" % active
+    else:
+      parts = "SELECT id FROM (WITH RECURSIVE Part(id) AS (SELECT sourceId FROM Relationship WHERE (destinationId = ?) AND (typeId = 123005000)%s UNION SELECT Relationship.sourceId FROM Relationship, Part WHERE (Relationship.destinationId = Part.id) AND (Relationship.typeId = 123005000)%s) SELECT id FROM Part)" % (condition, condition)
+    structures = "SELECT ? UNION SELECT descendant FROM IsaClosure WHERE (active = ?) AND (ancestor = ?) UNION %s" % parts
+    cursor = db.connection().cursor() # Not the shared cursor, which is used for loading concepts while iterating
+    try:
+      cursor.execute("SELECT DISTINCT sourceId FROM (%s)" % _finding_relations_sql(active, structures), (self.code, active, self.code, self.code))
+      while 1:
+        codes = [code for (code,) in cursor.fetchmany(pymedtermino.SQL_CHUNK_SIZE)]
+        if not codes: break
+        concepts = self.terminology.get_many(codes)
+        for code in codes:
+          if code in concepts: yield concepts[code]
+    finally:
+      cursor.close()
+      
+  def _associated_clinical_findings_no_closure(self):
+    already = set()
     for i in set(self.self_and_descendants()) | set(self.descendant_parts()):
       for relation in MAIN_CLINICAL_FINDING_RELATIONS:
         relation = "INVERSE_%s" % relation
         if relation in i.relations:
           for j in getattr(i, relation):
-            if j.is_a(SNOMEDCT[404684003]): r.add(j)
+            if (not j in already) and j.is_a(SNOMEDCT[404684003]):
+              already.add(j)
+              yield j
+              
+  def precompute_associated_clinical_findings(self):
+    """Computes the clinical findings associated to this concept and to each of its descendants (e.g. all the anatomical structures below a body region),
+with set-at-a-time queries. Returns a dict mapping the code of each of these concepts to the set of the codes of its associated clinical findings
+(see :meth:`associated_clinical_findings`)."""
+    active = self._get_isa_closure_active()
+    if active is None:
+      return dict((concept.code, set(finding.code for finding in concept.associated_clinical_findings())) for concept in self.self_and_descendants_no_double())
+    
+    db_cursor.execute("SELECT descendant FROM IsaClosure WHERE (active = ?) AND (ancestor = ?)", (active, self.code))
+    nodes       = [self.code] + [code for (code,) in db_cursor.fetchall()]
+    descendants = pymedtermino._fetch_grouped(db_cursor, "SELECT ancestor, descendant FROM IsaClosure WHERE (ancestor IN (%s)) AND (active = ?)", nodes, (active,))
+    
+    # Sub-parts (recursively) of each node
+    if _HAS_PART_OF_CLOSURE:
+      descendant_parts = pymedtermino._fetch_grouped(db_cursor, "SELECT ancestor, descendant FROM PartOfClosure WHERE (ancestor IN (%s)) AND (active = ?)", nodes, (active,))
+    else:
+      if active: condition = " AND (active = 1)"
+      else:      condition = ""
+      parts    = {}
+      frontier = set(nodes)
+      while frontier: # Level by level
+        edges = pymedtermino._fetch_grouped(db_cursor, "SELECT destinationId, sourceId FROM Relationship WHERE (destinationId IN (%s)) AND (typeId = 123005000)" + condition, list(frontier))
+        for code in frontier: parts[code] = edges.get(code, [])
+        frontier = set(part for l in edges.values() for part in l if not part in parts)
+      descendant_parts = {}
+      for node in nodes:
+        already = set([node])
+        stack   = [node]
+        while stack:
+          for part in parts.get(stack.pop(), ()):
+            if not part in already:
+              already.add(part)
+              stack.append(part)
+        already.discard(node)
+        descendant_parts[node] = already
+        
+    all_parts = set(part for l in descendant_parts.values() for part in l)
+    direct    = pymedtermino._fetch_grouped(db_cursor, _finding_relations_sql(active, "%s"), list(set(nodes) | all_parts))
+    r = {}
+    for node in nodes:
+      findings = r[node] = set(direct.get(node, ()))
+      for descendant in descendants     .get(node, ()): findings.update(direct.get(descendant, ()))
+      for part       in descendant_parts.get(node, ()): findings.update(direct.get(part,       ()))
     return r
+  
+  
+def _finding_relations_sql(active, destinations):
+  # SQL query of the (destinationId, sourceId) relations of MAIN_CLINICAL_FINDING_RELATIONS types whose source is a clinical finding,
+  # destinations being a SQL subquery or parameters.
+  types = ", ".join(str(relation_2_code[relation]) for relation in sorted(MAIN_CLINICAL_FINDING_RELATIONS))
+  if _HAS_FINDING_RELATIONSHIP:
+    return "SELECT destinationId, sourceId FROM FindingRelationship WHERE (destinationId IN (%s)) AND (active = %s) AND (typeId IN (%s))" % (destinations, active, types)
+  if active: condition = " AND (active = 1)"
+  else:      condition = ""
+  return "SELECT destinationId, sourceId FROM Relationship WHERE (destinationId IN (%s)) AND (typeId IN (%s))%s AND ((sourceId = 404684003) OR EXISTS (SELECT 1 FROM IsaClosure WHERE (active = %s) AND (descendant = sourceId) AND (ancestor = 404684003)))" % (destinations, types, condition, active)
 
 SNOMEDCT = SNOMEDCT()
 
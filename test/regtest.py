@@ -19,7 +19,7 @@
 
 from __future__ import print_function
 
-import unittest
+import sys, unittest
 
 import pymedtermino
 pymedtermino.LANGUAGE = "fr"
@@ -44,9 +44,255 @@ class TestVCM(unittest.TestCase):
     assert ICD10.search("portal hypertension") == [ICD10[u"K76.6"]  # Portal hypertension
     ]
     pymedtermino.LANGUAGE = "fr"
+
+  def test_icd10_search(self):
+    assert ICD10.search("hepatite", lang = "fr") == ICD10.search(u"hépatite", lang = "fr")
+    assert set(ICD10.search("hypertens", prefix = True, texts = False)) >= set(ICD10.search("hypertension", texts = False))
+    assert ICD10["K76.6"] in ICD10.search("portal hypertension", lang = "en", limit = 5)
+    for hit in ICD10.search_hits("hypertension portale", lang = "fr"): assert hit.term == ICD10[hit.code].get_translation("fr")
+    self.assertRaises(ValueError, ICD10.search, "hypertension", lang = "de")
+    
+  def test_icd10_intervals(self):
+    assert ICD10["I10"].is_a(ICD10["IX"])
+    assert not ICD10["IX"].is_a(ICD10["I10"])
+    assert list(ICD10["I10-I15"].descendants()) == [concept for child in ICD10["I10-I15"].children for concept in child.self_and_descendants()]
+    assert ICD10["IX"].descendant_count == len(list(ICD10["IX"].descendants()))
     
+  def test_icd10_attributes(self):
+    import pymedtermino.icd10
+    concept = ICD10["I10"]
+    index   = pymedtermino.icd10._ROW_INDEX
+    assert concept.atih_extension is False
+    assert (concept.morbidity, concept.mortality1) == (concept._row[index["morbidity"]], concept._row[index["mortality1"]])
+    assert not isinstance(concept.pmsi_restriction, list)
+    assert (concept.dagger, concept.star) == (0, 0)
+    assert concept.get_translation("fr") == concept.term
+
+  def test_icd10_range(self):
+    diabetes = ICD10.range("E10", "E14")
+    assert ICD10["E11"] in diabetes and ICD10["E11.9"] in diabetes and ("E14.9" in diabetes)
+    assert not ICD10["E10-E14"] in diabetes and not ICD10["E15"] in diabetes
+    assert diabetes == ICD10.range("E10-E14") - ICD10.range(ICD10["E10-E14"], include_descendants = False)
+    assert set(ICD10.range("E10-E14", include_descendants = False)) == set([ICD10["E10-E14"]])
+    assert [concept.code for concept in ICD10.range("E10", "E14", include_descendants = False)] == ["E10", "E11", "E12", "E13", "E14"]
+    ischemic = ICD10.range("I20-I25", exclude = "I24.1")
+    assert ICD10["I24.0"] in ischemic and not ICD10["I24.1"] in ischemic
+    assert len(ischemic) == len(list(ischemic)) == len(ICD10.range("I20-I25")) - 1
+
+  def test_icd10_texts(self):
+    concepts = [ICD10["I10"], ICD10["I11"], ICD10["K76"]]
+    expected = [[text.text for text in concept.exclusion] for concept in concepts]
+    ICD10.concept_cache.clear()
+    concepts = [ICD10["I10"], ICD10["I11"], ICD10["K76"]]
+    ICD10.load_texts(concepts)
+    assert [[text.text for text in concept.__dict__.get("exclusion", [])] for concept in concepts] == expected
+    for concept in concepts:
+      for text in concept.exclusion:
+        if text.reference_code: assert concept in [text2.concept for text2 in text.reference.referencing_texts("exclusion")]
+        
+  def test_get_many(self):
+    concepts = ICD10.get_many(["I10", "E11", "XXX"])
+    assert set(concepts) == set([u"I10", u"E11"])
+    assert concepts[u"I10"] is ICD10["I10"]
+    self.assertRaises(ValueError, ICD10.concepts_for, ["I10", "XXX"])
+    
+  def test_prefetch(self):
+    concepts = ICD10.concepts_for(["I10", "I11", "E11"]).prefetch("parents", "children", "exclusion")
+    for concept in concepts:
+      assert "children" in concept.__dict__
+      assert concept.parents == [ICD10[concept.parent_code]]
+    
+  def test_iter_depth_first(self):
+    assert list(ICD10["IX"].iter_depth_first()) == list(pymedtermino.Concept.descendants(ICD10["IX"]))
+    assert list(ICD10["I10"].iter_breadth_first("parents", include_self = True, yield_depth = True)) == [(ICD10["I10"], 0), (ICD10["I10-I15"], 1), (ICD10["IX"], 2)]
+    assert set(ICD10["IX"].iter_breadth_first(max_depth = 1)) == set(ICD10["IX"].children)
+    
+  def test_threads(self):
+    import threading
+    results = []
+    def work(): results.append([concept.term for concept in ICD10["IX"].descendants()])
+    threads = [threading.Thread(target = work) for i in range(4)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    assert len(results) == 4
+    for result in results: assert result == results[0]
+    
+  def test_concept_cache(self):
+    cache    = ICD10.concept_cache
+    concepts = [ICD10["I10"], ICD10["I11"], ICD10["I12"], ICD10["I13"]]
+    capacity, max_memory = cache.capacity, cache.max_memory
+    try:
+      cache.clear()
+      cache.resize(3)
+      stats = cache.stats()
+      for concept in concepts[:3]: cache.add(concept)
+      cache.touch(concepts[0]) # I10 is now the most recently used
+      cache.add(concepts[3])   # Evicts I11, the least recently used
+      assert [concept in cache for concept in concepts] == [True, False, True, True]
+      new_stats = cache.stats()
+      assert (new_stats["size"], new_stats["hits"] - stats["hits"], new_stats["misses"] - stats["misses"], new_stats["evictions"] - stats["evictions"]) == (3, 1, 4, 1)
+      
+      cache.resize(3, max_memory = pymedtermino.ConceptCache.sizeof(concepts[3]) + 1) # Room for about one concept
+      assert [concept in cache for concept in concepts] == [False, False, False, True]
+      assert cache.stats()["evictions"] - stats["evictions"] == 3
+    finally:
+      cache.resize(capacity, max_memory)
+      
+  def test_lost_registration(self):
+    import gc, weakref
+    ICD10.concept_cache.clear()
+    gc.collect()
+    concept = weakref.ref(ICD10["I10"])
+    ICD10.Concept("I10") # Loses the registration, as when another thread has loaded the same concept concurrently
+    gc.collect()
+    assert (not concept() is None) and (ICD10["I10"] is concept())
+    
+  def test_keep_most_specific(self):
+    concepts = Concepts([ICD10["IX"], ICD10["I10-I15"], ICD10["I10"], ICD10["E11"]])
+    concepts.keep_most_specific()
+    assert concepts == Concepts([ICD10["I10"], ICD10["E11"]])
+    concepts = Concepts([ICD10["IX"], ICD10["I10-I15"], ICD10["I10"], ICD10["E11"]])
+    concepts.keep_most_generic()
+    assert concepts == Concepts([ICD10["IX"], ICD10["E11"]])
+    
+  def test_lowest_common_ancestors(self):
+    concepts = Concepts([ICD10["I10"], ICD10["I11"], ICD10["I11.0"]])
+    assert concepts.lowest_common_ancestors() == Concepts([ICD10["I10-I15"]])
+    assert concepts.lowest_common_ancestor() is ICD10["I10-I15"]
+    assert Concepts([ICD10["I10"], ICD10["E11"]]).lowest_common_ancestor() is None
+    
+  def test_isa_closure(self):
+    # Compares IsaClosure with the recursive implementations (on parents / children) of (CycleSafe)MultiaxialConcept
+    ancestors   = pymedtermino.MultiaxialConcept.__dict__["ancestors_no_double"]
+    descendants = pymedtermino.MultiaxialConcept.__dict__["descendants_no_double"]
+    def clear_relations():
+      for concept in list(SNOMEDCT.dict.values()):
+        for attr in ["parents", "children", "_relationships", "_related"]: concept.__dict__.pop(attr, None)
+    remove = pymedtermino.REMOVE_SUPPRESSED_RELATIONS
+    try:
+      for remove_suppressed in [True, False]: # IsaClosure rows with active=1, then active=0 (all relations)
+        pymedtermino.REMOVE_SUPPRESSED_RELATIONS = remove_suppressed
+        clear_relations()
+        concept = SNOMEDCT[38822007] # Cystitis
+        assert not concept._get_isa_closure_active() is None
+        assert set(concept.ancestors_no_double())   == set(ancestors(concept))
+        assert set(concept.descendants_no_double()) == set(descendants(concept))
+        assert concept.is_a(SNOMEDCT[404684003]) and (SNOMEDCT[404684003] in set(ancestors(concept))) # Clinical finding
+        assert not concept.is_a(SNOMEDCT[123037004]) and not (SNOMEDCT[123037004] in set(ancestors(concept))) # Body structure
+        assert not SNOMEDCT[404684003].is_a(concept)
+    finally:
+      pymedtermino.REMOVE_SUPPRESSED_RELATIONS = remove
+      clear_relations()
+      
+  def test_load_relations(self):
+    concept = SNOMEDCT[38822007] # Cystitis
+    lazy    = (set(concept.parents), concept.relations, set(concept.finding_site), len(concept.groups))
+    for attr in ["parents", "relations", "finding_site", "groups", "out_of_group"]: del concept.__dict__[attr]
+    concept.load_relations()
+    assert (set(concept.parents), concept.relations, set(concept.finding_site), len(concept.groups)) == lazy
+    
+  if sys.version_info >= (3, 3):
+    def test_load_relations_many(self):
+      import gc, itertools, pymedtermino.snomedct
+      findings = list(itertools.islice(SNOMEDCT[404684003].descendants(), 5000))[::10] # Related concepts are mostly not in the batch
+      cache    = SNOMEDCT.concept_cache
+      capacity, max_memory = cache.capacity, cache.max_memory
+      cache.resize(100) # Less than the number of concepts loaded
+      try:
+        SNOMEDCT.load_relations(findings)
+        gc.collect()
+        queries = []
+        pymedtermino.snomedct.db.connection().set_trace_callback(queries.append)
+        try:
+          for finding in findings: finding.finding_site, finding.groups
+        finally:
+          pymedtermino.snomedct.db.connection().set_trace_callback(None)
+        assert queries == []
+      finally:
+        cache.resize(capacity, max_memory)
+        
+  def test_hierarchy_stats(self):
+    assert (ICD10["IX"].depth, ICD10["I10-I15"].depth, ICD10["I10"].depth) == (0, 1, 2)
+    assert ICD10["I10-I15"].descendant_count == len(list(ICD10["I10-I15"].descendants()))
+    assert ICD10["IX"].information_content < ICD10["I10-I15"].information_content < ICD10["I10"].information_content == 1.0
+    
+  def test_search_hits(self):
+    hits = list(ICD10.search_hits("hypertension", limit = 5))
+    assert len(hits) == 5
+    assert [hit.code for hit in ICD10.search_hits("hypertension", limit = 2, offset = 3)] == [hit.code for hit in hits[3:5]]
+    assert hits[0].concept is ICD10[hits[0].code]
+    assert set(ICD10.search("portal hypertension", limit = 1)) == set([ICD10[u"K76.6"]])
+
+  def test_ecl(self):
+    cystitis = SNOMEDCT[38822007]
+    assert SNOMEDCT.ecl("<< 38822007 |Cystitis|") == set(cystitis.self_and_descendants_no_double())
+    assert SNOMEDCT.ecl(">! 38822007") == set(cystitis.parents)
+    refined = set(concept for concept in cystitis.self_and_descendants_no_double() if concept.finding_site)
+    assert SNOMEDCT.ecl("<< 38822007 : 363698007 |Finding site| = *") == refined
+    assert SNOMEDCT.ecl("<< 38822007 MINUS (<< 38822007 : 363698007 = *)") == set(cystitis.self_and_descendants_no_double()) - refined
+
+  def test_associated_clinical_findings(self):
+    bladder  = SNOMEDCT[89837001] # Urinary bladder structure
+    findings = bladder.associated_clinical_findings()
+    assert SNOMEDCT[38822007] in findings # Cystitis
+    assert set(bladder.iter_associated_clinical_findings()) == findings
+    assert bladder.precompute_associated_clinical_findings()[bladder.code] == set(finding.code for finding in findings)
+
+  def test_part_of(self):
+    bladder = SNOMEDCT[89837001] # Urinary bladder structure
+    parts   = list(bladder.descendant_parts())
+    assert parts and (len(parts) == len(set(parts)))
+    for part in parts:
+      assert part.is_part_of(bladder)
+      assert bladder in set(part.ancestor_parts())
+
+  def test_refset(self):
+    refset  = SNOMEDCT.refset(900000000000497000) # CTV3 simple map
+    concept = next(iter(refset))
+    assert concept in refset
+    assert refset.map_targets(concept)
+    assert Concepts([concept]).filter_refset(refset) == Concepts([concept])
+    assert len(refset) == len(list(refset)) == len(refset.codes())
+    assert SNOMEDCT.ecl_codes("%s AND ^ 900000000000497000" % concept.code) == set([concept.code])
+    self.assertRaises(ValueError, SNOMEDCT.refset, 404684003)
+
+  def test_snapshot(self):
+    import tempfile, os, pymedtermino.snapshot
+    filename = tempfile.mktemp(".csr")
+    pymedtermino.snapshot.export(ICD10, filename)
+    try:
+      ICD10.use_snapshot(filename)
+      assert ICD10.snapshot.related_codes("I10", "parents") == ["I10-I15"]
+      assert set(ICD10.snapshot.related_codes("I10-I15", "children")) == set(child.code for child in ICD10["I10-I15"].children)
+      assert ICD10["I11.0"].is_a(ICD10["IX"])
+      assert not ICD10["I11.0"].is_a(ICD10["E11"])
+    finally:
+      ICD10.snapshot.close()
+      ICD10.use_snapshot(None)
+      os.unlink(filename)
+      
+  def test_icd10_load_all(self):
+    children  = [child.code for child in ICD10["I10-I15"].children]
+    exclusion = [text.text for text in ICD10["I10"].exclusion]
+    ICD10.load_all()
+    try:
+      ICD10.concept_cache.clear()
+      assert [child.code for child in ICD10.concept("I10-I15").children] == children
+      assert [text.text  for text  in ICD10.concept("I10").exclusion]    == exclusion
+      assert ICD10["I11.0"].is_a(ICD10["IX"])
+      assert list(ICD10["I10-I15"].descendants()) == [concept for child in ICD10["I10-I15"].children for concept in child.self_and_descendants()]
+    finally:
+      ICD10.unload_all()
+
+  if sys.version_info >= (3, 5):
+    def test_aio(self):
+      import asyncio
+      loop = asyncio.get_event_loop()
+      assert loop.run_until_complete(ICD10.aget("I10")) is ICD10["I10"]
+      assert loop.run_until_complete(ICD10["IX"].aload("children")) == ICD10["IX"].children
+
+
 
-  
   def test_1(self): assert VCM.canonize_code(u"en_cours--patho--coeur--rien--rien--rien--rien") == u"en_cours--patho--coeur"
   def test_2(self): assert VCM.canonize_code(u"en_cours--patho--coeur--rien--rien--rien") == u"en_cours--patho--coeur"
   def test_3(self): assert VCM.canonize_code(u"en_cours--hypo--coeur--rien--rien--rien") == u"en_cours--hypo--coeur"
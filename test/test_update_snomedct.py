@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+# PyMedTermino
+# Copyright (C) 2012-2013 Jean-Baptiste LAMY
+# LIMICS (Laboratoire d'informatique médicale et d'ingénierie des connaissances en santé), UMR_S 1142
+# University Paris 13, Sorbonne paris-Cité, Bobigny, France
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Checks scripts/update_snomedct.py on a small synthetic RF2 release: a base release is imported, its delta is applied,
+# and the result is compared with a full import of the new release. Unlike regtest.py, it does not need the terminology databases.
+
+from __future__ import print_function
+
+import sys, os, os.path, io, json, shutil, sqlite3, subprocess, tempfile, unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, "..")
+
+IS_A = 116680003
+FSN  = 900000000000003001
+SYN  = 900000000000013009
+
+CONCEPT_HEADER      = u"id\teffectiveTime\tactive\tmoduleId\tdefinitionStatusId"
+DESCRIPTION_HEADER  = u"id\teffectiveTime\tactive\tmoduleId\tconceptId\tlanguageCode\ttypeId\tterm\tcaseSignificanceId"
+RELATIONSHIP_HEADER = u"id\teffectiveTime\tactive\tmoduleId\tsourceId\tdestinationId\trelationshipGroup\ttypeId\tcharacteristicTypeId\tmodifierId"
+REFSET_HEADER       = u"id\teffectiveTime\tactive\tmoduleId\trefsetId\treferencedComponentId"
+
+# Base release: code => term, and (id, source, destination) is-a relations
+TERMS = {
+  138875005 : u"SNOMED CT Concept",
+  404684003 : u"Clinical finding",
+  123037004 : u"Body structure",
+  1001      : u"Disorder of kidney",
+  1002      : u"Disorder of bladder",
+  1003      : u"Cystitis",
+  1004      : u"Kidney stone",
+  1005      : u"Acute cystitis",
+}
+ISAS = [(1, 404684003, 138875005), (2, 123037004, 138875005), (3, 1001, 404684003), (4, 1002, 404684003), (5, 1003, 1002), (6, 1004, 1001), (7, 1005, 1003)]
+REFSET = 723264001
+
+def concept_row(code, time, active = 1):
+  return u"%s\t%s\t%s\t900000000000207008\t900000000000074008" % (code, time, active)
+
+def description_rows(code, term, time):
+  return [u"%s\t%s\t1\t900000000000207008\t%s\ten\t%s\t%s (disorder)\t900000000000448009" % (code * 10 + 1, time, code, FSN, term),
+          u"%s\t%s\t1\t900000000000207008\t%s\ten\t%s\t%s\t900000000000448009"            % (code * 10 + 2, time, code, SYN, term)]
+
+def relationship_row(id, source, destination, time, active = 1):
+  return u"%s\t%s\t%s\t900000000000207008\t%s\t%s\t0\t%s\t900000000000011006\t900000000000451002" % (100 + id, time, active, source, destination, IS_A)
+
+def refset_row(id, code, time, active = 1):
+  return u"member-%s\t%s\t%s\t900000000000207008\t%s\t%s" % (id, time, active, REFSET, code)
+
+# Delta: adds an is-a relation (for a new concept), inactivates one, and moves one (Cystitis from Disorder of bladder to Disorder of kidney)
+# Descriptions and refset members are also changed.
+DELTA_TIME = "20150731"
+DELTA = {
+  "Concept"      : [concept_row(1006, DELTA_TIME)],
+  "Description"  : description_rows(1006, u"Bladder stone", DELTA_TIME) + [u"10022\t%s\t1\t900000000000207008\t1002\ten\t%s\tUrinary bladder disorder\t900000000000448009" % (DELTA_TIME, SYN)],
+  "Relationship" : [relationship_row(8, 1006, 1002, DELTA_TIME), # Added
+                    relationship_row(6, 1004, 1001, DELTA_TIME, 0), # Inactivated
+                    relationship_row(5, 1003, 1002, DELTA_TIME, 0), relationship_row(9, 1003, 1001, DELTA_TIME)], # Moved
+  "Refset"       : [refset_row(1, 1003, DELTA_TIME, 0), refset_row(2, 1006, DELTA_TIME)],
+}
+
+def write_file(filename, header, rows):
+  if not os.path.exists(os.path.dirname(filename)): os.makedirs(os.path.dirname(filename))
+  f = io.open(filename, "w", encoding = "utf8")
+  f.write(header + u"\n")
+  for row in rows: f.write(row + u"\n")
+  f.close()
+
+def write_release(directory, release, kind, rows):
+  terminology = os.path.join(directory, kind, "Terminology")
+  write_file(os.path.join(terminology, "sct2_Concept_%s_INT_%s.txt"           % (kind, release)), CONCEPT_HEADER,      rows["Concept"])
+  write_file(os.path.join(terminology, "sct2_Description_%s-en_INT_%s.txt"    % (kind, release)), DESCRIPTION_HEADER,  rows["Description"])
+  write_file(os.path.join(terminology, "sct2_TextDefinition_%s-en_INT_%s.txt" % (kind, release)), DESCRIPTION_HEADER,  [])
+  write_file(os.path.join(terminology, "sct2_Relationship_%s_INT_%s.txt"      % (kind, release)), RELATIONSHIP_HEADER, rows["Relationship"])
+  write_file(os.path.join(directory, kind, "Refset", "Content", "der2_Refset_Simple%s_INT_%s.txt" % (kind, release)), REFSET_HEADER, rows["Refset"])
+
+def merge(base, delta):
+  # Snapshot of the new release: the delta rows replace the base rows with the same id
+  rows = dict((row.split(u"\t")[0], row) for row in base)
+  for row in delta: rows[row.split(u"\t")[0]] = row
+  return sorted(rows.values())
+
+# Run in another process, since pymedtermino.snomedct uses a single database
+DUMP = """
+import sys, json
+from pymedtermino.snomedct import SNOMEDCT
+print(json.dumps({
+  "parents"     : dict((str(code), sorted(parent.code for parent in SNOMEDCT[code].parents))             for code in %s),
+  "descendants" : dict((str(code), sorted(concept.code for concept in SNOMEDCT[code].descendants_no_double())) for code in %s),
+  "search"      : dict((text, sorted(concept.code for concept in SNOMEDCT.search(text))) for text in ["bladder", "kidney", "stone", "cystitis"]),
+}))
+"""
+
+class TestUpdateSNOMEDCT(unittest.TestCase):
+  def setUp(self):
+    self.tmp = tempfile.mkdtemp()
+    for directory in ["scripts", "utils"]: os.makedirs(os.path.join(self.tmp, "build", directory))
+    for filename in ["import_snomedct.py", "update_snomedct.py"]: shutil.copy(os.path.join(ROOT, "scripts", filename), os.path.join(self.tmp, "build", "scripts"))
+    for filename in os.listdir(os.path.join(ROOT, "utils")):
+      if filename.endswith(".py"): shutil.copy(os.path.join(ROOT, "utils", filename), os.path.join(self.tmp, "build", "utils"))
+
+    base = {
+      "Concept"      : [concept_row(code, "20150131") for code in sorted(TERMS)],
+      "Description"  : [row for code in sorted(TERMS) for row in description_rows(code, TERMS[code], "20150131")],
+      "Relationship" : [relationship_row(id, source, destination, "20150131") for (id, source, destination) in ISAS],
+      "Refset"       : [refset_row(1, 1003, "20150131")],
+    }
+    self.base_dir = os.path.join(self.tmp, "SnomedCT_RF2Release_INT_20150131")
+    self.new_dir  = os.path.join(self.tmp, "SnomedCT_RF2Release_INT_%s" % DELTA_TIME)
+    write_release(self.base_dir, "20150131", "Snapshot", base)
+    write_release(self.new_dir,  DELTA_TIME, "Delta",    DELTA)
+    write_release(self.new_dir,  DELTA_TIME, "Snapshot", dict((table, merge(base[table], DELTA[table])) for table in base))
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp)
+
+  def run_script(self, *args):
+    subprocess.check_call([sys.executable] + list(args), stdout = subprocess.PIPE, stderr = subprocess.PIPE)
+
+  def import_release(self, directory, data_dir):
+    self.run_script(os.path.join(self.tmp, "build", "scripts", "import_snomedct.py"), directory, "")
+    os.makedirs(data_dir)
+    shutil.move(os.path.join(self.tmp, "build", "snomedct.sqlite3"), os.path.join(data_dir, "snomedct.sqlite3"))
+    return os.path.join(data_dir, "snomedct.sqlite3")
+
+  def dump(self, data_dir):
+    env = dict(os.environ)
+    env["PYMEDTERMINO_DATA_DIR"] = data_dir
+    env["PYMEDTERMINO_REMOVE_SUPPRESSED_RELATIONS"] = "1"
+    codes = sorted(set(TERMS) | set([1006]))
+    return json.loads(subprocess.check_output([sys.executable, "-c", DUMP % (codes, codes)], env = env).decode("utf8"))
+
+  def rows(self, filename, sql):
+    db = sqlite3.connect(filename)
+    try:     return sorted(db.execute(sql).fetchall())
+    finally: db.close()
+
+  def test_update(self):
+    updated = self.import_release(self.base_dir, os.path.join(self.tmp, "updated"))
+    self.run_script(os.path.join(self.tmp, "build", "scripts", "update_snomedct.py"), self.new_dir, updated)
+    full    = self.import_release(self.new_dir,  os.path.join(self.tmp, "full"))
+
+    for sql in ["SELECT * FROM IsaClosure", "SELECT id, active, term FROM Description", "SELECT * FROM Relationship", "SELECT * FROM RefsetMember",
+                "SELECT id, active, depth, descendant_count FROM Concept", "SELECT value FROM Metadata WHERE key='release'"]:
+      self.assertEqual(self.rows(updated, sql), self.rows(full, sql), sql)
+
+    updated, full = self.dump(os.path.dirname(updated)), self.dump(os.path.dirname(full))
+    self.assertEqual(updated, full)
+    self.assertEqual(updated["parents"]["1003"], [1001]) # Moved
+    self.assertEqual(updated["parents"]["1004"], [])     # Inactivated
+    self.assertEqual(updated["parents"]["1006"], [1002]) # Added
+    self.assertIn(1005, updated["descendants"]["1001"])
+    self.assertIn(1006, updated["search"]["bladder"])
+
+
+if __name__ == "__main__": unittest.main()
@@ -72,6 +72,7 @@ class UMLSBase(pymedtermino.Terminology):
     if not original_terminology_name: # Whole MetaThesaurus
       self._SEARCH_QUERY   = "SELECT DISTINCT " + umls_code_attr + " FROM MRCONSO WHERE STR LIKE %s"
       self._SUPPRESS_QUERY = "SELECT DISTINCT SUPPRESS FROM MRCONSO WHERE " + umls_code_attr + "=%s"
+      self._SUPPRESS_MANY_QUERY = "SELECT DISTINCT " + umls_code_attr + ", SUPPRESS FROM MRCONSO WHERE " + umls_code_attr + " IN (%s)"
       self._GET_STR_QUERY  = "SELECT STR FROM MRCONSO WHERE " + umls_code_attr + "=%s"
       self._PARENT_QUERY   = "SELECT DISTINCT " + umls_code_attr + "1 FROM MRREL WHERE " + umls_code_attr + "2='%s' AND REL='CHD'"
       self._CHILDREN_QUERY = "SELECT DISTINCT " + umls_code_attr + "1 FROM MRREL WHERE " + umls_code_attr + "2='%s' AND REL='PAR'"
@@ -93,8 +94,10 @@ class UMLSBase(pymedtermino.Terminology):
     else: # An extracted terminology
       if pymedtermino.REMOVE_SUPPRESSED_CONCEPTS:
         self._GET_UI_QUERY = "SELECT AUI FROM MRCONSO WHERE CODE=%s AND SAB='" + original_terminology_name + "' AND (SUPPRESS in ('', 'N'))"
+        self._GET_UI_MANY_QUERY = "SELECT CODE, AUI FROM MRCONSO WHERE CODE IN (%s) AND SAB='" + original_terminology_name + "' AND (SUPPRESS in ('', 'N'))"
       else:
         self._GET_UI_QUERY = "SELECT AUI FROM MRCONSO WHERE CODE=%s AND SAB='" + original_terminology_name + "'"
+        self._GET_UI_MANY_QUERY = "SELECT CODE, AUI FROM MRCONSO WHERE CODE IN (%s) AND SAB='" + original_terminology_name + "'"
       self._SEARCH_QUERY   = "SELECT DISTINCT AUI FROM MRCONSO WHERE SAB='" + original_terminology_name + "' AND STR LIKE %s"
       self._SUPPRESS_QUERY = "SELECT DISTINCT SUPPRESS FROM MRCONSO WHERE SAB='" + original_terminology_name + "' AND AUI=%s"
       self._GET_CODE_QUERY = "SELECT DISTINCT CODE FROM MRCONSO WHERE SAB='" + original_terminology_name + "' AND AUI=%s"
@@ -143,6 +146,23 @@ class UMLSBase(pymedtermino.Terminology):
     #return [self[code] for (code,) in db_cursor.fetchall()]
     return self._concepts_from_uis(db_cursor.fetchall())
   
+  def _load_many(self, codes):
+    if not self._original_terminology_name:
+      # No query is needed for loading a concept of the whole MetaThesaurus, except for checking suppression.
+      if not pymedtermino.REMOVE_SUPPRESSED_CONCEPTS: return pymedtermino.Terminology._load_many(self, codes)
+      suppresss = {}
+      for chunk in pymedtermino._chunks(codes):
+        db_cursor.execute(self._SUPPRESS_MANY_QUERY % pymedtermino._sql_params(len(chunk), "%s"), [str(code) for code in chunk])
+        for (code, suppress) in db_cursor.fetchall(): suppresss.setdefault(self.canonize_code(code), set()).add(suppress)
+      return dict((code, self.dict.get(code) or self.Concept(code, [code])) for (code, suppress) in suppresss.items() if ("N" in suppress) or ("" in suppress))
+    
+    else:
+      uis = {}
+      for chunk in pymedtermino._chunks(codes):
+        db_cursor.execute(self._GET_UI_MANY_QUERY % pymedtermino._sql_params(len(chunk), "%s"), [str(code) for code in chunk])
+        for (code, ui) in db_cursor.fetchall(): uis.setdefault(self.canonize_code(code), []).append(ui)
+      return dict((code, self.dict.get(code) or self.Concept(code, code_uis)) for (code, code_uis) in uis.items())
+    
 
 class UMLS_CUI(UMLSBase):
   def __init__(self): UMLSBase.__init__(self, "UMLS_CUI", "CUI", u"", 0)
@@ -242,8 +262,13 @@ class UMLSConcept(pymedtermino.CycleSafeMultiaxialConcept):
 
 Additional attributes are available for relations, and are listed in the :attr:`relations <pymedtermino.Concept.relations>` attribute.
 """
-  def __init__(self, code):
-    if not self.terminology._original_terminology_name:
+  def __init__(self, code, uis = None):
+    if uis is not None:
+      self._uis     = uis
+      if not self.terminology._original_terminology_name: self._sql_uis = "%s" % code.replace("'", "")
+      else: self._sql_uis = "(%s)" % (", ".join("'%s'" % ui.replace("'", "") for ui in self._uis))
+      
+    elif not self.terminology._original_terminology_name:
       if pymedtermino.REMOVE_SUPPRESSED_CONCEPTS:
         db_cursor.execute(self.terminology._SUPPRESS_QUERY, (str(code),))
         suppresss = set(i[0] for i in db_cursor.fetchall())
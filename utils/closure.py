@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# PyMedTermino
+# Copyright (C) 2012-2013 Jean-Baptiste LAMY
+# LIMICS (Laboratoire d'informatique médicale et d'ingénierie des connaissances en santé), UMR_S 1142
+# University Paris 13, Sorbonne paris-Cité, Bobigny, France
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys, math
+
+def build_transitive_closure(db_cursor, closure_table, edges, args = (), extra_values = (), restrict = None):
+  """Fills closure_table with the transitive closure of a graph.
+
+edges is a SQL SELECT query (with optional args) returning the (child, parent) edges of the graph; the graph may contain cycles.
+One (descendant, ancestor, distance, \\*extra_values) row is inserted in closure_table for each pair of connected nodes,
+distance being the length of the shortest path between them. A node is never stored as its own ancestor.
+
+If restrict (a SQL SELECT query returning nodes) is given, only the rows whose descendant is returned by restrict are computed,
+e.g. for updating the closure after some edges have changed (the previous rows of these descendants must have been deleted).
+
+The closure is computed set-at-a-time in SQL, one breadth-first level per query, so memory usage does not depend on the size of the graph.
+Returns the number of rows inserted."""
+  db_cursor.execute("CREATE TEMP TABLE _ClosureEdge (child, parent)")
+  db_cursor.execute("INSERT INTO _ClosureEdge %s" % edges, args)
+  db_cursor.execute("CREATE INDEX temp._ClosureEdge_child_index ON _ClosureEdge(child)")
+
+  db_cursor.execute("CREATE TEMP TABLE _Closure (descendant, ancestor, distance INTEGER, PRIMARY KEY (descendant, ancestor)) WITHOUT ROWID")
+  db_cursor.execute("CREATE TEMP TABLE _ClosureFrontier (descendant, ancestor)")
+  db_cursor.execute("CREATE TEMP TABLE _ClosureNext (descendant, ancestor)")
+
+  if restrict: db_cursor.execute("INSERT OR IGNORE INTO _Closure SELECT child, parent, 1 FROM _ClosureEdge WHERE (child != parent) AND (child IN (%s))" % restrict)
+  else:        db_cursor.execute("INSERT OR IGNORE INTO _Closure SELECT child, parent, 1 FROM _ClosureEdge WHERE child != parent")
+  db_cursor.execute("INSERT INTO _ClosureFrontier SELECT descendant, ancestor FROM _Closure")
+
+  distance = 1
+  while 1:
+    db_cursor.execute("""
+INSERT INTO _ClosureNext
+SELECT DISTINCT _ClosureFrontier.descendant, _ClosureEdge.parent FROM _ClosureFrontier, _ClosureEdge
+WHERE (_ClosureEdge.child = _ClosureFrontier.ancestor) AND (_ClosureEdge.parent != _ClosureFrontier.descendant)
+AND NOT EXISTS (SELECT 1 FROM _Closure WHERE (_Closure.descendant = _ClosureFrontier.descendant) AND (_Closure.ancestor = _ClosureEdge.parent))""")
+    if db_cursor.rowcount <= 0: break
+    distance += 1
+    db_cursor.execute("INSERT INTO _Closure SELECT descendant, ancestor, ? FROM _ClosureNext", (distance,))
+    db_cursor.execute("DELETE FROM _ClosureFrontier")
+    db_cursor.execute("INSERT INTO _ClosureFrontier SELECT descendant, ancestor FROM _ClosureNext")
+    db_cursor.execute("DELETE FROM _ClosureNext")
+
+  values = "".join(", ?" for i in extra_values)
+  db_cursor.execute("INSERT INTO %s SELECT descendant, ancestor, distance%s FROM _Closure" % (closure_table, values), tuple(extra_values))
+  nb = db_cursor.rowcount
+
+  for table in ["_ClosureEdge", "_Closure", "_ClosureFrontier", "_ClosureNext"]:
+    db_cursor.execute("DROP TABLE temp.%s" % table)
+  sys.stderr.write("%s rows in %s (max distance %s).\n" % (nb, closure_table, distance))
+  return nb
+
+def build_hierarchy_stats(db_cursor, table, key, closure_table = None, closure_condition = "", edges = None, args = (), concept_condition = "", depth = True, restrict = None):
+  """Adds and fills the depth, descendant_count and information_content columns of table (key being its code column), and indexes them.
+
+The hierarchy is read from closure_table (as built by :func:`build_transitive_closure`), restricted by the SQL closure_condition
+(e.g. "active=1"); or, if closure_table is None, from the edges SELECT query (with optional args), as in :func:`build_transitive_closure`.
+
+* depth is the length of the shortest is-a path from a root concept (0 for root concepts); it is not computed if depth is False
+  (e.g. if the table already has a depth column);
+* descendant_count is the number of descendants, counting only the concepts that match the SQL concept_condition on table, if given;
+* information_content is the intrinsic information content of Seco et al. (2004), i.e. 1 - log(descendant_count + 1) / log(N),
+  N being the number of concepts (matching concept_condition). It ranges from 0 (for the root) to 1 (for leaves).
+
+If the columns already exist, they are updated. If restrict (a SQL SELECT query returning codes) is given, depth and descendant_count are only
+updated for these codes, e.g. after applying a delta release (information_content is always updated, since N may have changed).
+"""
+  if closure_table is None:
+    closure_table = "temp._HierarchyClosure"
+    db_cursor.execute("CREATE TEMP TABLE _HierarchyClosure (descendant, ancestor, distance INTEGER, PRIMARY KEY (descendant, ancestor)) WITHOUT ROWID")
+    build_transitive_closure(db_cursor, closure_table, edges, args)
+    db_cursor.execute("CREATE INDEX temp._HierarchyClosure_ancestor_index ON _HierarchyClosure(ancestor)")
+  closure_where = (closure_condition and ("(%s) AND " % closure_condition)) or ""
+  concept_where = (concept_condition and (" WHERE %s" % concept_condition)) or ""
+
+  columns = ["descendant_count INTEGER", "information_content REAL"]
+  if depth: columns.insert(0, "depth INTEGER")
+  db_cursor.execute("PRAGMA table_info(%s)" % table)
+  existing_columns = set(column[1] for column in db_cursor.fetchall())
+  for column in columns:
+    if not column.split()[0] in existing_columns:
+      db_cursor.execute("ALTER TABLE %s ADD COLUMN %s" % (table, column))
+      restrict = None # New column => computed for all codes
+  if restrict:
+    restrict_where     = " WHERE %s IN (%s)" % (key, restrict)
+    restrict_ancestors = "(ancestor IN (%s)) AND " % restrict
+  else:
+    restrict_where = restrict_ancestors = ""
+
+  if depth:
+    db_cursor.execute("CREATE TEMP TABLE _HierarchyRoot (code PRIMARY KEY) WITHOUT ROWID")
+    db_cursor.execute("INSERT INTO _HierarchyRoot SELECT DISTINCT ancestor FROM %s WHERE %s ancestor NOT IN (SELECT descendant FROM %s WHERE %s 1)" % (closure_table, closure_where, closure_table, closure_where))
+    db_cursor.execute("UPDATE %s SET depth = COALESCE((SELECT MIN(distance) FROM %s WHERE %s (descendant = %s.%s) AND (ancestor IN _HierarchyRoot)), 0)%s" % (table, closure_table, closure_where, table, key, restrict_where))
+    db_cursor.execute("DROP TABLE temp._HierarchyRoot")
+
+  db_cursor.execute("CREATE TEMP TABLE _HierarchyCount (code PRIMARY KEY, nb INTEGER) WITHOUT ROWID")
+  db_cursor.execute("INSERT INTO _HierarchyCount SELECT ancestor, COUNT(*) FROM %s WHERE %s %s descendant IN (SELECT %s FROM %s%s) GROUP BY ancestor" % (closure_table, closure_where, restrict_ancestors, key, table, concept_where))
+  db_cursor.execute("UPDATE %s SET descendant_count = COALESCE((SELECT nb FROM _HierarchyCount WHERE code = %s.%s), 0)%s" % (table, table, key, restrict_where))
+  db_cursor.execute("DROP TABLE temp._HierarchyCount")
+
+  db_cursor.execute("SELECT COUNT(*) FROM %s%s" % (table, concept_where))
+  nb = db_cursor.fetchone()[0]
+  if nb > 1:
+    db_cursor.connection.create_function("_hierarchy_log", 1, math.log)
+    db_cursor.execute("UPDATE %s SET information_content = MAX(0.0, 1.0 - _hierarchy_log(descendant_count + 1) / ?)" % table, (math.log(nb),))
+  else:
+    db_cursor.execute("UPDATE %s SET information_content = 1.0" % table)
+
+  for column in columns:
+    column = column.split()[0]
+    db_cursor.execute("CREATE INDEX IF NOT EXISTS %s_%s_index ON %s(%s)" % (table, column, table, column))
+  if closure_table == "temp._HierarchyClosure": db_cursor.execute("DROP TABLE temp._HierarchyClosure")
@@ -17,7 +17,9 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import sys, os, os.path, stat, sqlite3
+import sys, os, os.path, stat, sqlite3, time, itertools
+
+BATCH_SIZE = 50000 # Number of rows inserted by each executemany() call in load_rows()
 
 def create_db(sql_filename, new_db = 1):
   if new_db:
@@ -30,6 +32,36 @@ def do_sql(db_cursor, sql, arg = ()):
   #print(sql)
   db_cursor.execute(sql, arg)
 
+def load_rows(db_cursor, sql, rows, label = None, batch_size = BATCH_SIZE):
+  """Inserts rows (an iterable of tuples, e.g. a generator reading a file line by line) with the parameterized sql query (e.g. "INSERT INTO T VALUES (?, ?)"),
+by batches of batch_size rows, so as the rows are never all in memory. The transaction is not committed.
+If label is given, the progress (number of rows and rows per second) is written on stderr. Returns the number of rows inserted."""
+  rows = iter(rows)
+  nb   = 0
+  t0   = time.time()
+  while 1:
+    batch = list(itertools.islice(rows, batch_size))
+    if not batch: break
+    db_cursor.executemany(sql, batch)
+    nb += len(batch)
+    if label: sys.stderr.write("\r  %s: %s rows, %.0f rows/s" % (label, nb, nb / max(time.time() - t0, 1e-6)))
+  if label: sys.stderr.write("\r  %s: %s rows, %.0f rows/s in %.1f s\n" % (label, nb, nb / max(time.time() - t0, 1e-6), time.time() - t0))
+  return nb
+
+def set_metadata(db_cursor, key, value):
+  """Sets the value of key in the Metadata table (e.g. the version of the terminology release), creating the table if needed."""
+  db_cursor.execute("CREATE TABLE IF NOT EXISTS Metadata (key TEXT PRIMARY KEY, value TEXT)")
+  db_cursor.execute("INSERT OR REPLACE INTO Metadata VALUES (?, ?)", (key, value))
+
+def get_metadata(db_cursor, key, default = None):
+  """Returns the value of key in the Metadata table, or default if absent (e.g. for databases built by older versions of PyMedTermino)."""
+  db_cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='Metadata'")
+  if not db_cursor.fetchone(): return default
+  db_cursor.execute("SELECT value FROM Metadata WHERE key=?", (key,))
+  row = db_cursor.fetchone()
+  if row: return row[0]
+  return default
+
 def close_db(db, sql_filename = u"", close = 1, set_readonly = 1):
   if close:
     db.commit()
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# PyMedTermino
+# Copyright (C) 2012-2013 Jean-Baptiste LAMY
+# LIMICS (Laboratoire d'informatique médicale et d'ingénierie des connaissances en santé), UMR_S 1142
+# University Paris 13, Sorbonne paris-Cité, Bobigny, France
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Full-text indexes (FTS5), shared by the import scripts and scripts/migrate_fts5.py.
+
+import sqlite3
+
+def is_fts5(db_cursor, fts_table):
+  """Returns True if fts_table exists and is a FTS5 index (databases built by older versions of PyMedTermino use FTS4)."""
+  db_cursor.execute("SELECT sql FROM sqlite_master WHERE name=?", (fts_table,))
+  row = db_cursor.fetchone()
+  return bool(row) and ("fts5" in row[0].lower())
+
+def build_fts_index(db_cursor, fts_table, rows = None, args = (), content = None, columns = ("code UNINDEXED", "term"), options = ""):
+  """Creates the FTS5 full-text index fts_table, dropping any previous (e.g. FTS4) version.
+
+If content is given, the index is an external content index on the "term" column of the content table (whose rows are identified by their "id" column).
+Otherwise, the index has the given columns (by default, (code, term)) and it is filled with the rows returned by the rows SQL SELECT query (with optional args);
+several rows may have the same code (e.g. one per language).
+options are additional FTS5 options (e.g. the tokenizer), starting with a comma."""
+  db_cursor.execute("DROP TABLE IF EXISTS %s" % fts_table)
+  if content:
+    db_cursor.execute("""CREATE VIRTUAL TABLE %s USING fts5(term, content="%s", content_rowid="id"%s)""" % (fts_table, content, options))
+    db_cursor.execute("INSERT INTO %s(%s) VALUES('rebuild')" % (fts_table, fts_table))
+  else:
+    db_cursor.execute("CREATE VIRTUAL TABLE %s USING fts5(%s%s)" % (fts_table, ", ".join(columns), options))
+    db_cursor.execute("INSERT INTO %s(%s) %s" % (fts_table, ", ".join(column.split()[0] for column in columns), rows), args)
+  db_cursor.execute("INSERT INTO %s(%s) VALUES('optimize')" % (fts_table, fts_table))
+
+def build_snomedct_fts(db_cursor):
+  build_fts_index(db_cursor, "Description_fts",    content = "Description")
+  build_fts_index(db_cursor, "TextDefinition_fts", content = "TextDefinition")
+
+def build_icd10_fts(db_cursor):
+  """Creates the ICD10 full-text index, with one row per concept (source = "term") and per text (source = the relation of the text, e.g. "inclusion"),
+and one column per language (texts are only in English). Accents are folded (e.g. "hepatite" matches "hépatite"),
+and the prefixes of 2 and 3 characters are indexed, for fast prefix queries (e.g. "hyp*")."""
+  rows = """
+SELECT code, 'term', term_en, term_fr FROM Concept
+UNION ALL SELECT code, relation, text_en, NULL FROM Text"""
+  columns = ("code UNINDEXED", "source UNINDEXED", "term_en", "term_fr")
+  try:
+    build_fts_index(db_cursor, "Concept_fts", rows, columns = columns, options = ', tokenize="unicode61 remove_diacritics 2", prefix="2 3"')
+  except sqlite3.OperationalError: # remove_diacritics 2 requires SQLite >= 3.27; 1 does not fold the accents of some (rare) characters
+    build_fts_index(db_cursor, "Concept_fts", rows, columns = columns, options = ', tokenize="unicode61 remove_diacritics 1", prefix="2 3"')
+
+def build_meddra_fts(db_cursor, langs):
+  build_fts_index(db_cursor, "Concept_fts", " UNION ALL ".join("SELECT code, term_%s FROM Concept" % lang for lang in langs))
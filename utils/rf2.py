@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+# PyMedTermino
+# Copyright (C) 2012-2013 Jean-Baptiste LAMY
+# LIMICS (Laboratoire d'informatique médicale et d'ingénierie des connaissances en santé), UMR_S 1142
+# University Paris 13, Sorbonne paris-Cité, Bobigny, France
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# SNOMED CT RF2 files and reference sets (refsets), shared by scripts/import_snomedct.py, scripts/import_snomedct_refsets.py and scripts/update_snomedct.py.
+#
+# The members of all refsets are stored in the RefsetMember table; map refsets (simple, complex and extended maps)
+# also store their map columns in the MapRefsetMember table. Refset files are read line by line, and not loaded in memory.
+
+import sys, os, os.path, io
+
+from utils.db import load_rows
+
+def _keep(s): return s
+
+def read_rf2_file(filename, types):
+  """Yields the rows of the given RF2 file (tab-separated, with a header line) as tuples, reading the file line by line.
+types is a list of functions (e.g. int) converting the value of each column; columns after the last type are dropped."""
+  converters = [type or _keep for type in types]
+  f = io.open(filename, encoding = "utf8")
+  try:
+    f.readline() # Header
+    for line in f:
+      line = line.rstrip(u"\r\n")
+      if line: yield tuple([convert(word) for (convert, word) in zip(converters, line.split(u"\t"))])
+  finally:
+    f.close()
+
+def _term(s): return s.replace(u'\x92', u"'")
+
+# (table, language dependent, column types) of the RF2 terminology files, in import order
+TERMINOLOGY_TABLES = [
+  ("Concept"       , False, [int, None, int, int, int]),
+  ("TextDefinition", True,  [int, None, int, int, int, None, int, _term, int]),
+  ("Description"   , True,  [int, None, int, int, int, None, int, _term, int]),
+  ("Relationship"  , False, [int, None, int, int, int, int, int, int, int]), # modifierId is unused yet
+]
+
+def terminology_file(directory, release_type, table, language_dependent, language, release):
+  """Returns the filename of the RF2 terminology file of the given table, e.g. Snapshot/Terminology/sct2_Concept_Snapshot_INT_20150131.txt."""
+  if language_dependent: return os.path.join(directory, release_type, "Terminology", "sct2_%s_%s-%s_INT_%s.txt" % (table, release_type, language, release))
+  else:                  return os.path.join(directory, release_type, "Terminology", "sct2_%s_%s_INT_%s.txt"    % (table, release_type, release))
+
+MEMBER_COLUMNS = ["id", "effectiveTime", "active", "moduleId", "refsetId", "referencedComponentId"] # Common to all RF2 refset files
+MAP_COLUMNS    = ["mapGroup", "mapPriority", "mapRule", "mapAdvice", "mapTarget", "correlationId", "mapCategoryId"]
+
+def create_refset_tables(db_cursor):
+  """Creates the RefsetMember and MapRefsetMember tables, if they do not exist yet."""
+  db_cursor.execute("""
+CREATE TABLE IF NOT EXISTS RefsetMember (
+  id TEXT PRIMARY KEY,
+  refsetId BIGINT,
+  referencedComponentId BIGINT,
+  active INTEGER
+) WITHOUT ROWID""")
+  db_cursor.execute("""
+CREATE TABLE IF NOT EXISTS MapRefsetMember (
+  id TEXT PRIMARY KEY,
+  refsetId BIGINT,
+  referencedComponentId BIGINT,
+  active INTEGER,
+  mapGroup INTEGER,
+  mapPriority INTEGER,
+  mapRule TEXT,
+  mapAdvice TEXT,
+  mapTarget TEXT,
+  correlationId BIGINT,
+  mapCategoryId BIGINT
+) WITHOUT ROWID""")
+
+def index_refset_tables(db_cursor):
+  """Creates the indexes of the RefsetMember and MapRefsetMember tables, if they do not exist yet."""
+  db_cursor.execute("CREATE INDEX IF NOT EXISTS RefsetMember_refsetId_index                 ON RefsetMember(refsetId, active, referencedComponentId)")
+  db_cursor.execute("CREATE INDEX IF NOT EXISTS RefsetMember_referencedComponentId_index    ON RefsetMember(referencedComponentId, active, refsetId)")
+  db_cursor.execute("CREATE INDEX IF NOT EXISTS MapRefsetMember_referencedComponentId_index ON MapRefsetMember(referencedComponentId, active, refsetId)")
+  db_cursor.execute("CREATE INDEX IF NOT EXISTS MapRefsetMember_mapTarget_index             ON MapRefsetMember(mapTarget, active, refsetId)")
+
+def refset_files(path, include_language = False, release_type = "Snapshot"):
+  """Returns the RF2 refset files of the given release type (e.g. der2_*Refset_*Snapshot*.txt) found in the given directory (recursively), or [path] if path is a file.
+Language refsets, whose members are descriptions, are skipped unless include_language is True."""
+  if os.path.isfile(path): return [path]
+  r = []
+  for dirpath, dirnames, filenames in os.walk(path):
+    for filename in filenames:
+      if filename.startswith("der2_") and ("Refset_" in filename) and (release_type in filename) and filename.endswith(".txt"):
+        if ("Language" in filename) and not include_language: continue
+        r.append(os.path.join(dirpath, filename))
+  r.sort()
+  return r
+
+def _read_header(f, filename):
+  header = f.readline().rstrip(u"\r\n").split(u"\t")
+  if header[:len(MEMBER_COLUMNS)] != MEMBER_COLUMNS: raise ValueError("%s is not a RF2 refset file!" % filename)
+  return header
+
+def _read_rows(filename, columns):
+  # Yields the values of the given columns (None for missing ones), for each line of the refset file.
+  f = io.open(filename, encoding = "utf8")
+  try:
+    header  = _read_header(f, filename)
+    indexes = []
+    for column in columns:
+      if column in header: indexes.append(header.index(column))
+      else:                indexes.append(len(header)) # Missing column => None
+    for line in f:
+      line = line.rstrip(u"\r\n")
+      if not line: continue
+      words = line.split(u"\t") + [None]
+      yield tuple([words[index] for index in indexes])
+  finally:
+    f.close()
+
+def import_refset_file(db_cursor, filename):
+  """Imports the members of the given RF2 refset file. Members already present (with the same id) are replaced,
+e.g. when importing a newer release. Returns the number of members imported."""
+  f = io.open(filename, encoding = "utf8")
+  try:     header = _read_header(f, filename)
+  finally: f.close()
+  
+  columns = ["id", "refsetId", "referencedComponentId", "active"]
+  nb = load_rows(db_cursor, "INSERT OR REPLACE INTO RefsetMember VALUES (?, ?, ?, ?)", _read_rows(filename, columns), "RefsetMember")
+  if "mapTarget" in header:
+    load_rows(db_cursor, "INSERT OR REPLACE INTO MapRefsetMember VALUES (%s)" % ", ".join(["?"] * (len(columns) + len(MAP_COLUMNS))), _read_rows(filename, columns + MAP_COLUMNS), "MapRefsetMember")
+  return nb
+
+def import_refsets(db_cursor, path, include_language = False, release_type = "Snapshot"):
+  """Imports all the RF2 refset files found in path (a directory, e.g. the Snapshot/Refset directory of a release, or a single file),
+creating the refset tables and their indexes if needed. release_type can be "Delta" for applying a delta release. Returns the number of members imported."""
+  create_refset_tables(db_cursor)
+  nb = 0
+  for filename in refset_files(path, include_language, release_type):
+    sys.stderr.write("Importing %s ...\n" % filename)
+    nb += import_refset_file(db_cursor, filename)
+  index_refset_tables(db_cursor)
+  return nb
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+# PyMedTermino
+# Copyright (C) 2012-2013 Jean-Baptiste LAMY
+# LIMICS (Laboratoire d'informatique médicale et d'ingénierie des connaissances en santé), UMR_S 1142
+# University Paris 13, Sorbonne paris-Cité, Bobigny, France
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Tables derived from the SNOMED CT relationships (closures, hierarchy statistics, index of the relations of clinical findings),
+# shared by scripts/import_snomedct.py and scripts/update_snomedct.py.
+#
+# All builders accept a restrict SQL SELECT query, returning the concepts whose rows are recomputed (the other rows are kept);
+# it is used when applying a delta release. restrict is typically a temporary table, filled before the derived tables are modified.
+#
+# As in IsaClosure, active=1 rows use only active relations, and active=0 rows use all relations (used when REMOVE_SUPPRESSED_RELATIONS is False).
+
+from utils.closure import *
+
+IS_A             = 116680003
+PART_OF          = 123005000
+CLINICAL_FINDING = 404684003
+
+def _create_closure_table(db_cursor, table, restrict):
+  db_cursor.execute("""
+CREATE TABLE IF NOT EXISTS %s (
+  descendant BIGINT,
+  ancestor BIGINT,
+  distance INTEGER,
+  active INTEGER,
+  PRIMARY KEY (active, descendant, ancestor)
+) WITHOUT ROWID""" % table)
+  if restrict: db_cursor.execute("DELETE FROM %s WHERE (active IN (0, 1)) AND (descendant IN (%s))" % (table, restrict))
+
+def build_isa_closure(db_cursor, restrict = None):
+  """Computes the IsaClosure table (transitive closure of the is-a relations)."""
+  _create_closure_table(db_cursor, "IsaClosure", restrict)
+  build_transitive_closure(db_cursor, "IsaClosure", "SELECT sourceId, destinationId FROM Relationship WHERE typeId=%s AND active=1" % IS_A, extra_values = (1,), restrict = restrict)
+  build_transitive_closure(db_cursor, "IsaClosure", "SELECT sourceId, destinationId FROM Relationship WHERE typeId=%s"              % IS_A, extra_values = (0,), restrict = restrict)
+  db_cursor.execute("CREATE INDEX IF NOT EXISTS IsaClosure_ancestor_index ON IsaClosure(active, ancestor, distance)")
+
+def build_part_of_closure(db_cursor, restrict = None):
+  """Computes the PartOfClosure table (transitive closure of the part-of relations only)."""
+  _create_closure_table(db_cursor, "PartOfClosure", restrict)
+  build_transitive_closure(db_cursor, "PartOfClosure", "SELECT sourceId, destinationId FROM Relationship WHERE typeId=%s AND active=1" % PART_OF, extra_values = (1,), restrict = restrict)
+  build_transitive_closure(db_cursor, "PartOfClosure", "SELECT sourceId, destinationId FROM Relationship WHERE typeId=%s"              % PART_OF, extra_values = (0,), restrict = restrict)
+  db_cursor.execute("CREATE INDEX IF NOT EXISTS PartOfClosure_ancestor_index ON PartOfClosure(active, ancestor, distance)")
+
+def build_part_or_isa_closure(db_cursor, restrict = None):
+  """Computes the PartOrIsaClosure table (closure of the part-of and is-a relations together, as followed by is_part_of()); IsaClosure must be up to date.
+Only the concepts involved in part-of relations, and their is-a ancestors and descendants, are considered (the other concepts have no part-of / is-a paths
+that are not pure is-a paths). The pairs already in IsaClosure are not stored again."""
+  _create_closure_table(db_cursor, "PartOrIsaClosure", restrict)
+  for active, condition in [(1, " AND active=1"), (0, "")]:
+    db_cursor.execute("CREATE TEMP TABLE _PartOfNode (id PRIMARY KEY) WITHOUT ROWID")
+    db_cursor.execute("INSERT OR IGNORE INTO _PartOfNode SELECT sourceId FROM Relationship WHERE typeId=%s%s UNION SELECT destinationId FROM Relationship WHERE typeId=%s%s" % (PART_OF, condition, PART_OF, condition))
+    db_cursor.execute("INSERT OR IGNORE INTO _PartOfNode SELECT descendant FROM IsaClosure WHERE active=%s AND ancestor IN (SELECT id FROM _PartOfNode) UNION SELECT ancestor FROM IsaClosure WHERE active=%s AND descendant IN (SELECT id FROM _PartOfNode)" % (active, active))
+    db_cursor.execute("CREATE TEMP TABLE _PartOrIsa (descendant, ancestor, distance)")
+    build_transitive_closure(db_cursor, "temp._PartOrIsa", """
+SELECT sourceId, destinationId FROM Relationship WHERE typeId=%s%s
+UNION
+SELECT sourceId, destinationId FROM Relationship WHERE typeId=%s%s AND sourceId IN (SELECT id FROM _PartOfNode)""" % (PART_OF, condition, IS_A, condition), restrict = restrict)
+    db_cursor.execute("INSERT INTO PartOrIsaClosure SELECT descendant, ancestor, distance, %s FROM _PartOrIsa WHERE NOT EXISTS (SELECT 1 FROM IsaClosure WHERE IsaClosure.active=%s AND IsaClosure.descendant=_PartOrIsa.descendant AND IsaClosure.ancestor=_PartOrIsa.ancestor)" % (active, active))
+    db_cursor.execute("DROP TABLE temp._PartOrIsa")
+    db_cursor.execute("DROP TABLE temp._PartOfNode")
+
+def build_concept_stats(db_cursor, restrict = None):
+  """Computes the depth, descendant_count and information_content columns of the Concept table (see :func:`utils.closure.build_hierarchy_stats`); IsaClosure must be up to date."""
+  build_hierarchy_stats(db_cursor, "Concept", "id", "IsaClosure", "active=1", concept_condition = "active=1", restrict = restrict)
+
+def build_finding_relationship(db_cursor, restrict = None):
+  """Computes the FindingRelationship table, a (destination, relation type) => source index of the relations whose source is a clinical finding,
+for associated_clinical_findings(); IsaClosure must be up to date. Here, restrict returns the sources whose rows are recomputed."""
+  db_cursor.execute("""
+CREATE TABLE IF NOT EXISTS FindingRelationship (
+  destinationId BIGINT,
+  typeId BIGINT,
+  sourceId BIGINT,
+  active INTEGER,
+  PRIMARY KEY (active, destinationId, typeId, sourceId)
+) WITHOUT ROWID""")
+  if restrict:
+    db_cursor.execute("DELETE FROM FindingRelationship WHERE sourceId IN (%s)" % restrict)
+    restrict = " AND (sourceId IN (%s))" % restrict
+  else:
+    restrict = ""
+  for active, condition in [(1, "(active = 1) AND "), (0, "")]:
+    db_cursor.execute("INSERT OR IGNORE INTO FindingRelationship SELECT destinationId, typeId, sourceId, %s FROM Relationship WHERE %s(typeId != %s) AND (sourceId IN (SELECT %s UNION SELECT descendant FROM IsaClosure WHERE (active = %s) AND (ancestor = %s)))%s" % (
+      active, condition, IS_A, CLINICAL_FINDING, active, CLINICAL_FINDING, restrict))
@@ -62,21 +62,48 @@ class _BaseVCMTerminology(pymedtermino.Terminology):
   
   def search(self, text):
     self.db_cursor.execute("SELECT DISTINCT code FROM Concept WHERE term LIKE ?", ("%%%s%%" % text,))
-    r1 = self.db_cursor.fetchall()
-    r = [self[code] for (code,) in r1]
+    codes    = [code for (code,) in self.db_cursor.fetchall()]
+    concepts = self.get_many(codes)
+    r        = [concepts[code] for code in codes if code in concepts]
     root = self.first_levels()[0]
     return [concept for concept in r if concept.is_a(root)]
   
+  def _prefetch(self, concepts, attr):
+    codes = [concept.code for concept in concepts]
+    if   attr == "parents":
+      self._set_prefetched(concepts, attr, pymedtermino._fetch_grouped(self.db_cursor, "SELECT source, destination FROM Relation WHERE source IN (%s) AND relation='is_a'", codes, distinct = 0))
+    elif attr == "children":
+      self._set_prefetched(concepts, attr, pymedtermino._fetch_grouped(self.db_cursor, "SELECT destination, source FROM Relation WHERE destination IN (%s) AND relation='is_a'", codes, distinct = 0))
+    elif attr.startswith(u"INVERSE_"):
+      related = pymedtermino._fetch_grouped(self.db_cursor, "SELECT destination, source FROM Relation WHERE destination IN (%s) AND relation=?", codes, (attr[8:],))
+      # Concepts without such a relation are left untouched, since the attribute does not exist for them.
+      self._set_prefetched([concept for concept in concepts if concept.code in related], attr, related)
+    elif not (attr.startswith("_") or (attr in ("relations", "terms")) or hasattr(self.Concept, attr)):
+      related = pymedtermino._fetch_grouped(self.db_cursor, "SELECT source, destination FROM Relation WHERE source IN (%s) AND relation=?", codes, (attr,))
+      self._set_prefetched([concept for concept in concepts if concept.code in related], attr, related)
+    else:
+      pymedtermino.Terminology._prefetch(self, concepts, attr)
+      
+  def _load_many(self, codes):
+    terms = {}
+    for chunk in pymedtermino._chunks(codes):
+      self.db_cursor.execute("SELECT code, lang, term FROM Concept WHERE code IN (%s)" % pymedtermino._sql_params(len(chunk)), chunk)
+      for (code, lang, term) in self.db_cursor.fetchall():
+        if (lang == pymedtermino.LANGUAGE) or (not code in terms): terms[code] = term
+    return dict((code, self.dict.get(code) or self.Concept(code, term)) for (code, term) in terms.items())
+  
   
 class _BaseVCMConcept(pymedtermino.MultiaxialConcept, pymedtermino._IntCodeConcept):
-  def __init__(self, code):
-    self.db_cursor.execute("SELECT term FROM Concept WHERE lang=? AND code=?", (pymedtermino.LANGUAGE, code))
-    r = self.db_cursor.fetchone()
-    if not r:
-      self.db_cursor.execute("SELECT term FROM Concept WHERE code=?", (code,))
+  def __init__(self, code, term = None):
+    if term is None:
+      self.db_cursor.execute("SELECT term FROM Concept WHERE lang=? AND code=?", (pymedtermino.LANGUAGE, code))
       r = self.db_cursor.fetchone()
-      if not r: raise ValueError()
-    pymedtermino.MultiaxialConcept.__init__(self, code, r[0])
+      if not r:
+        self.db_cursor.execute("SELECT term FROM Concept WHERE code=?", (code,))
+        r = self.db_cursor.fetchone()
+        if not r: raise ValueError()
+      term = r[0]
+    pymedtermino.MultiaxialConcept.__init__(self, code, term)
     
   def __getattr__(self, attr):
     if   attr == "parents":
@@ -176,6 +203,10 @@ class VCM_LEXICON(_BaseVCMTerminology):
     
   def _create_Concept(self): return VCMLexiconConcept
   def first_levels(self): return [self[490]]
+  
+  # Lexicon elements have a specific constructor and attributes, which are not suitable for batch loading.
+  def _load_many(self, codes): return pymedtermino.Terminology._load_many(self, codes)
+  def _prefetch(self, concepts, attr): return pymedtermino.Terminology._prefetch(self, concepts, attr)
 
   
 class VCMLexiconConcept(_BaseVCMConcept):
@@ -546,6 +577,7 @@ class VCMIcon(pymedtermino.MultiaxialConcept, pymedtermino._StringCodeConcept):
    The priority of this icon (for sorting purpose).
 
 """
+  _is_a_by_ancestors = False
   relations = ["central_color", "modifiers", "central_pictogram", "top_right_color", "top_right_pictogram", "second_top_right_pictogram", "shadow", "physio", "patho", "etiology", "quantitative", "process", "transverse"]
   @staticmethod
   def canonize_code(code):
@@ -864,11 +896,11 @@ class VCMLexiconIndex(object):
     if isinstance(db_filename, str):
       if not os.path.isfile(db_filename):
         raise IOError('File not found: %s' % db_filename)
-      self.db                 = sql_module.connect(db_filename)
+      self.db                 = pymedtermino.SQLiteDatabase(db_filename)
       self.db_cursor          = self.db.cursor()
     else:
       self.db_cursor          = db_filename
-    self.db_cursor.execute("PRAGMA query_only = TRUE;")
+      self.db_cursor.execute("PRAGMA query_only = TRUE;")
     
   def _get_concept_by_lex(self, lex):
     self.db_cursor.execute(u"SELECT code FROM VCMLexiconIndex WHERE lex=?", (lex.code,))